@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -21,6 +21,91 @@ class Settings(BaseSettings):
     # Rate limiting
     free_daily_limit: int = 20
     premium_daily_limit: int = 1000
+    free_burst_limit: int = 10  # messages per burst window; 0 disables
+    premium_burst_limit: int = 30
+    burst_window: float = 60.0  # seconds
+    burst_algorithm: str = "sliding_window"  # or "token_bucket"
+    redis_url: str = ""  # Optional: shared quota counters across workers
+    redis_pool_size: int = 50  # pooled connections per worker
+    redis_timeout: float = 1.0  # seconds per command, and to wait for a free connection
+    usage_buffer_enabled: bool = False  # Coalesce usage writes in memory (per-process quota)
+    usage_flush_interval: float = 1.0  # seconds between usage buffer flushes
+    usage_shards: int = 0  # >0: write usage to N per-day shard docs instead of the user doc
+    
+    # Document cache (users/{uid}, chat metadata): L1 in-process, L2 Redis at redis_url
+    doc_cache_enabled: Optional[bool] = None  # default: on when redis_url is set
+    doc_cache_size: int = 10000  # documents per worker (L1)
+    doc_cache_local_ttl: float = 30.0  # seconds; bounds staleness if an invalidation is missed
+    doc_cache_shared_ttl: float = 3600.0  # seconds in Redis
+    doc_cache_user_ttl: float = 300.0  # seconds in Redis for user docs; bounds staleness of writes made outside the app
+    doc_cache_negative_ttl: float = 5.0  # seconds a missing document is remembered (0 disables)
+    
+    # Conversation context
+    context_messages: int = 10  # newest messages fetched for prompt context
+    context_cache_chats: int = 5000
+    context_cache_ttl: float = 600  # seconds
+    summary_token_threshold: int = 1500  # fold older turns into the summary past this
+    summary_keep_recent: int = 4  # messages kept verbatim after a fold
+    free_input_token_budget: int = 2000  # max estimated prompt tokens per request
+    premium_input_token_budget: int = 4000
+    prompt_cache_enabled: bool = False  # reference tone system prompts from Gemini context caches
+    prompt_cache_ttl: int = 3600  # seconds
+    prompt_cache_refresh_margin: int = 300  # extend caches this long before they expire
+    
+    # Gemini model routing
+    gemini_routes_file: str = ""  # JSON rules table; empty uses the built-in routes
+    
+    # Gemini admission control
+    gemini_max_concurrency: int = 16  # concurrent outbound Gemini calls per process
+    gemini_queue_size: int = 200  # waiting calls beyond this are shed with a 503
+    gemini_queue_timeout: float = 15.0  # seconds a call may wait for a slot
+    
+    # Gemini resilience
+    gemini_retry_attempts: int = 3  # attempts per call on 429/5xx/timeouts
+    gemini_retry_base_delay: float = 0.25  # seconds; full-jitter exponential backoff
+    gemini_deadline: float = 30.0  # overall seconds per call, retries included
+    gemini_hedge_enabled: bool = False  # race a second request once a call passes the recent p95
+    gemini_breaker_threshold: int = 5  # consecutive failures before failing fast
+    gemini_breaker_reset: float = 30.0  # seconds before probing upstream again
+    
+    # Duplicate requests (Idempotency-Key header, retries, double-taps)
+    response_cache_size: int = 10000
+    response_cache_ttl: float = 60  # seconds a result is replayed for its idempotency key
+    
+    # Message persistence (write-behind queue)
+    write_batch_size: int = 400
+    write_flush_interval: float = 0.5  # seconds
+    write_queue_max_depth: int = 10000
+    write_queue_full_timeout: float = 5.0  # seconds a write waits for room before it is rejected
+    
+    # WebSocket chat (/chat/ws)
+    ws_auth_timeout: float = 10.0  # seconds to send credentials after connecting
+    ws_heartbeat_interval: float = 30.0  # seconds of silence before the server pings
+    ws_idle_timeout: float = 300.0  # close sockets with no client frames and nothing streaming
+    ws_max_inflight: int = 4  # concurrent replies per socket (across its chats)
+    ws_user_refresh: float = 300.0  # seconds before the cached user doc (tier, usage) is re-read
+    
+    # Transcript export (/chat/export)
+    export_page_size: int = 200  # Firestore documents read per query
+    export_chunk_bytes: int = 65536  # NDJSON buffered before each write to the client
+    
+    # Metrics
+    trace_sample_rate: float = 0.01  # fraction of requests whose stage trace is kept
+    trace_buffer_size: int = 100  # sampled traces served at /metrics/traces
+    
+    # Logging
+    log_level: str = "INFO"
+    log_queue_size: int = 10000  # records buffered for the writer thread; extra records are dropped
+    log_dedup_burst: int = 5  # identical warnings/errors let through per window
+    log_dedup_window: float = 60.0  # seconds
+    
+    # Startup
+    warmup_retry_delay: float = 5.0  # seconds between attempts at a failed warm-up step; /ready is 503 until done
+    gc_freeze_after_warmup: bool = True  # exclude startup objects from full GC collections
+    
+    # Auth
+    token_cache_size: int = 10000
+    cert_refresh_interval: int = 1800  # seconds between signing cert prefetches
     
     class Config:
         env_file = ".env"
@@ -1,12 +1,69 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.routers import auth, chat, usage
+from app.middleware.rate_limiter import rate_limiter
+from app.middleware.request_context import RequestContextMiddleware
+from app.middleware.timing import TimingMiddleware
+from app.services.firebase_service import ChatUnavailable, firebase_service
+from app.services.openai_service import openai_service
+from app.services.model_scheduler import ModelOverloaded
+from app.services.metrics import metrics
+from app.services.logger import log_pipeline
+from app.services.context_cache import context_cache
+from app.services.prompt_builder import prompt_builder
+from app.services.response_cache import response_cache
+from app.services.usage_buffer import usage_buffer
+from app.services.write_queue import write_queue
+from app.services.redis_client import close_redis
+from app.services.warmup import WarmUp
 from app.config import settings
 
+
+# Connections and SDKs are set up before the worker reports ready, not on a user's request
+startup = WarmUp(retry_delay=settings.warmup_retry_delay, freeze_gc=settings.gc_freeze_after_warmup)
+startup.add("firebase", firebase_service.warm_up)
+startup.add("gemini", openai_service.warm_up)
+startup.add("signing_certs", firebase_service.prefetch_signing_certs, required=False)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the warm-up and background tasks on startup and stop them on shutdown"""
+    # JSON logs on stdout, written by a background thread
+    log_pipeline.start()
+    # Flush loops are stopped, not cancelled, so no write is cut off half-way
+    flushers = [
+        asyncio.create_task(usage_buffer.run(settings.usage_flush_interval)),
+        asyncio.create_task(write_queue.run()),
+    ]
+    tasks = [
+        asyncio.create_task(startup.run()),
+        asyncio.create_task(firebase_service.run_cert_refresher(settings.cert_refresh_interval)),
+    ]
+    if firebase_service.user_cache:
+        tasks.append(asyncio.create_task(firebase_service.run_cache_invalidation()))
+    if openai_service.prompt_cache:
+        tasks.append(asyncio.create_task(openai_service.prompt_cache.run(settings.prompt_cache_refresh_margin / 2)))
+    yield
+    usage_buffer.stop()
+    write_queue.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, *flushers, return_exceptions=True)
+    # Write out anything still buffered in memory
+    await asyncio.gather(usage_buffer.flush(), write_queue.drain())
+    await close_redis()
+    log_pipeline.stop()
+
+
 app = FastAPI(
     title="ChatMate API",
     description="Backend API for ChatMate AI Companion",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -18,6 +75,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ModelOverloaded)
+async def model_overloaded_handler(request: Request, exc: ModelOverloaded):
+    """Shed load with a retryable 503 instead of queueing without bound"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The assistant is busy right now. Please try again shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(ChatUnavailable)
+async def chat_unavailable_handler(request: Request, exc: ChatUnavailable):
+    """The chat's owner could not be checked; let the client retry rather than fail or guess"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Chats are unavailable right now. Please try again shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# Per-stage timing, Server-Timing header and request histograms
+app.add_middleware(TimingMiddleware)
+
+# Request ID for log records (outermost, so everything below logs with it)
+app.add_middleware(RequestContextMiddleware)
+
+# Counters the services keep, exported next to the histograms at /metrics
+metrics.register("startup", startup.stats)
+metrics.register("token_cache", firebase_service.token_cache.stats)
+if firebase_service.user_cache:
+    metrics.register("user_cache", firebase_service.user_cache.stats)
+    metrics.register("chat_cache", firebase_service.chat_cache.stats)
+metrics.register("rate_limiter", rate_limiter.stats)
+metrics.register("usage_buffer", usage_buffer.stats)
+metrics.register("write_queue", write_queue.stats)
+metrics.register("context_cache", context_cache.stats)
+metrics.register("response_cache", response_cache.stats)
+metrics.register("logging", log_pipeline.stats)
+metrics.register("websocket", chat.ChatSocket.stats)
+metrics.register("prompt_builder", prompt_builder.stats)
+metrics.register("model_scheduler", openai_service.scheduler.stats)
+metrics.register("model_resilience", openai_service.resilience.stats)
+metrics.register("model_routes", openai_service.router.stats)
+if openai_service.prompt_cache:
+    metrics.register("prompt_cache", openai_service.prompt_cache.stats)
+
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
@@ -26,10 +130,28 @@ app.include_router(usage.router, prefix="/usage", tags=["Usage"])
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness probe: the process is up (see /ready for readiness)"""
     return {"status": "healthy", "version": "1.0.0"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    return JSONResponse(startup.report(), status_code=200 if startup.ready else 503)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/traces", include_in_schema=False)
+async def sampled_traces():
+    """Most recent sampled request traces (stage offsets and durations)"""
+    return {"sample_rate": metrics.trace_sample_rate, "traces": list(metrics.traces)}
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -37,4 +159,5 @@ async def root():
         "message": "Welcome to ChatMate API",
         "docs": "/docs",
         "health": "/health",
+        "ready": "/ready",
     }
@@ -1,80 +1,478 @@
 from fastapi import HTTPException, status
-from app.services.firebase_service import firebase_service
+from typing import Dict, List, Optional
+import math
+import time
+from app.services.firebase_service import UsageContention, firebase_service, daily_usage, usage_date
+from app.services.usage_buffer import UsageBuffer, usage_buffer, buffering_enabled, record_usage
+from app.middleware.user_context import UserContext
+from app.services.metrics import stage
+from app.services.logger import get_logger, log_fields
+from app.services.redis_client import get_redis
 from app.config import settings
 
 
-async def check_rate_limit(user_id: str) -> bool:
+logger = get_logger("rate_limiter")
+
+
+def _limit_exceeded(limit: int, usage: int, is_premium: bool) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={
+            "error": "rate_limit_exceeded",
+            "message": f"Daily message limit ({limit}) reached. {'Upgrade to premium for more messages!' if not is_premium else 'Please try again tomorrow.'}",
+            "limit": limit,
+            "usage": usage,
+            "is_premium": is_premium,
+        }
+    )
+
+
+def _daily_limit(ctx: UserContext) -> int:
+    return settings.premium_daily_limit if ctx.is_premium else settings.free_daily_limit
+
+
+async def check_rate_limit(ctx: UserContext) -> bool:
     """
     Check if user has exceeded their daily message limit.
     Raises HTTPException if limit exceeded.
     """
-    user_data = await firebase_service.get_user(user_id)
+    user_data = await ctx.load()
     
     if not user_data:
         # New user, allow the request
         return True
     
-    is_premium = user_data.get("isPremium", False)
-    daily_usage = user_data.get("dailyUsage", 0)
+    is_premium = ctx.is_premium
+    daily_usage = ctx.daily_usage
     
     # Get limit based on user type
-    limit = settings.premium_daily_limit if is_premium else settings.free_daily_limit
+    limit = _daily_limit(ctx)
     
     if daily_usage >= limit:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail={
-                "error": "rate_limit_exceeded",
-                "message": f"Daily message limit ({limit}) reached. {'Upgrade to premium for more messages!' if not is_premium else 'Please try again tomorrow.'}",
-                "limit": limit,
-                "usage": daily_usage,
-                "is_premium": is_premium,
-            }
-        )
+        raise _limit_exceeded(limit, daily_usage, is_premium)
     
     return True
 
 
+class BurstLimitExceeded(Exception):
+    """Raised by reserve() when a user sends faster than their burst limit allows"""
+    
+    def __init__(self, limit: int, retry_after: float):
+        super().__init__(f"Burst limit ({limit}) exceeded")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def _burst_exceeded(exc: BurstLimitExceeded, is_premium: bool) -> HTTPException:
+    retry_after = max(1, math.ceil(exc.retry_after))
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={
+            "error": "burst_limit_exceeded",
+            "message": f"You're sending messages too quickly. Please wait {retry_after}s.",
+            "limit": exc.limit,
+            "retry_after": retry_after,
+            "is_premium": is_premium,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+# Seconds a request refused for Firestore contention is asked to wait
+CONTENTION_RETRY_AFTER = 1.0
+
+
+def _usage_contended(is_premium: bool) -> HTTPException:
+    retry_after = math.ceil(CONTENTION_RETRY_AFTER)
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={
+            "error": "usage_contended",
+            "message": f"Too many messages at once. Please wait {retry_after}s.",
+            "retry_after": retry_after,
+            "is_premium": is_premium,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def _burst_limit(ctx: UserContext) -> int:
+    return settings.premium_burst_limit if ctx.is_premium else settings.free_burst_limit
+
+
+# Burst check and daily reservation in one round-trip. Nothing is taken unless
+# both pass. KEYS[1]=daily counter, KEYS[2]=burst state (this window's counter
+# or the token bucket), KEYS[3]=previous window's counter (sliding window).
+# ARGV: daily limit, daily TTL (s), burst limit (0: none), window (ms), now (ms),
+# algorithm. Returns {status, daily count, retry after (ms)} where status is
+# 1 reserved, 0 daily limit reached, -1 burst limit reached.
+_RESERVE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current >= tonumber(ARGV[1]) then
+    return {0, current, 0}
+end
+
+local burst = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local now = tonumber(ARGV[5])
+local tokens
+if burst > 0 then
+    if ARGV[6] == 'token_bucket' then
+        local state = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+        tokens = tonumber(state[1]) or burst
+        tokens = math.min(burst, tokens + (now - (tonumber(state[2]) or now)) * burst / window)
+        if tokens < 1 then
+            return {-1, current, math.ceil((1 - tokens) * window / burst)}
+        end
+    else
+        local elapsed = now % window
+        local count = tonumber(redis.call('GET', KEYS[2]) or '0')
+        local previous = tonumber(redis.call('GET', KEYS[3]) or '0')
+        if previous * (window - elapsed) / window + count + 1 > burst then
+            local retry = window - elapsed
+            if count < burst and previous > 0 then
+                retry = math.ceil(window * (1 - (burst - 1 - count) / previous)) - elapsed
+            end
+            return {-1, current, math.max(retry, 1)}
+        end
+    end
+end
+
+current = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if burst > 0 then
+    if tokens then
+        redis.call('HSET', KEYS[2], 'tokens', tokens - 1, 'ts', now)
+        redis.call('PEXPIRE', KEYS[2], window)
+    else
+        redis.call('INCR', KEYS[2])
+        redis.call('PEXPIRE', KEYS[2], window * 2)
+    end
+end
+return {1, current, 0}
+"""
+
+# Refund a slot without going below zero
+_RELEASE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current > 0 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+
+class BurstLimiter:
+    """
+    Per-user burst limit for the backends without Redis, using the same
+    algorithms as _RESERVE_SCRIPT. State is per process, so with several
+    workers each enforces the limit on the requests it sees.
+    
+    sliding_window: counts in the current and previous fixed windows, the
+    previous one weighted by how much of it still overlaps the sliding window.
+    token_bucket: `limit` tokens refilled evenly over the window.
+    """
+    
+    def __init__(self, window: float = 60.0, algorithm: str = "sliding_window"):
+        self.window = window
+        self.algorithm = algorithm
+        self._state: Dict[str, list] = {}
+        self._last_sweep = 0.0
+    
+    def take(self, user_id: str, limit: int, now: float = None) -> float:
+        """Take a slot; returns 0 when allowed, otherwise seconds until one frees up"""
+        now = time.time() if now is None else now
+        self._sweep(now)
+        if self.algorithm == "token_bucket":
+            tokens, updated = self._state.get(user_id, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * limit / self.window)
+            if tokens < 1:
+                return (1 - tokens) * self.window / limit
+            self._state[user_id] = [tokens - 1, now]
+            return 0
+        
+        index, elapsed = divmod(now, self.window)
+        state = self._state.get(user_id)
+        if state is None or state[0] < index - 1:
+            state = [index, 0, 0]  # window index, count, previous window's count
+        elif state[0] == index - 1:
+            state = [index, 0, state[1]]
+        count, previous = state[1], state[2]
+        if previous * (self.window - elapsed) / self.window + count + 1 > limit:
+            if count < limit and previous > 0:
+                return max(self.window * (1 - (limit - 1 - count) / previous) - elapsed, 0.001)
+            return self.window - elapsed
+        state[1] += 1
+        self._state[user_id] = state
+        return 0
+    
+    def refund(self, user_id: str):
+        """Give back the last slot taken (the daily quota rejected the request)"""
+        state = self._state.get(user_id)
+        if state is None:
+            return
+        if self.algorithm == "token_bucket":
+            state[0] += 1
+        else:
+            state[1] = max(0, state[1] - 1)
+    
+    def _sweep(self, now: float):
+        # Users idle for two windows have no state worth keeping
+        if now - self._last_sweep < self.window:
+            return
+        self._last_sweep = now
+        stale = now - 2 * self.window
+        if self.algorithm == "token_bucket":
+            self._state = {k: v for k, v in self._state.items() if v[1] > stale}
+        else:
+            self._state = {k: v for k, v in self._state.items() if v[0] * self.window > stale}
+
+
 class RateLimitMiddleware:
     """
-    Alternative middleware implementation for rate limiting.
-    Can be used with Redis for distributed rate limiting.
+    Daily quota and per-minute burst limits, with pluggable backends.
+    
+    reserve()/release() form an atomic quota engine: a slot is taken before
+    generation and refunded if it fails, so concurrent requests can never
+    push a user past their limit. Backends, in order of preference: Redis
+    (one Lua round-trip on a pooled redis.asyncio client, shared across
+    workers), an in-memory store (local fake for tests and single-process
+    dev), the write-behind UsageBuffer (atomic per process; avoids
+    per-message writes to hot user documents), and a Firestore transaction
+    on the user document.
+    
+    The daily quota follows the UTC calendar day, like the dailyUsage
+    counter it mirrors. Burst limits use a sliding window or token bucket
+    (`burst_algorithm`); they count every admitted request, including ones
+    whose generation later fails, and are per process without Redis.
     """
     
-    def __init__(self, redis_url: str = None):
-        self.redis = None
-        if redis_url:
-            try:
-                import redis
-                self.redis = redis.from_url(redis_url)
-            except ImportError:
-                print("Redis not installed, using Firestore for rate limiting")
+    def __init__(
+        self,
+        redis_url: str = None,
+        redis_client=None,
+        in_memory: bool = False,
+        usage_buffer: UsageBuffer = None,
+        burst_window: float = 60.0,
+        burst_algorithm: str = "sliding_window",
+    ):
+        if burst_algorithm not in ("sliding_window", "token_bucket"):
+            raise ValueError(f"Unknown burst algorithm: {burst_algorithm}")
+        self.redis = redis_client
+        self._local_usage: Dict[str, int] = {} if in_memory else None
+        self.usage_buffer = usage_buffer
+        self.burst_window = burst_window
+        self.burst_algorithm = burst_algorithm
+        self.burst = BurstLimiter(burst_window, burst_algorithm)
+        if redis_url and not self.redis:
+            self.redis = get_redis(redis_url)
+            if self.redis is None:
+                logger.warning("Redis unavailable, using Firestore for rate limiting")
+        self._reserve_script = self.redis.register_script(_RESERVE_SCRIPT) if self.redis else None
+        self._release_script = self.redis.register_script(_RELEASE_SCRIPT) if self.redis else None
+        self.redis_errors = 0
+        self.contended = 0
+    
+    @property
+    def records_usage(self) -> bool:
+        """Whether reserve() already counts toward the user's stored dailyUsage"""
+        return not self.redis and self._local_usage is None
     
     async def check_limit(self, user_id: str, limit: int) -> tuple[bool, int]:
         """
-        Check rate limit using Redis if available, otherwise Firestore.
+        Whether the user is below their daily limit, without taking a slot.
         Returns (is_allowed, current_count)
         """
         if self.redis:
             return await self._check_redis_limit(user_id, limit)
+        if self._local_usage is not None:
+            current = self._local_usage.get(self._local_key(user_id), 0)
+            return current < limit, current
         return await self._check_firestore_limit(user_id, limit)
     
-    async def _check_redis_limit(self, user_id: str, limit: int) -> tuple[bool, int]:
-        """Check limit using Redis with sliding window"""
-        import time
+    async def reserve(
+        self, user_id: str, limit: int, stored_usage: int = None, burst_limit: int = 0
+    ) -> tuple[bool, Optional[int]]:
+        """
+        Atomically reserve one message slot if the user is below their limit.
+        `stored_usage` (today's persisted count) saves the buffered backend a read.
+        Raises BurstLimitExceeded when `burst_limit` (>0) slots were already
+        taken in the burst window, and UsageContention when the user's
+        Firestore counter is too contended to update.
+        Returns (is_allowed, current_count). current_count is None when the
+        backend was unavailable and the request was let through without a
+        slot; there is then nothing to release().
+        """
+        if self.redis:
+            return await self._reserve_redis(user_id, limit, burst_limit)
         
-        key = f"rate_limit:{user_id}:{time.strftime('%Y-%m-%d')}"
+        if burst_limit > 0:
+            retry_after = self.burst.take(user_id, burst_limit)
+            if retry_after:
+                raise BurstLimitExceeded(burst_limit, retry_after)
         
-        pipe = self.redis.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, 86400)  # Expire after 24 hours
-        results = pipe.execute()
+        if self._local_usage is not None:
+            allowed, current = self._reserve_local(user_id, limit)
+        elif self.usage_buffer:
+            if stored_usage is None:
+                stored_usage = daily_usage(await firebase_service.get_user(user_id))
+            allowed, current = self.usage_buffer.reserve(user_id, stored_usage, limit)
+        else:
+            try:
+                allowed, current = await firebase_service.reserve_usage(user_id, limit)
+            except UsageContention:
+                # Many requests at once for one user: refused, to be retried shortly
+                self.contended += 1
+                if burst_limit > 0:
+                    self.burst.refund(user_id)
+                raise
         
-        current = results[0]
-        return current <= limit, current
+        if not allowed and burst_limit > 0:
+            self.burst.refund(user_id)
+        return allowed, current
+    
+    async def release(self, user_id: str):
+        """Refund a slot taken by reserve()"""
+        if self.redis:
+            try:
+                await self._release_script(keys=[self._redis_key(user_id)])
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error("Redis quota release failed: %s", e, extra=log_fields(e, user_id=user_id, stage="quota"))
+        elif self._local_usage is not None:
+            key = self._local_key(user_id)
+            self._local_usage[key] = max(0, self._local_usage.get(key, 0) - 1)
+        elif self.usage_buffer:
+            self.usage_buffer.add(user_id, -1)
+        else:
+            await firebase_service.release_usage(user_id)
+    
+    def _redis_key(self, user_id: str) -> str:
+        return f"rate_limit:{user_id}:{usage_date()}"
+    
+    def _burst_keys(self, user_id: str, now_ms: int) -> List[str]:
+        if self.burst_algorithm == "token_bucket":
+            key = f"rate_limit:{user_id}:bucket"
+            return [key, key]
+        index = now_ms // int(self.burst_window * 1000)
+        return [f"rate_limit:{user_id}:burst:{index}", f"rate_limit:{user_id}:burst:{index - 1}"]
+    
+    def _local_key(self, user_id: str) -> str:
+        return f"{user_id}:{usage_date()}"
+    
+    def _reserve_local(self, user_id: str, limit: int) -> tuple[bool, int]:
+        # No await between read and write, so this is atomic on the event loop
+        key = self._local_key(user_id)
+        current = self._local_usage.get(key, 0)
+        if current >= limit:
+            return False, current
+        self._local_usage[key] = current + 1
+        return True, current + 1
+    
+    async def _reserve_redis(self, user_id: str, limit: int, burst_limit: int) -> tuple[bool, Optional[int]]:
+        now_ms = int(time.time() * 1000)
+        keys = [self._redis_key(user_id), *self._burst_keys(user_id, now_ms)]
+        args = [limit, 86400, burst_limit, int(self.burst_window * 1000), now_ms, self.burst_algorithm]
+        try:
+            result, current, retry_ms = await self._reserve_script(keys=keys, args=args)
+        except Exception as e:
+            # Fail open like the Firestore backend, without a slot to release; usage is still recorded on commit
+            self.redis_errors += 1
+            logger.error("Redis quota reservation failed: %s", e, extra=log_fields(e, user_id=user_id, stage="quota"))
+            return True, None
+        if result < 0:
+            raise BurstLimitExceeded(burst_limit, retry_ms / 1000)
+        return bool(result), int(current)
+    
+    async def _check_redis_limit(self, user_id: str, limit: int) -> tuple[bool, int]:
+        """Check the day's Redis counter"""
+        try:
+            current = int(await self.redis.get(self._redis_key(user_id)) or 0)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.error("Redis quota check failed: %s", e, extra=log_fields(e, user_id=user_id, stage="quota"))
+            return True, 0
+        return current < limit, current
     
     async def _check_firestore_limit(self, user_id: str, limit: int) -> tuple[bool, int]:
         """Check limit using Firestore"""
         user_data = await firebase_service.get_user(user_id)
-        current = user_data.get("dailyUsage", 0) if user_data else 0
+        current = daily_usage(user_data)
+        if self.usage_buffer:
+            current += self.usage_buffer.pending(user_id)
         return current < limit, current
+    
+    def stats(self) -> Dict:
+        backend = "redis" if self.redis else "memory" if self._local_usage is not None else \
+            "usage_buffer" if self.usage_buffer else "firestore"
+        return {
+            "backend": backend,
+            "burst_users": len(self.burst._state),
+            "redis_errors": self.redis_errors,
+            "contended": self.contended,
+        }
+
+
+rate_limiter = RateLimitMiddleware(
+    redis_url=settings.redis_url,
+    usage_buffer=usage_buffer if buffering_enabled() else None,
+    burst_window=settings.burst_window,
+    burst_algorithm=settings.burst_algorithm,
+)
+
+
+class QuotaReservation:
+    """
+    A reserved message slot for one request. `taken` is False when the
+    limiter failed open: the request goes ahead, but no slot was taken, so
+    release() has nothing to refund.
+    """
+    
+    def __init__(self, limiter: RateLimitMiddleware, user_id: str, taken: bool = True):
+        self.limiter = limiter
+        self.user_id = user_id
+        self.taken = taken
+        self._settled = False
+    
+    async def commit(self):
+        """Keep the slot; mirror it to Firestore when the limiter counts elsewhere"""
+        if self._settled:
+            return
+        self._settled = True
+        if not self.limiter.records_usage:
+            await record_usage(self.user_id)
+    
+    async def release(self):
+        """Refund the slot (generation failed)"""
+        if self._settled:
+            return
+        self._settled = True
+        if self.taken:
+            await self.limiter.release(self.user_id)
+
+
+async def reserve_quota(ctx: UserContext, limiter: RateLimitMiddleware = None) -> QuotaReservation:
+    """
+    Reserve a message slot before generation.
+    Raises HTTPException if the limit is reached. The caller must commit() the
+    reservation on success or release() it on failure.
+    """
+    limiter = limiter or rate_limiter
+    
+    with stage("quota"):
+        # Cheap pre-check against the already-loaded user doc
+        await check_rate_limit(ctx)
+        
+        limit = _daily_limit(ctx)
+        try:
+            allowed, usage = await limiter.reserve(
+                ctx.uid, limit, stored_usage=ctx.stored_usage, burst_limit=_burst_limit(ctx)
+            )
+        except BurstLimitExceeded as e:
+            raise _burst_exceeded(e, ctx.is_premium)
+        except UsageContention:
+            raise _usage_contended(ctx.is_premium)
+        if not allowed:
+            raise _limit_exceeded(limit, usage, ctx.is_premium)
+    
+    return QuotaReservation(limiter, ctx.uid, taken=usage is not None)
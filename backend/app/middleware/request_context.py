@@ -0,0 +1,42 @@
+import re
+import uuid
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.services.logger import request_id
+
+# Accept caller-supplied IDs (load balancer, client) only if they are short and log-safe
+_VALID_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestContextMiddleware:
+    """
+    Sets the request-ID context var that every log record carries and echoes
+    it in the X-Request-ID response header. Reuses the caller's X-Request-ID
+    when present so logs can be joined with upstream proxies.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        
+        rid = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")
+                break
+        if not rid or not _VALID_ID.match(rid):
+            rid = uuid.uuid4().hex
+        token = request_id.set(rid)
+        
+        async def send_with_id(message: Message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", rid.encode())]}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,72 @@
+from fastapi import Depends
+from typing import Optional, Dict
+import asyncio
+from app.routers.auth import get_current_user
+from app.services.firebase_service import firebase_service, daily_usage
+from app.services.usage_buffer import usage_buffer
+from app.services.metrics import stage
+from app.config import settings
+
+
+class UserContext:
+    """
+    Request-scoped view of the authenticated user.
+    The `users/{uid}` document is fetched at most once per request and shared
+    by the rate limiter, the premium logic and the usage endpoint.
+    """
+    
+    def __init__(self, user: dict):
+        self.uid = user["uid"]
+        self.email = user.get("email")
+        self._load_task: Optional[asyncio.Future] = None
+        self._sharded_usage = 0
+        self._written_at_load = 0
+    
+    async def _fetch(self) -> Optional[Dict]:
+        self._written_at_load = usage_buffer.written(self.uid)
+        with stage("user_doc"):
+            if not settings.usage_shards:
+                return await firebase_service.get_user(self.uid)
+            data, self._sharded_usage = await asyncio.gather(
+                firebase_service.get_user(self.uid),
+                firebase_service.get_sharded_usage(self.uid),
+            )
+            return data
+    
+    async def load(self) -> Optional[Dict]:
+        """Load the user document (once); concurrent callers share the same fetch"""
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._fetch())
+        return await self._load_task
+    
+    @property
+    def data(self) -> Optional[Dict]:
+        """User document, or None for a new user. Only valid after load()"""
+        if self._load_task is None or not self._load_task.done():
+            raise RuntimeError("UserContext.load() must be awaited before reading user data")
+        return self._load_task.result()
+    
+    @property
+    def is_premium(self) -> bool:
+        return self.data.get("isPremium", False) if self.data else False
+    
+    @property
+    def stored_usage(self) -> int:
+        """Today's usage as persisted in Firestore (user counter or usage shards)"""
+        stored = self._sharded_usage if settings.usage_shards else daily_usage(self.data)
+        # Buffered usage flushed since the load is in Firestore now, but not in our copy
+        return max(0, stored + usage_buffer.written(self.uid) - self._written_at_load)
+    
+    @property
+    def daily_usage(self) -> int:
+        """Today's usage including increments still buffered in this process"""
+        return self.stored_usage + usage_buffer.pending(self.uid)
+
+
+async def get_user_context(user: dict = Depends(get_current_user)) -> UserContext:
+    """
+    FastAPI dependency for the request's UserContext.
+    The document is not fetched here so handlers can load it concurrently
+    with their other reads.
+    """
+    return UserContext(user)
@@ -21,6 +21,9 @@ class SendMessageRequest(BaseModel):
     chat_id: Optional[str] = None
     content: str = Field(..., min_length=1, max_length=4000)
     tone: Literal["friendly", "professional", "tutor"] = "friendly"
+    # Store both messages server-side (for clients that no longer write them to Firestore)
+    persist: bool = False
+    is_voice: bool = False
 
 
 class SendMessageResponse(BaseModel):
@@ -32,27 +35,34 @@ class SendMessageResponse(BaseModel):
 
 
 class ChatMessage(BaseModel):
-    """A single chat message"""
+    """A single chat message (only the requested fields when `fields` is given)"""
     message_id: str
-    chat_id: str
-    sender: Literal["user", "ai"]
-    content: str
-    timestamp: datetime
+    chat_id: Optional[str] = None
+    sender: Optional[Literal["user", "ai"]] = None
+    content: Optional[str] = None
+    timestamp: Optional[datetime] = None
 
 
 class Chat(BaseModel):
-    """A chat conversation"""
+    """A chat conversation (only the requested fields when `fields` is given)"""
     chat_id: str
-    user_id: str
-    title: str
-    created_at: datetime
-    updated_at: datetime
+    user_id: Optional[str] = None
+    title: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
 
 
 class ChatHistoryResponse(BaseModel):
     """Response containing chat history"""
     chats: List[Chat]
     total: int
+    next_cursor: Optional[str] = None  # pass as `start_after` for the next page
+
+
+class ChatMessagesResponse(BaseModel):
+    """One page of a chat's messages"""
+    messages: List[ChatMessage]
+    next_cursor: Optional[str] = None
 
 
 # Usage models
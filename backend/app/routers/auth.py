@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.models.schemas import TokenVerifyResponse
 from app.services.firebase_service import firebase_service
+from app.services.logger import bind
 
 router = APIRouter()
 security = HTTPBearer()
@@ -19,6 +20,7 @@ async def get_current_user(
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    bind(user_id=user["uid"])
     return user
 
 
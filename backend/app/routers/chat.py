@@ -1,85 +1,721 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import ValidationError
 from app.models.schemas import (
     SendMessageRequest,
     SendMessageResponse,
     ChatHistoryResponse,
+    ChatMessagesResponse,
     Chat,
+    ChatMessage,
 )
 from app.routers.auth import get_current_user
-from app.services.openai_service import openai_service
-from app.services.firebase_service import firebase_service
-from app.middleware.rate_limiter import check_rate_limit
+from app.services.openai_service import openai_service, FALLBACK_RESPONSES, StreamInterrupted
+from app.services.firebase_service import ChatUnavailable, firebase_service
+from app.middleware.rate_limiter import QuotaReservation, reserve_quota
+from app.middleware.user_context import UserContext, get_user_context
+from app.services.write_queue import WriteQueueFull, new_chat_fields, persist_exchange, write_queue
+from app.services.context_cache import context_cache
+from app.services.conversation_memory import conversation_memory
+from app.services.exporter import transcript_exporter
+from app.services.response_cache import IdempotencyKeyReused, fingerprint, response_cache
+from app.services.pagination import (
+    CHAT_FIELDS,
+    MESSAGE_FIELDS,
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    page_etag,
+    projection,
+)
+from app.services.metrics import metrics, stage
+from app.services.logger import bind, get_logger, log_fields, request_id
+from app.services.model_scheduler import ModelOverloaded
+from app.config import settings
+from typing import AsyncIterator, Optional, List, Dict, Tuple
 from datetime import datetime
+import asyncio
+import json
+import time
 import uuid
 
 router = APIRouter()
+logger = get_logger("chat")
+
+
+async def _authorize_chat(request: SendMessageRequest, user_id: str) -> Optional[Dict]:
+    """
+    Owner and summary of the chat a message is for, or None if it does not
+    exist; 404 if it is someone else's. A message that is to be stored in a
+    chat that does not exist yet claims the chat for the user first, so no
+    later request can take the ID over.
+    """
+    meta = await firebase_service.get_chat_meta(request.chat_id)
+    if meta is None and request.persist:
+        meta = await firebase_service.claim_chat(
+            request.chat_id, user_id, new_chat_fields(user_id, request.content, datetime.utcnow())
+        )
+    if meta is not None and meta.get("userId") != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
+    return meta
+
+
+def _newer(timestamp: Optional[datetime], watermark: datetime) -> bool:
+    """timestamp > watermark; Firestore reads back the naive UTC times we write as aware ones"""
+    if timestamp is None:
+        return True
+    return timestamp.replace(tzinfo=None) > watermark.replace(tzinfo=None)
+
+
+async def _get_context(request: SendMessageRequest, user_id: str) -> Tuple[str, List[Dict]]:
+    """Get the running summary and recent history for context (empty for a new conversation)"""
+    chat_id = request.chat_id
+    if not chat_id:
+        return "", []
+    
+    history = context_cache.get(chat_id)
+    with stage("history"):
+        if history is not None:
+            await _authorize_chat(request, user_id)
+            return context_cache.get_summary(chat_id), history
+        
+        # The history read overlaps the ownership check and is dropped if it fails
+        meta, history = await asyncio.gather(
+            _authorize_chat(request, user_id),
+            firebase_service.get_recent_messages(chat_id, limit=settings.context_messages),
+        )
+    if meta is None:
+        # No chat document, so nobody the messages could be checked against
+        return "", []
+    
+    summary = meta.get("summary", "")
+    # Messages up to the watermark are already in the summary. They are
+    # filtered here rather than in the query so the read can overlap the
+    # ownership check.
+    folded_through = meta.get("summaryThrough")
+    if folded_through is not None:
+        history = [m for m in history if _newer(m.get("timestamp"), folded_through)]
+    # Clients that store the message before calling us would otherwise see it twice
+    if history and history[-1].get("sender") == "user" and history[-1].get("content") == request.content:
+        history.pop()
+    context_cache.put(chat_id, history, summary)
+    return summary, history
+
+
+def _remember_exchange(
+    request: SendMessageRequest,
+    chat_id: str,
+    content: str,
+    received_at: datetime,
+    replied_at: datetime,
+):
+    """Extend the cached context tail with the new exchange"""
+    if content in FALLBACK_RESPONSES:
+        return
+    messages = [
+        {"sender": "user", "content": request.content, "timestamp": received_at},
+        {"sender": "ai", "content": content, "timestamp": replied_at},
+    ]
+    if request.chat_id is None:
+        context_cache.put(chat_id, messages)
+    else:
+        context_cache.append(chat_id, *messages)
+
+
+async def _settle_quota(reservation: QuotaReservation, content: str):
+    """Keep the quota slot for a real answer, refund it for a fallback"""
+    with stage("usage"):
+        if content in FALLBACK_RESPONSES:
+            await reservation.release()
+        else:
+            await reservation.commit()
+
+
+def _admit_persist(request: SendMessageRequest):
+    """Turn away messages to be stored while the write queue is full, before any work is done for them"""
+    if request.persist and write_queue.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Chat storage is busy right now. Please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def _persist(
+    request: SendMessageRequest,
+    user_id: str,
+    chat_id: str,
+    received_at: datetime,
+    message_id: str,
+    content: str,
+    replied_at: datetime,
+):
+    """Queue both messages for storage when the client asked for it (off the response path)"""
+    if not request.persist or content in FALLBACK_RESPONSES:
+        return
+    with stage("persist"):
+        try:
+            await persist_exchange(
+                user_id=user_id,
+                chat_id=chat_id,
+                new_chat=request.chat_id is None,
+                user_message_id=str(uuid.uuid4()),
+                user_content=request.content,
+                user_timestamp=received_at,
+                ai_message_id=message_id,
+                ai_content=content,
+                ai_timestamp=replied_at,
+                is_voice=request.is_voice,
+            )
+        except WriteQueueFull:
+            pass  # Logged and counted by the queue; the reply is still returned
 
 
 @router.post("/message", response_model=SendMessageResponse)
 async def send_message(
     request: SendMessageRequest,
-    user: dict = Depends(get_current_user),
+    background_tasks: BackgroundTasks,
+    response: Response,
+    ctx: UserContext = Depends(get_user_context),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
 ):
     """Send a message and get AI response"""
-    user_id = user["uid"]
+    received_at = datetime.utcnow()
     
-    # Check rate limit
-    await check_rate_limit(user_id)
+    async def respond() -> SendMessageResponse:
+        _admit_persist(request)
+        # Load the user doc and conversation history concurrently; replays
+        # are answered from the cache before either is read
+        _, (summary, history) = await asyncio.gather(ctx.load(), _get_context(request, ctx.uid))
+        # Reserve a quota slot up front; it is refunded if generation fails
+        reservation = await reserve_quota(ctx)
+        is_premium = ctx.is_premium
+        
+        # Generate chat ID if new conversation
+        chat_id = request.chat_id or str(uuid.uuid4())
+        bind(chat=chat_id)
+        
+        # Generate AI response
+        try:
+            ai_response = await openai_service.generate_response(
+                user_message=request.content,
+                tone=request.tone,
+                conversation_history=history,
+                is_premium=is_premium,
+                summary=summary,
+            )
+        except Exception:
+            await reservation.release()
+            raise
+        
+        # Create response
+        message_id = str(uuid.uuid4())
+        replied_at = datetime.utcnow()
+        
+        await _settle_quota(reservation, ai_response)
+        _remember_exchange(request, chat_id, ai_response, received_at, replied_at)
+        await _persist(request, ctx.uid, chat_id, received_at, message_id, ai_response, replied_at)
+        
+        return SendMessageResponse(
+            message_id=message_id,
+            chat_id=chat_id,
+            content=ai_response,
+            timestamp=replied_at.isoformat(),
+        )
     
-    # Get user data for premium status
-    user_data = await firebase_service.get_user(user_id)
-    is_premium = user_data.get("isPremium", False) if user_data else False
+    # Retries and double-taps share one generation (and one quota slot)
+    request_fingerprint = fingerprint(request.model_dump())
+    try:
+        result, source = await response_cache.run(
+            respond,
+            key=(ctx.uid, idempotency_key) if idempotency_key else None,
+            flight_key=(ctx.uid, request_fingerprint),
+            cacheable=lambda r: r.content not in FALLBACK_RESPONSES,
+            request_fingerprint=request_fingerprint,
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request",
+        )
     
-    # Generate chat ID if new conversation
-    chat_id = request.chat_id or str(uuid.uuid4())
+    if source == "leader":
+        # Fold older turns into the running summary once the response is sent
+        background_tasks.add_task(conversation_memory.maybe_fold, result.chat_id, ctx.uid)
+    else:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+INTERRUPTED = "The reply was interrupted. Please try again."
+CHAT_UNAVAILABLE = "Chats are unavailable right now. Please try again shortly."
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_exchange(
+    request: SendMessageRequest,
+    ctx: UserContext,
+    reservation: QuotaReservation,
+    chat_id: str,
+    message_id: str,
+    summary: str,
+    history: List[Dict],
+    received_at: datetime,
+) -> AsyncIterator[Tuple[str, Optional[SendMessageResponse]]]:
+    """
+    Stream the AI reply as (token, None) pairs, then settle quota, store the
+    exchange and yield ("", final response). Shared by SSE and the WebSocket.
+    If the stream fails part-way (StreamInterrupted) the slot is refunded and
+    nothing is stored.
+    """
+    parts = []
+    try:
+        async for token in openai_service.stream_response(
+            user_message=request.content,
+            tone=request.tone,
+            conversation_history=history,
+            is_premium=ctx.is_premium,
+            summary=summary,
+        ):
+            parts.append(token)
+            yield token, None
+    except (Exception, asyncio.CancelledError):
+        # Includes the client going away mid-stream: refund the slot
+        await reservation.release()
+        raise
+    
+    # Settle usage once the full response has been produced
+    content = "".join(parts)
+    replied_at = datetime.utcnow()
+    await _settle_quota(reservation, content)
+    _remember_exchange(request, chat_id, content, received_at, replied_at)
+    await _persist(request, ctx.uid, chat_id, received_at, message_id, content, replied_at)
     
-    # Get conversation history for context
-    history = []
-    if request.chat_id:
-        history = await firebase_service.get_messages(request.chat_id, limit=10)
-    
-    # Generate AI response
-    ai_response = await openai_service.generate_response(
-        user_message=request.content,
-        tone=request.tone,
-        conversation_history=history,
-        is_premium=is_premium,
+    yield "", SendMessageResponse(
+        message_id=message_id,
+        chat_id=chat_id,
+        content=content,
+        timestamp=replied_at.isoformat(),
     )
+
+
+@router.post("/message/stream")
+async def send_message_stream(
+    request: SendMessageRequest,
+    ctx: UserContext = Depends(get_user_context),
+):
+    """Send a message and stream the AI response as Server-Sent Events"""
+    received_at = datetime.utcnow()
     
-    # Create response
+    # Load the user doc and conversation history concurrently
+    _, (summary, history) = await asyncio.gather(ctx.load(), _get_context(request, ctx.uid))
+    
+    # Shed load and reserve a quota slot before the stream starts so a 503/429 is still a plain response
+    openai_service.scheduler.admit()
+    _admit_persist(request)
+    reservation = await reserve_quota(ctx)
+    
+    # Generate chat ID if new conversation
+    chat_id = request.chat_id or str(uuid.uuid4())
     message_id = str(uuid.uuid4())
-    timestamp = datetime.utcnow().isoformat()
+    bind(chat=chat_id)
     
-    # Increment daily usage
-    await firebase_service.increment_usage(user_id)
+    async def event_stream():
+        try:
+            yield _sse("start", {"message_id": message_id, "chat_id": chat_id})
+            async for token, final in _stream_exchange(
+                request, ctx, reservation, chat_id, message_id, summary, history, received_at
+            ):
+                if final:
+                    yield _sse("done", final.model_dump())
+                else:
+                    yield _sse("token", {"content": token})
+        except StreamInterrupted:
+            yield _sse("error", {"message_id": message_id, "code": 502, "detail": INTERRUPTED})
+        finally:
+            # A client that goes away is cancelled at a yield and the generator
+            # closed later, past _stream_exchange's handler: refund here (a
+            # no-op once the reply was committed)
+            await reservation.release()
     
-    return SendMessageResponse(
-        message_id=message_id,
-        chat_id=chat_id,
-        content=ai_response,
-        timestamp=timestamp,
+    async def after_stream():
+        # Also covers a disconnect before the stream was first iterated
+        await reservation.release()
+        await conversation_memory.maybe_fold(chat_id, ctx.uid)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(after_stream),
     )
 
 
-@router.get("/history", response_model=ChatHistoryResponse)
+class ChatSocket:
+    """
+    One authenticated /chat/ws connection.
+    The token is verified once and the user doc (tier, stored usage) is kept
+    on the connection, re-read every `ws_user_refresh` seconds; chat context
+    tails come from the in-process context cache. Each "message" frame runs
+    as its own task so several chats stream at once; messages for the same
+    chat are answered in order. The receive loop pings after
+    `ws_heartbeat_interval` of silence and closes sockets idle for
+    `ws_idle_timeout`, so an idle connection costs one parked task.
+    """
+    
+    opened = 0
+    active = 0
+    evicted = 0
+    messages = 0
+    
+    def __init__(self, websocket: WebSocket, user: dict, token_exp: float):
+        self.websocket = websocket
+        self.user = user
+        self.token_exp = token_exp
+        self.ctx: Optional[UserContext] = None
+        self.ctx_loaded_at = 0.0
+        self.tasks: Dict[str, asyncio.Task] = {}  # client ref -> reply task
+        self.chat_locks: Dict[str, list] = {}  # chat ID -> [lock, replies holding or awaiting it]
+        self._send_lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+    
+    @classmethod
+    def stats(cls) -> Dict:
+        return {"active": cls.active, "opened": cls.opened, "evicted": cls.evicted, "messages": cls.messages}
+    
+    async def send(self, frame: Dict):
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(frame, default=str))
+    
+    async def user_context(self) -> UserContext:
+        if self.ctx is None or time.monotonic() - self.ctx_loaded_at > settings.ws_user_refresh:
+            ctx = UserContext(self.user)
+            await ctx.load()
+            self.ctx, self.ctx_loaded_at = ctx, time.monotonic()
+        return self.ctx
+    
+    async def run(self):
+        ChatSocket.opened += 1
+        ChatSocket.active += 1
+        try:
+            ctx = await self.user_context()
+            await self.send({
+                "type": "ready",
+                "user_id": ctx.uid,
+                "is_premium": ctx.is_premium,
+                "daily_usage": ctx.daily_usage,
+                "daily_limit": settings.premium_daily_limit if ctx.is_premium else settings.free_daily_limit,
+            })
+            while await self._receive():
+                pass
+        except WebSocketDisconnect:
+            pass
+        finally:
+            ChatSocket.active -= 1
+            for task in self.tasks.values():
+                task.cancel()
+    
+    async def _receive(self) -> bool:
+        """Handle one client frame (or a heartbeat tick); False once the socket should close"""
+        try:
+            message = await asyncio.wait_for(self.websocket.receive(), settings.ws_heartbeat_interval)
+        except asyncio.TimeoutError:
+            if not self.tasks and time.monotonic() - self.last_seen >= settings.ws_idle_timeout:
+                ChatSocket.evicted += 1
+                await self.websocket.close(code=status.WS_1001_GOING_AWAY, reason="idle")
+                return False
+            await self.send({"type": "ping"})
+            return True
+        
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+        try:
+            frame = json.loads(message.get("text") or "")
+            kind = frame.get("type")
+        except (ValueError, AttributeError):
+            await self.send({"type": "error", "code": 400, "detail": "Frames must be JSON text objects"})
+            return True
+        
+        if kind in ("message", "cancel", "auth"):
+            # Heartbeat replies do not count as activity, or idle sockets would never be evicted
+            self.last_seen = time.monotonic()
+        if kind == "message":
+            await self._start_message(frame)
+        elif kind == "cancel":
+            task = self.tasks.get(str(frame.get("ref")))
+            if task:
+                task.cancel()
+        elif kind == "auth":
+            # Token refresh on a live socket (ID tokens last an hour)
+            user = await firebase_service.verify_token(str(frame.get("token", "")))
+            if not user or user["uid"] != self.user["uid"]:
+                await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="invalid token")
+                return False
+            self.token_exp = user.get("exp", self.token_exp)
+            await self.send({"type": "auth_ok"})
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind != "pong":
+            await self.send({"type": "error", "code": 400, "detail": f"Unknown frame type: {kind}"})
+        return True
+    
+    async def _start_message(self, frame: Dict):
+        ref = str(frame.get("ref") or uuid.uuid4())
+        if time.time() >= self.token_exp:
+            await self.send({"type": "error", "ref": ref, "code": 401, "detail": "Token expired, send a new auth frame"})
+            return
+        if ref in self.tasks or len(self.tasks) >= settings.ws_max_inflight:
+            await self.send({"type": "error", "ref": ref, "code": 429, "detail": "Too many replies in progress"})
+            return
+        try:
+            request = SendMessageRequest.model_validate(
+                {k: v for k, v in frame.items() if k in SendMessageRequest.model_fields}
+            )
+        except ValidationError as e:
+            await self.send({"type": "error", "ref": ref, "code": 422, "detail": e.errors(include_url=False)})
+            return
+        
+        task = asyncio.create_task(self._reply(ref, request))
+        self.tasks[ref] = task
+        task.add_done_callback(lambda _: self.tasks.pop(ref, None))
+    
+    async def _reply(self, ref: str, request: SendMessageRequest):
+        ChatSocket.messages += 1
+        request_id.set(uuid.uuid4().hex)
+        timings = metrics.begin_request()
+        code = 200
+        chat_id = request.chat_id or str(uuid.uuid4())
+        bind(chat=chat_id)
+        entry = self.chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        reservation = None
+        try:
+            async with entry[0]:
+                received_at = datetime.utcnow()
+                ctx, (summary, history) = await asyncio.gather(
+                    self.user_context(), _get_context(request, self.user["uid"])
+                )
+                openai_service.scheduler.admit()
+                _admit_persist(request)
+                reservation = await reserve_quota(ctx)
+                
+                message_id = str(uuid.uuid4())
+                await self.send({"type": "start", "ref": ref, "chat_id": chat_id, "message_id": message_id})
+                async for token, final in _stream_exchange(
+                    request, ctx, reservation, chat_id, message_id, summary, history, received_at
+                ):
+                    if final:
+                        await self.send({"type": "done", "ref": ref, **final.model_dump()})
+                    else:
+                        await self.send({"type": "token", "ref": ref, "chat_id": chat_id, "content": token})
+            await conversation_memory.maybe_fold(chat_id, self.user["uid"])
+        except HTTPException as e:
+            code = e.status_code
+            await self._send_error(ref, code, e.detail)
+        except StreamInterrupted:
+            code = 502
+            await self._send_error(ref, code, INTERRUPTED)
+        except ModelOverloaded as e:
+            code = 503
+            await self._send_error(ref, code, "The assistant is busy right now. Please try again shortly.", retry_after=e.retry_after)
+        except ChatUnavailable as e:
+            code = 503
+            if reservation is not None:
+                await reservation.release()
+            await self._send_error(ref, code, CHAT_UNAVAILABLE, retry_after=e.retry_after)
+        except asyncio.CancelledError:
+            code = 499
+            # A cancel at a send() leaves _stream_exchange parked at a yield, so refund here
+            if reservation is not None:
+                await reservation.release()
+            await self._send_error(ref, code, "Cancelled", type="cancelled")
+        except Exception as e:
+            # Anything else fails this message only, not the socket's other chats
+            code = 500
+            logger.exception("WebSocket reply failed: %s", e, extra=log_fields(e, stage="ws"))
+            if reservation is not None:
+                await reservation.release()
+            await self._send_error(ref, code, "Something went wrong. Please try again.")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.chat_locks[chat_id]
+            metrics.end_request(timings, "WS", "/chat/ws", code)
+    
+    async def _send_error(self, ref: str, code: int, detail, type: str = "error", **extra):
+        try:
+            await self.send({"type": type, "ref": ref, "code": code, "detail": detail, **extra})
+        except Exception:
+            pass  # socket already gone
+
+
+async def _authenticate_socket(websocket: WebSocket) -> Optional[dict]:
+    """Bearer token from the handshake header or a first {"type": "auth"} frame"""
+    token = None
+    header = websocket.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        token = header[7:]
+    else:
+        try:
+            frame = json.loads(await asyncio.wait_for(websocket.receive_text(), settings.ws_auth_timeout))
+            if isinstance(frame, dict) and frame.get("type") == "auth":
+                token = frame.get("token")
+        except (asyncio.TimeoutError, ValueError):
+            pass
+    
+    user = await firebase_service.verify_token(str(token)) if token else None
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="invalid or missing token")
+    return user
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Chat over one long-lived socket. Client frames: auth, message (SendMessageRequest
+    fields plus a client `ref`), cancel, ping. Server frames: ready, start, token,
+    done, error, cancelled, ping, pong; reply frames echo the message's `ref`.
+    """
+    await websocket.accept()
+    try:
+        user = await _authenticate_socket(websocket)
+    except WebSocketDisconnect:
+        return
+    if not user:
+        return
+    bind(user_id=user["uid"])
+    await ChatSocket(websocket, user, user.get("exp", float("inf"))).run()
+
+
+def _page(rows: List[Dict], limit: int, sort_field: str, id_field: str) -> Tuple[List[Dict], Optional[str]]:
+    """Drop the extra row fetched to detect a further page and build the cursor for it"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][sort_field], rows[-1][id_field])
+
+
+def _items(rows: List[Dict], allowed: Dict[str, Optional[str]], id_field: str, fields: Optional[str]) -> List[Dict]:
+    """Rows renamed to API field names, keeping only the requested fields"""
+    id_name = next(iter(allowed))  # always returned
+    requested = {name.strip() for name in fields.split(",")} if fields else set(allowed)
+    names = [name for name in allowed if name in requested and name != id_name]
+    return [
+        {id_name: row[id_field], **{name: row[allowed[name]] for name in names if allowed[name] in row}}
+        for row in rows
+    ]
+
+
+def _parse_page_args(start_after: Optional[str], fields: Optional[str], allowed: Dict, sort_field: str):
+    try:
+        return (
+            decode_cursor(start_after) if start_after else None,
+            projection(fields, allowed, sort_field),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _revalidate(response: Response, if_none_match: Optional[str], *parts) -> Optional[Response]:
+    """
+    Set the page's ETag and return a bare 304 when the client already has it.
+    Only IDs and sort timestamps go into the tag: chats bump updatedAt on every
+    change and messages are never edited, so unchanged pages hash the same
+    without serializing them.
+    """
+    etag = page_etag(*parts)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+@router.get("/history", response_model=ChatHistoryResponse, response_model_exclude_unset=True)
 async def get_chat_history(
+    response: Response,
     user: dict = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    start_after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated Chat fields to return"),
+    if_none_match: Optional[str] = Header(None),
 ):
-    """Get user's chat history"""
+    """Get user's chat history, most recently updated first"""
     user_id = user["uid"]
+    cursor, field_paths = _parse_page_args(start_after, fields, CHAT_FIELDS, "updatedAt")
+    
+    # One extra row tells whether there is a next page
+    rows = await firebase_service.get_chats(user_id, limit + 1, cursor, field_paths)
+    rows, next_cursor = _page(rows, limit, "updatedAt", "chatId")
     
-    chats = await firebase_service.get_chats(user_id)
+    not_modified = _revalidate(
+        response, if_none_match, fields, start_after, [(c["chatId"], c.get("updatedAt")) for c in rows], next_cursor
+    )
+    if not_modified:
+        return not_modified
     
     return ChatHistoryResponse(
-        chats=[
-            Chat(
-                chat_id=c["chatId"],
-                user_id=c["userId"],
-                title=c["title"],
-                created_at=c["createdAt"],
-                updated_at=c["updatedAt"],
-            )
-            for c in chats
-        ],
-        total=len(chats),
+        chats=[Chat(**item) for item in _items(rows, CHAT_FIELDS, "chatId", fields)],
+        total=len(rows),
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/{chat_id}/messages", response_model=ChatMessagesResponse, response_model_exclude_unset=True)
+async def get_chat_messages(
+    chat_id: str,
+    response: Response,
+    user: dict = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    start_after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated ChatMessage fields to return"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get a page of a chat's messages, oldest first"""
+    cursor, field_paths = _parse_page_args(start_after, fields, MESSAGE_FIELDS, "timestamp")
+    bind(chat=chat_id)
+    
+    # Ownership check and the page read run together. userId is written once,
+    # when the chat is created (persist_exchange / claim_chat), so the owner
+    # read through the chat cache cannot be stale.
+    owner, rows = await asyncio.gather(
+        firebase_service.get_chat_owner(chat_id),
+        firebase_service.get_messages(chat_id, limit + 1, cursor, field_paths),
+    )
+    if owner != user["uid"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
+    rows, next_cursor = _page(rows, limit, "timestamp", "messageId")
+    
+    not_modified = _revalidate(
+        response, if_none_match, fields, start_after, [(m["messageId"], m.get("timestamp")) for m in rows], next_cursor
+    )
+    if not_modified:
+        return not_modified
+    
+    return ChatMessagesResponse(
+        messages=[ChatMessage(**item) for item in _items(rows, MESSAGE_FIELDS, "messageId", fields)],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/export")
+async def export_chats(
+    user: dict = Depends(get_current_user),
+    gzip: bool = Query(False, description="Return a gzip-compressed file"),
+):
+    """Download all of the user's chats and messages as NDJSON, streamed as it is read"""
+    filename = "chatmate-export.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        transcript_exporter.stream(user["uid"], compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
     )
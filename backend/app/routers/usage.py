@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Depends
 from app.models.schemas import UsageStatusResponse
-from app.routers.auth import get_current_user
-from app.services.firebase_service import firebase_service
+from app.middleware.user_context import UserContext, get_user_context
 from app.config import settings
 
 router = APIRouter()
@@ -9,20 +8,13 @@ router = APIRouter()
 
 @router.get("/status", response_model=UsageStatusResponse)
 async def get_usage_status(
-    user: dict = Depends(get_current_user),
+    ctx: UserContext = Depends(get_user_context),
 ):
     """Get user's usage status"""
-    user_id = user["uid"]
-    
-    user_data = await firebase_service.get_user(user_id)
-    
-    if not user_data:
-        # New user defaults
-        is_premium = False
-        daily_usage = 0
-    else:
-        is_premium = user_data.get("isPremium", False)
-        daily_usage = user_data.get("dailyUsage", 0)
+    # New users (no document) fall back to the defaults
+    await ctx.load()
+    is_premium = ctx.is_premium
+    daily_usage = ctx.daily_usage
     
     daily_limit = settings.premium_daily_limit if is_premium else settings.free_daily_limit
     remaining = max(0, daily_limit - daily_usage)
@@ -0,0 +1,94 @@
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+import time
+from app.config import settings
+
+
+def _entry(message: Dict) -> Dict:
+    return {"sender": message.get("sender"), "content": message.get("content", ""), "timestamp": message.get("timestamp")}
+
+
+class ContextCache:
+    """
+    In-process LRU of each chat's prompt context: the running summary and the
+    most recent messages not yet folded into it.
+    Continuing conversations read their prompt context from here instead of
+    Firestore; the tail is extended with every new exchange. Entries expire
+    after `ttl` seconds so a chat continued through another worker or device
+    is re-read from Firestore.
+    """
+    
+    def __init__(self, max_chats: int = 5000, tail_size: int = 10, ttl: float = 600):
+        self.max_chats = max_chats
+        self.tail_size = tail_size
+        self.ttl = ttl
+        # chat_id -> (expires_at, tail, summary)
+        self._chats: "OrderedDict[str, tuple[float, deque, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, chat_id: str) -> Optional[List[Dict]]:
+        """Cached tail for a chat (oldest first), or None on miss"""
+        entry = self._chats.get(chat_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self._chats.pop(chat_id, None)
+            self.misses += 1
+            return None
+        
+        self._chats.move_to_end(chat_id)
+        self.hits += 1
+        return list(entry[1])
+    
+    def peek(self, chat_id: str) -> Optional[List[Dict]]:
+        """Like get(), without touching LRU order or hit/miss counters"""
+        entry = self._chats.get(chat_id)
+        return list(entry[1]) if entry else None
+    
+    def get_summary(self, chat_id: str) -> str:
+        """Cached running summary for a chat ("" if none or not cached)"""
+        entry = self._chats.get(chat_id)
+        return entry[2] if entry else ""
+    
+    def put(self, chat_id: str, messages: List[Dict], summary: str = ""):
+        """Seed a chat's context from Firestore"""
+        tail = deque((_entry(m) for m in messages), maxlen=self.tail_size)
+        self._chats[chat_id] = (time.monotonic() + self.ttl, tail, summary)
+        self._chats.move_to_end(chat_id)
+        
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+    
+    def append(self, chat_id: str, *messages: Dict):
+        """Extend a cached tail with new messages (no-op if the chat is not cached)"""
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return
+        entry[1].extend(_entry(m) for m in messages)
+        self._chats[chat_id] = (time.monotonic() + self.ttl, entry[1], entry[2])
+        self._chats.move_to_end(chat_id)
+    
+    def fold(self, chat_id: str, through: Dict, summary: str):
+        """
+        Replace the tail up to and including message `through` (an entry from
+        peek()) with an updated summary. Matching the message itself rather
+        than a count keeps turns appended while the summary was being written
+        from being dropped unsummarized.
+        """
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return
+        tail = entry[1]
+        if any(m is through for m in tail):
+            while tail.popleft() is not through:
+                pass
+        self._chats[chat_id] = (entry[0], tail, summary)
+    
+    def stats(self) -> Dict:
+        return {"chats": len(self._chats), "hits": self.hits, "misses": self.misses}
+
+
+context_cache = ContextCache(
+    max_chats=settings.context_cache_chats,
+    tail_size=settings.context_messages,
+    ttl=settings.context_cache_ttl,
+)
@@ -0,0 +1,77 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+from datetime import datetime
+from app.config import settings
+from app.services.context_cache import ContextCache, context_cache
+from app.services.firebase_service import firebase_service
+from app.services.openai_service import openai_service
+from app.services.prompt_manager import estimate_tokens
+from app.services.metrics import stage
+
+# (messages to fold, previous summary) -> new summary
+Summarizer = Callable[[List[Dict], str], Awaitable[str]]
+
+
+class ConversationMemory:
+    """
+    Rolling conversation summaries.
+    Once a chat's context tail passes `token_threshold` (or is about to
+    overflow the tail), everything but the newest `keep_recent` messages is
+    folded into a running summary stored on the chat doc (or only in the
+    context cache, for a chat without one). The summary is prepended to the
+    prompt, so prompt size stays flat as a chat grows. Folding runs after the
+    response has been sent.
+    """
+    
+    def __init__(
+        self,
+        cache: ContextCache = None,
+        summarizer: Optional[Summarizer] = None,
+        token_threshold: int = 1500,
+        keep_recent: int = 4,
+    ):
+        self.cache = cache or context_cache
+        self.summarizer = summarizer or openai_service.summarize_conversation
+        self.token_threshold = token_threshold
+        self.keep_recent = keep_recent
+        self._folding = set()
+        self.folds = 0
+    
+    def should_fold(self, tail: List[Dict]) -> bool:
+        if len(tail) <= self.keep_recent:
+            return False
+        tokens = sum(estimate_tokens(m.get("content", "")) for m in tail)
+        # Fold before the next exchange (2 messages) would push turns out of the tail unsummarized
+        return tokens > self.token_threshold or len(tail) + 2 > self.cache.tail_size
+    
+    async def maybe_fold(self, chat_id: str, user_id: str) -> bool:
+        """Fold older turns of a chat into its summary if it has grown too large"""
+        tail = self.cache.peek(chat_id)
+        if not tail or chat_id in self._folding or not self.should_fold(tail):
+            return False
+        
+        self._folding.add(chat_id)
+        try:
+            older = tail[:-self.keep_recent]
+            previous = self.cache.get_summary(chat_id)
+            with stage("summary"):
+                summary = await self.summarizer(older, previous)
+            if not summary:
+                return False
+            
+            self.cache.fold(chat_id, older[-1], summary)
+            await firebase_service.save_chat_summary(chat_id, user_id, {
+                "summary": summary,
+                "summaryUpdatedAt": datetime.utcnow(),
+                # Watermark: a cold read of the context skips messages up to here
+                "summaryThrough": older[-1].get("timestamp"),
+            })
+            self.folds += 1
+            return True
+        finally:
+            self._folding.discard(chat_id)
+
+
+conversation_memory = ConversationMemory(
+    token_threshold=settings.summary_token_threshold,
+    keep_recent=settings.summary_keep_recent,
+)
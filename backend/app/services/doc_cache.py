@@ -0,0 +1,456 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import time
+import uuid
+from app.config import settings
+from app.services.logger import get_logger, log_fields
+from app.services.redis_client import get_redis
+
+logger = get_logger("doc_cache")
+
+Loader = Callable[[], Awaitable[Optional[Dict]]]
+
+# Every write to a document bumps its generation key, and a load only stores
+# what it read if the generation is unchanged, so a slow load cannot
+# overwrite a newer write with its older copy.
+_GENERATION_TTL = 300.0  # seconds; comfortably longer than any load
+
+# A document that does not exist is cached as this marker (stored as JSON
+# null) for negative_ttl seconds, so repeated lookups of a missing ID do not
+# each read Firestore
+_MISSING: Dict = {}
+_MISSING_RAW = "null"
+
+# Merge fields into a cached JSON document in place, keeping its TTL. The
+# document is dropped instead when an `expect` field differs (the cached copy
+# is too old to patch). KEYS[1]=key, KEYS[2]=generation key, ARGV[1]=fields,
+# ARGV[2]=increments, ARGV[3]=expect, ARGV[4]=generation TTL in ms
+_MERGE_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[4])
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local doc = cjson.decode(raw)
+if type(doc) ~= 'table' then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+for k, v in pairs(cjson.decode(ARGV[3])) do
+    if doc[k] ~= v then
+        redis.call('DEL', KEYS[1])
+        return 0
+    end
+end
+for k, v in pairs(cjson.decode(ARGV[1])) do
+    doc[k] = v
+end
+for k, v in pairs(cjson.decode(ARGV[2])) do
+    doc[k] = (tonumber(doc[k]) or 0) + v
+end
+redis.call('SET', KEYS[1], cjson.encode(doc), 'KEEPTTL')
+return 1
+"""
+
+# Store a loaded document unless it was written since the load began.
+# KEYS[1]=key, KEYS[2]=generation key, ARGV[1]=value, ARGV[2]=TTL in ms,
+# ARGV[3]=generation seen before loading
+_SET_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+# KEYS[1]=key, KEYS[2]=generation key, ARGV[1]=generation TTL in ms
+_DELETE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+def _encode(doc: Dict) -> str:
+    def default(value):
+        if isinstance(value, datetime):
+            return {"$dt": value.isoformat()}
+        raise TypeError(f"Cannot cache {type(value).__name__}")
+    return json.dumps(doc, default=default)
+
+
+def _decode(raw) -> Dict:
+    def hook(obj):
+        return datetime.fromisoformat(obj["$dt"]) if len(obj) == 1 and "$dt" in obj else obj
+    return json.loads(raw, object_hook=hook)
+
+
+def _apply(doc: Dict, fields: Dict, increments: Dict, expect: Dict) -> bool:
+    """In-process equivalent of _MERGE_SCRIPT; False when the copy must be dropped"""
+    if any(doc.get(k) != v for k, v in expect.items()):
+        return False
+    doc.update(fields)
+    for key, delta in increments.items():
+        doc[key] = (doc.get(key) or 0) + delta
+    return True
+
+
+class LocalBackend:
+    """
+    In-process stand-in for the Redis tier, with the same interface. Used when
+    no redis_url is configured (single worker) and by the offline checks,
+    where several DocumentCache instances sharing one LocalBackend behave
+    like workers sharing Redis.
+    """
+    
+    def __init__(self):
+        self._values: Dict[str, tuple] = {}  # key -> (expires_at, raw)
+        self._locks: Dict[str, float] = {}
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+    
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._values.pop(key, None)
+            return None
+        return entry[1]
+    
+    async def generation(self, key: str) -> str:
+        return await self.get(f"{key}:gen") or ""
+    
+    async def set(self, key: str, raw: str, ttl: float, generation: Optional[str] = None) -> bool:
+        if generation is not None and await self.generation(key) != generation:
+            return False
+        self._values[key] = (time.monotonic() + ttl, raw)
+        return True
+    
+    async def _bump(self, key: str):
+        generation = int(await self.generation(key) or 0) + 1
+        self._values[f"{key}:gen"] = (time.monotonic() + _GENERATION_TTL, str(generation))
+    
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+        await self._bump(key)
+    
+    async def merge(self, key: str, fields: Dict, increments: Dict, expect: Dict) -> bool:
+        await self._bump(key)
+        raw = await self.get(key)
+        if raw is None:
+            return False
+        doc = _decode(raw)
+        if doc is None or not _apply(doc, fields, increments, expect):
+            self._values.pop(key, None)
+            return False
+        self._values[key] = (self._values[key][0], _encode(doc))
+        return True
+    
+    async def acquire(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        if self._locks.get(key, 0) > now:
+            return False
+        self._locks[key] = now + ttl
+        return True
+    
+    async def locked(self, key: str) -> bool:
+        return self._locks.get(key, 0) > time.monotonic()
+    
+    async def release(self, key: str):
+        self._locks.pop(key, None)
+    
+    async def publish(self, channel: str, message: str):
+        for queue in self._listeners.get(channel, []):
+            queue.put_nowait(message)
+    
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._listeners[channel].remove(queue)
+
+
+class RedisBackend:
+    """Shared tier on redis.asyncio: JSON values with TTLs, SET NX locks, pub/sub"""
+    
+    def __init__(self, client):
+        self.client = client
+        self._merge = client.register_script(_MERGE_SCRIPT)
+        self._set = client.register_script(_SET_SCRIPT)
+        self._delete = client.register_script(_DELETE_SCRIPT)
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+    
+    async def generation(self, key: str) -> str:
+        value = await self.client.get(f"{key}:gen")
+        return value.decode() if isinstance(value, bytes) else (value or "")
+    
+    async def set(self, key: str, raw: str, ttl: float, generation: Optional[str] = None) -> bool:
+        if generation is None:
+            return bool(await self.client.set(key, raw, px=int(ttl * 1000)))
+        args = [raw, int(ttl * 1000), generation]
+        return bool(await self._set(keys=[key, f"{key}:gen"], args=args))
+    
+    async def delete(self, key: str):
+        await self._delete(keys=[key, f"{key}:gen"], args=[int(_GENERATION_TTL * 1000)])
+    
+    async def merge(self, key: str, fields: Dict, increments: Dict, expect: Dict) -> bool:
+        args = [
+            _encode(fields or {}),
+            json.dumps(increments or {}),
+            json.dumps(expect or {}),
+            int(_GENERATION_TTL * 1000),
+        ]
+        return bool(await self._merge(keys=[key, f"{key}:gen"], args=args))
+    
+    async def acquire(self, key: str, ttl: float) -> bool:
+        return bool(await self.client.set(key, "1", nx=True, px=int(ttl * 1000)))
+    
+    async def locked(self, key: str) -> bool:
+        return bool(await self.client.exists(key))
+    
+    async def release(self, key: str):
+        await self.client.delete(key)
+    
+    async def publish(self, channel: str, message: str):
+        await self.client.publish(channel, message)
+    
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                data = message.get("data")
+                yield data.decode() if isinstance(data, bytes) else data
+        finally:
+            await pubsub.aclose()
+
+
+class DocumentCache:
+    """
+    Two-level read-through cache for Firestore documents.
+    L1 is an in-process LRU with a short TTL; L2 is shared by all workers
+    (Redis, or LocalBackend). Writes go to Firestore first and are then
+    mirrored into both levels (merge()) or dropped from them (invalidate());
+    either way the other workers are told over pub/sub to drop their L1
+    copy, so they re-read from L2 rather than from Firestore.
+    
+    Stampede protection: concurrent misses in one process share a single
+    load, and across processes a short L2 lock lets one worker load while
+    the rest wait briefly for its result. A load that overlaps a write is
+    returned but not cached, in either level. Any L2 failure degrades to
+    reading Firestore directly. Missing documents are cached too, for
+    negative_ttl seconds; code that creates a document must invalidate() it.
+    """
+    
+    def __init__(
+        self,
+        namespace: str,
+        backend,
+        max_entries: int = 10000,
+        local_ttl: float = 30.0,
+        shared_ttl: float = 3600.0,
+        lock_timeout: float = 2.0,
+        negative_ttl: float = 5.0,
+    ):
+        self.namespace = namespace
+        self.backend = backend
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.lock_timeout = lock_timeout
+        self.negative_ttl = negative_ttl
+        self.channel = f"cache:{namespace}:invalidate"
+        self.instance_id = uuid.uuid4().hex
+        self._local: "OrderedDict[str, tuple[float, Dict]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._dirty: set = set()  # written while a load was in flight
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.errors = 0
+    
+    def _key(self, doc_id: str) -> str:
+        return f"cache:{self.namespace}:{doc_id}"
+    
+    def _remember(self, doc_id: str, doc: Dict):
+        ttl = self.local_ttl if doc is not _MISSING else min(self.local_ttl, self.negative_ttl)
+        self._local[doc_id] = (time.monotonic() + ttl, doc)
+        self._local.move_to_end(doc_id)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+    
+    async def get(self, doc_id: str, loader: Loader) -> Optional[Dict]:
+        """Cached document, loading it with `loader` on a miss (None is cached for negative_ttl)"""
+        entry = self._local.get(doc_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._local.move_to_end(doc_id)
+            self.local_hits += 1
+            return dict(entry[1]) if entry[1] is not _MISSING else None
+        
+        task = self._loading.get(doc_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._loading[doc_id] = asyncio.ensure_future(self._load(doc_id, loader))
+            task.add_done_callback(lambda _: self._loaded(doc_id))
+        doc = await asyncio.shield(task)
+        return dict(doc) if doc is not None else None
+    
+    def _loaded(self, doc_id: str):
+        self._loading.pop(doc_id, None)
+        self._dirty.discard(doc_id)
+    
+    def _forget(self, doc_id: str):
+        self._local.pop(doc_id, None)
+        if doc_id in self._loading:
+            self._dirty.add(doc_id)
+    
+    async def _load(self, doc_id: str, loader: Loader) -> Optional[Dict]:
+        key = self._key(doc_id)
+        lock_key = f"{key}:lock"
+        locked = False
+        generation = None
+        try:
+            generation = await self.backend.generation(key)
+            doc = await self._shared_get(key)
+            if doc is None:
+                locked = await self.backend.acquire(lock_key, self.lock_timeout)
+                if not locked:
+                    # Another worker is loading it; wait for its write before going to
+                    # Firestore, or until it lets go of the lock without writing
+                    deadline = time.monotonic() + self.lock_timeout
+                    while doc is None and time.monotonic() < deadline:
+                        await asyncio.sleep(0.05)
+                        held = await self.backend.locked(lock_key)
+                        doc = await self._shared_get(key)
+                        if not held:
+                            break
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared cache read failed: %s", e, extra=log_fields(e, cache=self.namespace))
+            doc = None
+        
+        if doc is not None:
+            self.shared_hits += 1
+            if doc_id not in self._dirty:
+                self._remember(doc_id, doc)
+            return doc if doc is not _MISSING else None
+        
+        try:
+            self.loads += 1
+            doc = await loader()
+            if (doc is not None or self.negative_ttl > 0) and doc_id not in self._dirty:
+                self._remember(doc_id, doc if doc is not None else _MISSING)
+                # Without the generation (L2 unreachable) the write could be stale; skip it
+                if generation is not None:
+                    if doc is not None:
+                        raw, ttl = _encode(doc), self.shared_ttl
+                    else:
+                        raw, ttl = _MISSING_RAW, self.negative_ttl
+                    try:
+                        await self.backend.set(key, raw, ttl, generation)
+                    except Exception as e:
+                        self.errors += 1
+                        logger.warning("Shared cache write failed: %s", e, extra=log_fields(e, cache=self.namespace))
+            return doc
+        finally:
+            if locked:
+                try:
+                    await self.backend.release(lock_key)
+                except Exception:
+                    pass  # expires on its own
+    
+    async def _shared_get(self, key: str) -> Optional[Dict]:
+        raw = await self.backend.get(key)
+        if raw is None:
+            return None
+        doc = _decode(raw)
+        return doc if doc is not None else _MISSING
+    
+    async def merge(self, doc_id: str, fields: Dict = None, increments: Dict = None, expect: Dict = None):
+        """
+        Mirror a write already applied in Firestore: set `fields`, add
+        `increments`, unless the cached copy does not match `expect`, in which
+        case it is dropped. Documents not cached stay uncached.
+        """
+        fields, increments, expect = fields or {}, increments or {}, expect or {}
+        entry = self._local.get(doc_id)
+        if entry is not None and (entry[1] is _MISSING or not _apply(entry[1], fields, increments, expect)):
+            self._local.pop(doc_id, None)
+        if doc_id in self._loading:
+            self._dirty.add(doc_id)
+        try:
+            await self.backend.merge(self._key(doc_id), fields, increments, expect)
+            await self._announce(doc_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared cache merge failed: %s", e, extra=log_fields(e, cache=self.namespace))
+            await self.invalidate(doc_id)
+    
+    async def invalidate(self, doc_id: str):
+        """Drop a document from both levels in every worker"""
+        self._forget(doc_id)
+        try:
+            await self.backend.delete(self._key(doc_id))
+            await self._announce(doc_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared cache invalidation failed: %s", e, extra=log_fields(e, cache=self.namespace))
+    
+    async def _announce(self, doc_id: str):
+        await self.backend.publish(self.channel, json.dumps({"origin": self.instance_id, "id": doc_id}))
+    
+    async def run(self):
+        """Background task: drop L1 copies other workers changed; reconnects on errors"""
+        while True:
+            try:
+                async for raw in self.backend.listen(self.channel):
+                    message = json.loads(raw)
+                    if message.get("origin") != self.instance_id:
+                        self._forget(message.get("id"))
+                        self.invalidations += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache invalidation listener failed: %s", e, extra=log_fields(e, cache=self.namespace))
+            # Messages may have been missed while disconnected
+            self._local.clear()
+            await asyncio.sleep(1)
+    
+    def stats(self) -> Dict:
+        lookups = self.local_hits + self.shared_hits + self.loads
+        return {
+            "size": len(self._local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "hit_rate": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_backend(redis_url: str = ""):
+    """RedisBackend for a configured redis_url, otherwise the in-process stand-in"""
+    client = get_redis(redis_url) if redis_url else None
+    if client is not None:
+        return RedisBackend(client)
+    return LocalBackend()
+
+
+def doc_cache_enabled() -> bool:
+    """On with a shared tier; without Redis only when explicitly enabled (single worker)"""
+    if settings.doc_cache_enabled is not None:
+        return settings.doc_cache_enabled
+    return bool(settings.redis_url)
@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import AsyncIterator, Dict
+import json
+import zlib
+from app.config import settings
+from app.services.firebase_service import FirebaseService, firebase_service
+from app.services.logger import get_logger, log_fields
+
+logger = get_logger("exporter")
+
+# Firestore field -> export field
+CHAT_EXPORT_FIELDS = {"title": "title", "createdAt": "created_at", "updatedAt": "updated_at"}
+MESSAGE_EXPORT_FIELDS = {"sender": "sender", "content": "content", "timestamp": "timestamp", "isVoice": "is_voice"}
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class TranscriptExporter:
+    """
+    Streams a user's chats and messages as NDJSON (optionally gzip).
+    Chats and messages are read from Firestore a page at a time and encoded
+    into chunks of about `chunk_bytes`, so memory stays flat regardless of
+    history size. Nothing is read ahead: the next page is only fetched once
+    the response has accepted the previous chunk, so a slow client slows the
+    reads instead of growing a buffer.
+    
+    Lines, in order: one "export" header, then each "chat" followed by its
+    "message" lines, then an "end" line with the totals (or "error" if the
+    export was cut short, so a truncated file is recognisable).
+    """
+    
+    def __init__(self, firebase: FirebaseService = None, page_size: int = 200, chunk_bytes: int = 65536):
+        self.firebase = firebase or firebase_service
+        self.page_size = page_size
+        self.chunk_bytes = chunk_bytes
+    
+    async def records(self, user_id: str) -> AsyncIterator[Dict]:
+        yield {"type": "export", "user_id": user_id, "exported_at": datetime.utcnow()}
+        chats = messages = 0
+        try:
+            async for chat in self.firebase.iter_chats(user_id, self.page_size):
+                chats += 1
+                yield {"type": "chat", "chat_id": chat["chatId"], **_rename(chat, CHAT_EXPORT_FIELDS)}
+                async for message in self.firebase.iter_messages(chat["chatId"], self.page_size):
+                    messages += 1
+                    yield {
+                        "type": "message",
+                        "chat_id": chat["chatId"],
+                        "message_id": message["messageId"],
+                        **_rename(message, MESSAGE_EXPORT_FIELDS),
+                    }
+        except Exception as e:
+            logger.error("Export interrupted: %s", e, extra=log_fields(e, user_id=user_id, chats=chats, messages=messages))
+            yield {"type": "error", "message": "Export interrupted, please try again", "chats": chats, "messages": messages}
+            return
+        yield {"type": "end", "chats": chats, "messages": messages}
+    
+    async def stream(self, user_id: str, compress: bool = False) -> AsyncIterator[bytes]:
+        """Response body chunks for a user's export"""
+        # wbits=31 writes a gzip container rather than a raw zlib stream
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = bytearray()
+        
+        async for record in self.records(user_id):
+            buffer += json.dumps(record, default=_json_default, ensure_ascii=False).encode()
+            buffer += b"\n"
+            if len(buffer) >= self.chunk_bytes:
+                chunk = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+                buffer.clear()
+                if chunk:
+                    yield chunk
+        
+        chunk = bytes(buffer)
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+
+
+def _rename(data: Dict, fields: Dict[str, str]) -> Dict:
+    return {name: data[key] for key, name in fields.items() if key in data}
+
+
+transcript_exporter = TranscriptExporter(
+    page_size=settings.export_page_size,
+    chunk_bytes=settings.export_chunk_bytes,
+)
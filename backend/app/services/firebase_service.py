@@ -1,19 +1,104 @@
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
-from typing import Optional, Dict, List
+import asyncio
+import random
+import threading
+from typing import AsyncIterator, Optional, Dict, List, Set, Tuple
 from app.config import settings
-from datetime import datetime
+from app.services.token_cache import TokenCache
+from app.services.doc_cache import DocumentCache, build_backend, doc_cache_enabled
+from app.services.metrics import stage
+from app.services.logger import get_logger, log_fields
+from datetime import datetime, timedelta
+
+
+def usage_date() -> str:
+    """Current daily usage bucket (UTC calendar day)"""
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def daily_usage(user_data: Optional[Dict], today: Optional[str] = None) -> int:
+    """
+    Today's usage from a user document.
+    Counters stamped with an earlier usageDate count as zero; documents
+    without usageDate predate date-keyed counters and are read as-is.
+    """
+    if not user_data:
+        return 0
+    stamped = user_data.get("usageDate")
+    if stamped and stamped != (today or usage_date()):
+        return 0
+    return user_data.get("dailyUsage", 0)
+
+
+logger = get_logger("firebase")
+
+
+class UsageContention(Exception):
+    """Raised by reserve_usage when concurrent requests keep aborting the user's transaction"""
+
+
+class ChatUnavailable(Exception):
+    """Raised when a chat's owner could not be read, so access can be neither granted nor refused"""
+    
+    retry_after = 1
+
+
+def _is_contention(error: Exception) -> bool:
+    """Transaction aborted by contention (async_transactional wraps its last abort in a ValueError)"""
+    from google.api_core.exceptions import Aborted
+    return isinstance(error, Aborted) or isinstance(error.__cause__, Aborted)
+
+
+def _is_unavailable(error: Exception) -> bool:
+    """Firestore could not be reached or did not answer in time"""
+    from google.api_core.exceptions import DeadlineExceeded, InternalServerError, RetryError, ServiceUnavailable
+    return isinstance(
+        error,
+        (DeadlineExceeded, InternalServerError, RetryError, ServiceUnavailable, ConnectionError, asyncio.TimeoutError),
+    )
+
+
+# firestore Query.DESCENDING; firebase_admin is only imported once it is needed
+DESCENDING = "DESCENDING"
+
+# Chat fields read for every message: owner, running summary and the
+# timestamp of the last message folded into it
+CHAT_META_FIELDS = ["userId", "summary", "summaryThrough"]
 
 
 class FirebaseService:
+    RESERVE_ATTEMPTS = 3  # rounds of transaction attempts before a reservation counts as contended
+    
     def __init__(self):
         self._initialized = False
+        self._init_lock = threading.Lock()
         self._db = None
+        self.token_cache = TokenCache(max_size=settings.token_cache_size)
+        # users/{uid} and chat metadata, shared across workers through Redis when configured
+        self.user_cache: Optional[DocumentCache] = None
+        self.chat_cache: Optional[DocumentCache] = None
+        if doc_cache_enabled():
+            backend = build_backend(settings.redis_url)
+            options = dict(
+                backend=backend,
+                max_entries=settings.doc_cache_size,
+                local_ttl=settings.doc_cache_local_ttl,
+                negative_ttl=settings.doc_cache_negative_ttl,
+            )
+            # User docs can change outside the app (see README), so they expire sooner
+            self.user_cache = DocumentCache("users", shared_ttl=settings.doc_cache_user_ttl, **options)
+            self.chat_cache = DocumentCache("chats", shared_ttl=settings.doc_cache_shared_ttl, **options)
     
     def _initialize(self):
-        """Initialize Firebase Admin SDK"""
+        """Initialize Firebase Admin SDK (the warm-up does this before the first request)"""
         if self._initialized:
             return
+        with self._init_lock:
+            if not self._initialized:
+                self._initialize_sdk()
+    
+    def _initialize_sdk(self):
+        import firebase_admin
+        from firebase_admin import credentials, firestore_async
         
         try:
             # Check if already initialized
@@ -33,7 +118,9 @@ class FirebaseService:
                 # Use default credentials (for local development)
                 firebase_admin.initialize_app()
         
-        self._db = firestore.client()
+        # Async client: every read/write is awaited on the event loop instead of
+        # blocking the worker for a full Firestore round-trip.
+        self._db = firestore_async.client()
         self._initialized = True
     
     @property
@@ -42,111 +129,534 @@ class FirebaseService:
             self._initialize()
         return self._db
     
+    async def warm_up(self):
+        """
+        Initialize the SDK and open the Firestore channel ahead of traffic.
+        Credential loading is blocking, so it runs in a thread; the read of a
+        (possibly missing) document makes the client connect.
+        """
+        await asyncio.to_thread(self._initialize)
+        await self.db.collection("maintenance").document("warmup").get()
+    
     async def verify_token(self, token: str) -> Optional[Dict]:
         """Verify Firebase ID token"""
+        with stage("auth"):
+            cached = self.token_cache.get(token)
+            if cached:
+                return cached
+            
+            self._initialize()
+            from firebase_admin import auth
+            try:
+                # Signature check (and occasional cert fetch) is blocking; keep it off the loop
+                decoded = await asyncio.to_thread(auth.verify_id_token, token)
+                user = {"uid": decoded["uid"], "email": decoded.get("email"), "exp": decoded["exp"]}
+                self.token_cache.put(token, user, decoded["exp"])
+                return user
+            except Exception as e:
+                logger.warning("Token verification failed: %s", e, extra=log_fields(e, stage="auth"))
+                return None
+    
+    def _fetch_signing_certs(self):
+        """Force-refresh Google's ID token signing certs in firebase_admin's HTTP cache"""
         self._initialize()
+        import firebase_admin
+        from firebase_admin import auth, _token_gen
+        verifier = auth._get_client(firebase_admin.get_app())._token_verifier
+        # no-cache bypasses the cached copy and stores the fresh response for verify_id_token
+        verifier.request(
+            _token_gen.ID_TOKEN_CERT_URI,
+            method="GET",
+            headers={"Cache-Control": "no-cache"},
+        )
+    
+    async def prefetch_signing_certs(self) -> bool:
+        """Download signing certs ahead of time so no request pays for the fetch"""
         try:
-            decoded = auth.verify_id_token(token)
-            return {"uid": decoded["uid"], "email": decoded.get("email")}
+            await asyncio.to_thread(self._fetch_signing_certs)
+            return True
         except Exception as e:
-            print(f"Token verification failed: {e}")
-            return None
+            logger.warning("Signing cert prefetch failed: %s", e, extra=log_fields(e))
+            return False
+    
+    async def run_cache_invalidation(self):
+        """Background task: apply other workers' cache invalidations"""
+        caches = [cache for cache in (self.user_cache, self.chat_cache) if cache]
+        await asyncio.gather(*(cache.run() for cache in caches))
+    
+    async def run_cert_refresher(self, interval: int):
+        """Background task: prefetch signing certs every `interval` seconds (the warm-up fetches the first)"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.prefetch_signing_certs()
     
     async def get_user(self, user_id: str) -> Optional[Dict]:
-        """Get user data from Firestore"""
+        """Get user data (through the document cache when enabled)"""
         try:
-            doc = self.db.collection("users").document(user_id).get()
-            if doc.exists:
-                return doc.to_dict()
-            return None
+            if self.user_cache:
+                return await self.user_cache.get(user_id, lambda: self._read_user(user_id))
+            return await self._read_user(user_id)
         except Exception as e:
-            print(f"Error fetching user: {e}")
+            logger.error("Error fetching user: %s", e, extra=log_fields(e, user_id=user_id))
             return None
     
+    async def _read_user(self, user_id: str) -> Optional[Dict]:
+        doc = await self.db.collection("users").document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+    
     async def update_user(self, user_id: str, data: Dict) -> bool:
         """Update user data in Firestore"""
         try:
-            self.db.collection("users").document(user_id).update(data)
+            await self.db.collection("users").document(user_id).update(data)
+            if self.user_cache:
+                # Tier changes must reach every worker; the next read reloads the doc
+                await self.user_cache.invalidate(user_id)
             return True
         except Exception as e:
-            print(f"Error updating user: {e}")
+            logger.error("Error updating user: %s", e, extra=log_fields(e, user_id=user_id))
             return False
     
     async def increment_usage(self, user_id: str) -> bool:
         """Increment daily usage count"""
         try:
-            user_ref = self.db.collection("users").document(user_id)
-            user_ref.update({"dailyUsage": firestore.Increment(1)})
+            await self._adjust_usage(user_id, 1)
             return True
         except Exception as e:
-            print(f"Error incrementing usage: {e}")
+            logger.error("Error incrementing usage: %s", e, extra=log_fields(e, user_id=user_id))
             return False
     
-    async def get_chats(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """Get user's chat history"""
+    async def reserve_usage(self, user_id: str, limit: int) -> tuple[bool, Optional[int]]:
+        """
+        Atomically take one daily usage slot if the user is below `limit`.
+        Runs as a Firestore transaction so concurrent requests cannot overshoot.
+        Transactions aborted by contention on the user document are retried
+        with backoff, then UsageContention is raised: the request is refused
+        rather than let through uncounted.
+        Returns (is_allowed, current_count). current_count is None when
+        Firestore was unavailable and the request was let through without
+        taking a slot.
+        """
+        for attempt in range(1, self.RESERVE_ATTEMPTS + 1):
+            try:
+                return await self._adjust_usage(user_id, 1, limit)
+            except Exception as e:
+                if _is_contention(e):
+                    if attempt < self.RESERVE_ATTEMPTS:
+                        await asyncio.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+                        continue
+                    logger.warning("Usage reservation contended: %s", e, extra=log_fields(e, user_id=user_id, stage="quota"))
+                    raise UsageContention(str(e)) from e
+                if not _is_unavailable(e):
+                    raise
+                # Fail open like the read-based check did when Firestore was unavailable
+                logger.error("Error reserving usage: %s", e, extra=log_fields(e, user_id=user_id, stage="quota"))
+                return True, None
+    
+    async def release_usage(self, user_id: str) -> bool:
+        """Refund a usage slot taken by reserve_usage"""
+        try:
+            await self._adjust_usage(user_id, -1)
+            return True
+        except Exception as e:
+            logger.error("Error releasing usage: %s", e, extra=log_fields(e, user_id=user_id))
+            return False
+    
+    async def _adjust_usage(
+        self, user_id: str, delta: int, limit: Optional[int] = None
+    ) -> tuple[bool, int]:
+        """
+        Apply `delta` to today's usage counter inside a transaction.
+        A counter from an earlier usageDate is treated as zero, so the daily
+        reset happens lazily on the first write of the day.
+        """
+        from firebase_admin import firestore_async
+        user_ref = self.db.collection("users").document(user_id)
+        today = usage_date()
+        
+        @firestore_async.async_transactional
+        async def adjust(transaction):
+            snapshot = await user_ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else None
+            current = daily_usage(data, today)
+            
+            if limit is not None and current >= limit:
+                return False, current
+            if delta < 0 and (data or {}).get("usageDate", today) != today:
+                # Refund for a slot taken before the day rolled over; nothing to undo
+                return True, current
+            
+            current = max(0, current + delta)
+            transaction.set(user_ref, {"dailyUsage": current, "usageDate": today}, merge=True)
+            return True, current
+        
+        allowed, current = await adjust(self.db.transaction())
+        if allowed and self.user_cache:
+            await self.user_cache.merge(user_id, fields={"dailyUsage": current, "usageDate": today})
+        return allowed, current
+    
+    async def write_usage_deltas(
+        self, deltas: Dict[str, int], stamped: Set[str], shards: int = 0
+    ) -> Set[str]:
+        """
+        Write coalesced usage deltas, returning the user ids that failed.
+        Users in `stamped` already carry today's usageDate and get a plain
+        Increment in a batch; the rest go through the rollover-safe
+        transaction. With `shards`, deltas land on a random per-day shard
+        document under the user instead of the user document itself.
+        """
+        from firebase_admin import firestore_async
+        today = usage_date()
+        groups = []  # (user_ids, awaitable)
+        batched = []
+        
+        for user_id, delta in deltas.items():
+            user_ref = self.db.collection("users").document(user_id)
+            if shards:
+                shard_ref = user_ref.collection("usageShards").document(f"{today}-{random.randrange(shards)}")
+                batched.append((user_id, shard_ref, {
+                    "count": firestore_async.Increment(delta),
+                    "date": today,
+                    # For a Firestore TTL policy on usageShards.expireAt
+                    "expireAt": datetime.utcnow() + timedelta(days=2),
+                }))
+            elif user_id in stamped:
+                batched.append((user_id, user_ref, {
+                    "dailyUsage": firestore_async.Increment(delta),
+                    "usageDate": today,
+                }))
+            else:
+                groups.append(([user_id], self._adjust_usage(user_id, delta)))
+        
+        # Stay under Firestore's 500-writes-per-batch limit
+        for i in range(0, len(batched), 500):
+            chunk = batched[i:i + 500]
+            batch = self.db.batch()
+            for _, ref, data in chunk:
+                batch.set(ref, data, merge=True)
+            groups.append(([user_id for user_id, _, _ in chunk], batch.commit()))
+        
+        results = await asyncio.gather(*(aw for _, aw in groups), return_exceptions=True)
+        
+        failed = set()
+        for (user_ids, _), result in zip(groups, results):
+            if isinstance(result, Exception):
+                logger.error("Error writing usage: %s", result, extra=log_fields(result, users=len(user_ids)))
+                failed.update(user_ids)
+        
+        if self.user_cache and not shards:
+            # Mirror the batched increments; a cached doc from an earlier day is dropped instead
+            await asyncio.gather(*(
+                self.user_cache.merge(user_id, increments={"dailyUsage": deltas[user_id]}, expect={"usageDate": today})
+                for user_id, _, _ in batched if user_id not in failed
+            ))
+        return failed
+    
+    async def get_sharded_usage(self, user_id: str) -> int:
+        """Sum today's usage shards for a user"""
         try:
             docs = (
+                self.db.collection("users").document(user_id)
+                .collection("usageShards")
+                .where("date", "==", usage_date())
+                .stream()
+            )
+            return sum([(doc.to_dict() or {}).get("count", 0) async for doc in docs])
+        except Exception as e:
+            logger.error("Error fetching usage shards: %s", e, extra=log_fields(e, user_id=user_id))
+            return 0
+    
+    async def commit_writes(self, writes: List[tuple]):
+        """Commit (path, data, merge) document writes in a single batch; raises on failure"""
+        batch = self.db.batch()
+        for path, data, merge in writes:
+            batch.set(self.db.document(path), data, merge=merge)
+        await batch.commit()
+        if self.chat_cache:
+            # userId is only written when a chat is created; drop any cached "missing" copy
+            created = [path.split("/", 1)[1] for path, data, _ in writes if path.startswith("chats/") and "userId" in data]
+            await asyncio.gather(*(self.chat_cache.invalidate(chat_id) for chat_id in created))
+    
+    async def get_chats(
+        self,
+        user_id: str,
+        limit: int = 50,
+        start_after: Optional[Tuple[datetime, str]] = None,
+        field_paths: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """Get user's chats, most recently updated first, after an (updatedAt, chat ID) cursor"""
+        try:
+            query = (
                 self.db.collection("chats")
                 .where("userId", "==", user_id)
-                .order_by("updatedAt", direction=firestore.Query.DESCENDING)
-                .limit(limit)
-                .stream()
+                .order_by("updatedAt", direction=DESCENDING)
+                .order_by("__name__", direction=DESCENDING)
             )
+            if start_after:
+                query = query.start_after({"updatedAt": start_after[0], "__name__": start_after[1]})
+            if field_paths:
+                query = query.select(field_paths)
             
             chats = []
-            for doc in docs:
+            async for doc in query.limit(limit).stream():
                 data = doc.to_dict()
                 data["chatId"] = doc.id
-                # Convert timestamps
-                if data.get("createdAt"):
-                    data["createdAt"] = data["createdAt"]
-                if data.get("updatedAt"):
-                    data["updatedAt"] = data["updatedAt"]
                 chats.append(data)
             
             return chats
         except Exception as e:
-            print(f"Error fetching chats: {e}")
+            logger.error("Error fetching chats: %s", e, extra=log_fields(e, user_id=user_id))
             return []
     
-    async def get_messages(self, chat_id: str, limit: int = 50) -> List[Dict]:
-        """Get messages for a chat"""
+    async def get_messages(
+        self,
+        chat_id: str,
+        limit: int = 50,
+        start_after: Optional[Tuple[datetime, str]] = None,
+        field_paths: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """Get messages for a chat, oldest first, after a (timestamp, message ID) cursor"""
         try:
-            docs = (
+            query = (
                 self.db.collection("messages")
                 .where("chatId", "==", chat_id)
                 .order_by("timestamp")
-                .limit(limit)
-                .stream()
+                .order_by("__name__")
             )
+            if start_after:
+                query = query.start_after({"timestamp": start_after[0], "__name__": start_after[1]})
+            if field_paths:
+                query = query.select(field_paths)
             
             messages = []
-            for doc in docs:
+            async for doc in query.limit(limit).stream():
                 data = doc.to_dict()
                 data["messageId"] = doc.id
                 messages.append(data)
             
             return messages
         except Exception as e:
-            print(f"Error fetching messages: {e}")
+            logger.error("Error fetching messages: %s", e, extra=log_fields(e, chat=chat_id))
             return []
     
-    async def reset_daily_usage(self) -> int:
-        """Reset daily usage for all users (run via cron job)"""
+    async def iter_chats(self, user_id: str, page_size: int = 200) -> AsyncIterator[Dict]:
+        """Yield all of a user's chats, newest first, reading one page at a time"""
+        query = (
+            self.db.collection("chats")
+            .where("userId", "==", user_id)
+            .order_by("updatedAt", direction=DESCENDING)
+            .order_by("__name__", direction=DESCENDING)
+        )
+        async for chat in self._paginate(query, "updatedAt", "chatId", page_size):
+            yield chat
+    
+    async def iter_messages(self, chat_id: str, page_size: int = 200) -> AsyncIterator[Dict]:
+        """Yield all messages of a chat, oldest first, reading one page at a time"""
+        query = (
+            self.db.collection("messages")
+            .where("chatId", "==", chat_id)
+            .order_by("timestamp")
+            .order_by("__name__")
+        )
+        async for message in self._paginate(query, "timestamp", "messageId", page_size):
+            yield message
+    
+    async def _paginate(self, query, sort_field: str, id_key: str, page_size: int) -> AsyncIterator[Dict]:
+        # Each page is read in full before yielding so no Firestore stream stays
+        # open while the consumer is slow; memory is bounded by one page
+        cursor = None
+        while True:
+            page = query.start_after(cursor) if cursor else query
+            rows = []
+            async for doc in page.limit(page_size).stream():
+                data = doc.to_dict()
+                data[id_key] = doc.id
+                rows.append(data)
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            cursor = {sort_field: rows[-1][sort_field], "__name__": rows[-1][id_key]}
+    
+    async def get_chat_owner(self, chat_id: str) -> Optional[str]:
+        """User ID a chat belongs to, or None if it does not exist"""
+        return (await self.get_chat_meta(chat_id) or {}).get("userId")
+    
+    async def get_chat_meta(self, chat_id: str) -> Optional[Dict]:
+        """
+        A chat's owner and running summary (through the document cache when
+        enabled), or None if it does not exist. Raises ChatUnavailable if it
+        could not be read: a failed read must not pass for a missing chat.
+        """
+        async def read():
+            doc = await self.db.collection("chats").document(chat_id).get(field_paths=CHAT_META_FIELDS)
+            return doc.to_dict() if doc.exists else None
+        
         try:
-            batch = self.db.batch()
-            users = self.db.collection("users").stream()
+            if self.chat_cache:
+                return await self.chat_cache.get(chat_id, read)
+            return await read()
+        except Exception as e:
+            logger.error("Error fetching chat: %s", e, extra=log_fields(e, chat=chat_id, stage="history"))
+            raise ChatUnavailable(str(e)) from e
+    
+    async def claim_chat(self, chat_id: str, user_id: str, data: Dict) -> Optional[Dict]:
+        """
+        Create a chat owned by `user_id` with `data`, unless it already exists.
+        Returns the chat's owner and summary either way. The create is
+        conditional on the document not existing, so once a chat has an owner
+        no other user can take it over. Raises ChatUnavailable if it fails.
+        """
+        from google.api_core.exceptions import AlreadyExists
+        ref = self.db.collection("chats").document(chat_id)
+        try:
+            try:
+                await ref.create({**data, "userId": user_id})
+                meta = {"userId": user_id}
+            except AlreadyExists:
+                doc = await ref.get(field_paths=CHAT_META_FIELDS)
+                meta = doc.to_dict() if doc.exists else None
+        except Exception as e:
+            logger.error("Error creating chat: %s", e, extra=log_fields(e, user_id=user_id, chat=chat_id))
+            raise ChatUnavailable(str(e)) from e
+        if self.chat_cache:
+            await self.chat_cache.invalidate(chat_id)
+        return meta
+    
+    async def get_recent_messages(self, chat_id: str, limit: int = 10) -> List[Dict]:
+        """Get the newest `limit` messages of a chat (sender/content/timestamp only), oldest first"""
+        try:
+            docs = (
+                self.db.collection("messages")
+                .where("chatId", "==", chat_id)
+                .order_by("timestamp", direction=DESCENDING)
+                .limit(limit)
+                .select(["sender", "content", "timestamp"])
+                .stream()
+            )
+            
+            messages = [doc.to_dict() async for doc in docs]
+            messages.reverse()
+            return messages
+        except Exception as e:
+            logger.error("Error fetching recent messages: %s", e, extra=log_fields(e, chat=chat_id, stage="history"))
+            return []
+    
+    async def get_chat_summary(self, chat_id: str) -> str:
+        """Get the running conversation summary stored on a chat"""
+        try:
+            return (await self.get_chat_meta(chat_id) or {}).get("summary", "")
+        except Exception as e:
+            logger.error("Error fetching chat summary: %s", e, extra=log_fields(e, chat=chat_id, stage="history"))
+            return ""
+    
+    async def update_chat(self, chat_id: str, data: Dict) -> bool:
+        """Merge fields into a chat document"""
+        try:
+            await self.db.collection("chats").document(chat_id).set(data, merge=True)
+            if self.chat_cache and "summary" in data:
+                await self.chat_cache.merge(chat_id, fields={"summary": data["summary"]})
+            return True
+        except Exception as e:
+            logger.error("Error updating chat: %s", e, extra=log_fields(e, chat=chat_id))
+            return False
+    
+    async def save_chat_summary(self, chat_id: str, user_id: str, data: Dict) -> bool:
+        """
+        Store running-summary fields on a chat owned by `user_id`. A chat with
+        no document (its messages are stored by the client, if at all) is left
+        alone: writing one would create a chat without an owner, which then
+        refuses the user's next message. Returns whether it was written.
+        """
+        try:
+            meta = await self.get_chat_meta(chat_id)
+            if meta is None or meta.get("userId") != user_id:
+                return False
+            # update() fails instead of recreating a chat deleted in the meantime
+            await self.db.collection("chats").document(chat_id).update(data)
+            if self.chat_cache:
+                await self.chat_cache.merge(chat_id, fields={key: data[key] for key in CHAT_META_FIELDS if key in data})
+            return True
+        except Exception as e:
+            logger.error("Error saving chat summary: %s", e, extra=log_fields(e, user_id=user_id, chat=chat_id))
+            return False
+    
+    async def reset_daily_usage(
+        self,
+        chunk_size: int = 400,
+        concurrency: int = 4,
+        resume: bool = True,
+    ) -> int:
+        """
+        Reset daily usage for users still on the legacy schema (run via cron job).
+        
+        Counters stamped with a usageDate reset lazily and are skipped; every
+        legacy document that gets reset is stamped too, so each run migrates
+        more of the collection. Users are paged by document id in chunks below
+        Firestore's 500-writes-per-batch limit, `concurrency` batches are
+        committed in parallel, and progress is checkpointed so an interrupted
+        run resumes where it stopped on the same day.
+        """
+        today = usage_date()
+        progress_ref = self.db.collection("maintenance").document("usageReset")
+        
+        try:
+            cursor = None
+            if resume:
+                progress = await progress_ref.get()
+                if progress.exists and progress.to_dict().get("date") == today:
+                    cursor = progress.to_dict().get("cursor")
+                    if cursor is None:
+                        return 0  # Already completed today
             
             count = 0
-            for user in users:
-                batch.update(user.reference, {"dailyUsage": 0})
-                count += 1
+            while True:
+                # Read the next wave of chunks, then commit them in parallel
+                wave = []
+                for _ in range(concurrency):
+                    query = (
+                        self.db.collection("users")
+                        .order_by("__name__")
+                        .select(["usageDate"])
+                        .limit(chunk_size)
+                    )
+                    if cursor:
+                        query = query.start_after({"__name__": cursor})
+                    
+                    docs = [doc async for doc in query.stream()]
+                    if not docs:
+                        break
+                    cursor = docs[-1].id
+                    wave.append([d.reference for d in docs if not (d.to_dict() or {}).get("usageDate")])
+                    if len(docs) < chunk_size:
+                        break
+                
+                if not wave:
+                    break
+                
+                results = await asyncio.gather(*(self._reset_chunk(refs, today) for refs in wave))
+                count += sum(results)
+                await progress_ref.set({"date": today, "cursor": cursor})
+                
+                if len(wave) < concurrency or not results:
+                    break
             
-            batch.commit()
+            await progress_ref.set({"date": today, "cursor": None})
             return count
         except Exception as e:
-            print(f"Error resetting usage: {e}")
+            logger.error("Error resetting usage: %s", e, extra=log_fields(e))
+            return 0
+    
+    async def _reset_chunk(self, refs: List, today: str) -> int:
+        """Reset and date-stamp one chunk of user documents in a single batch"""
+        if not refs:
             return 0
+        batch = self.db.batch()
+        for ref in refs:
+            batch.update(ref, {"dailyUsage": 0, "usageDate": today})
+        await batch.commit()
+        if self.user_cache:
+            await asyncio.gather(*(self.user_cache.invalidate(ref.id) for ref in refs))
+        return len(refs)
 
 
 firebase_service = FirebaseService()
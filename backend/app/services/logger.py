@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import copy
+import hashlib
+import json
+import logging
+import queue
+import sys
+import time
+from app.config import settings
+
+# Set per request (RequestContextMiddleware, get_current_user, the chat router) and
+# stamped onto every record logged while handling it
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+user_hash: ContextVar[Optional[str]] = ContextVar("user_hash", default=None)
+chat_id: ContextVar[Optional[str]] = ContextVar("chat_id", default=None)
+
+
+def hash_user_id(user_id: str) -> str:
+    """Stable, non-reversible user identifier for logs"""
+    return hashlib.sha256(user_id.encode()).hexdigest()[:12]
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"chatmate.{name}")
+
+
+def bind(user_id: str = None, chat: str = None):
+    """Attach the user and/or chat to log records for the rest of the current request"""
+    if user_id:
+        user_hash.set(hash_user_id(user_id))
+    if chat:
+        chat_id.set(chat)
+
+
+def log_fields(
+    error: Exception = None,
+    user_id: str = None,
+    chat: str = None,
+    stage: str = None,
+    latency_ms: float = None,
+    **fields,
+) -> Dict:
+    """`extra=` for a structured record; unset fields are left out of the JSON"""
+    if error is not None:
+        fields["error_class"] = type(error).__name__
+    if user_id:
+        fields["user"] = hash_user_id(user_id)
+    if chat:
+        fields["chat_id"] = chat
+    if stage:
+        fields["stage"] = stage
+    if latency_ms is not None:
+        fields["latency_ms"] = round(latency_ms, 1)
+    return {"fields": fields}
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request context onto the record in the calling task"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.user = user_hash.get()
+        record.chat_id = chat_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets each distinct warning/error (logger, message template, error class)
+    through at most `burst` times per `window` seconds. The number dropped is
+    reported as `suppressed` on the next record that gets through, so an
+    outage logs a handful of lines per minute instead of one per request.
+    """
+    
+    def __init__(self, burst: int = 5, window: float = 60.0, max_keys: int = 1000):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [window start, records passed, records suppressed]
+        self._seen: OrderedDict = OrderedDict()
+        self.suppressed = 0
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        fields = getattr(record, "fields", {})
+        key = (record.name, record.levelno, record.msg, fields.get("error_class"))
+        now = time.monotonic()
+        entry = self._seen.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            if entry and entry[2]:
+                record.fields = {**fields, "suppressed": entry[2]}
+            self._seen[key] = [now, 1, 0]
+            self._seen.move_to_end(key)
+            if len(self._seen) > self.max_keys:
+                self._seen.popitem(last=False)
+            return True
+        if entry[1] < self.burst:
+            entry[1] += 1
+            return True
+        entry[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; drops (and counts) when the queue is full"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now (args may change later); JSON encoding happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if getattr(record, "user", None):
+            entry["user"] = record.user
+        if getattr(record, "chat_id", None):
+            entry["chat_id"] = record.chat_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class LogPipeline:
+    """
+    Owns the queue, handler and listener thread behind the "chatmate"
+    logger. Request code only pays for filtering and a put_nowait; the
+    stdout write happens on the listener thread. Outside start()/stop()
+    (scripts, import time) records are written synchronously instead.
+    """
+    
+    def __init__(self, level: str = "INFO", max_queue: int = 10000, dedup_burst: int = 5, dedup_window: float = 60.0):
+        self.handler = NonBlockingQueueHandler(queue.Queue(maxsize=max_queue))
+        self.handler.addFilter(ContextFilter())
+        self.rate_limit = RateLimitFilter(burst=dedup_burst, window=dedup_window)
+        self.handler.addFilter(self.rate_limit)
+        
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.handler.queue, output)
+        
+        # Same format, written on the calling thread, while the listener is not running
+        self.fallback = logging.StreamHandler(sys.stdout)
+        self.fallback.setFormatter(JsonFormatter())
+        self.fallback.addFilter(ContextFilter())
+        self.fallback.addFilter(self.rate_limit)
+        
+        self.logger = logging.getLogger("chatmate")
+        self.logger.setLevel(level.upper())
+        self.logger.propagate = False
+        self.logger.addHandler(self.fallback)
+        self._started = False
+    
+    def start(self):
+        if not self._started:
+            self.listener.start()
+            self.logger.addHandler(self.handler)
+            self.logger.removeHandler(self.fallback)
+            self._started = True
+    
+    def stop(self):
+        """Flush queued records and stop the listener thread"""
+        if self._started:
+            self.logger.addHandler(self.fallback)
+            self.logger.removeHandler(self.handler)
+            self.listener.stop()
+            self._started = False
+    
+    def stats(self) -> Dict:
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "suppressed": self.rate_limit.suppressed,
+        }
+
+
+log_pipeline = LogPipeline(
+    level=settings.log_level,
+    max_queue=settings.log_queue_size,
+    dedup_burst=settings.log_dedup_burst,
+    dedup_window=settings.log_dedup_window,
+)
@@ -0,0 +1,171 @@
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+import random
+import time
+from app.config import settings
+from app.services.logger import get_logger, log_fields
+
+logger = get_logger("metrics")
+
+
+# Seconds; spans a cache hit (~µs) to a slow Gemini call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label set"""
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[tuple, list] = {}
+    
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            base = tuple(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(_series(f"{self.name}_bucket", base + (("le", bound),), cumulative))
+            lines.append(_series(f"{self.name}_sum", base, series[-1]))
+            lines.append(_series(f"{self.name}_count", base, cumulative))
+        return lines
+
+
+class RequestTimings:
+    """Stage durations for one request, shared by everything it awaits"""
+    
+    __slots__ = ("start", "stages", "sampled")
+    
+    def __init__(self, sampled: bool = False):
+        self.start = time.perf_counter()
+        self.stages: List[tuple] = []  # (stage, offset_ms, duration_ms)
+        self.sampled = sampled
+    
+    def totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.stages:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+    
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={duration:.1f}" for name, duration in self.totals().items())
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+class Metrics:
+    """
+    Per-stage latency histograms, request histograms, sampled request traces
+    and the counters services already keep in their stats(), rendered in
+    the Prometheus text format.
+    """
+    
+    def __init__(self, trace_sample_rate: float = 0.01, trace_buffer_size: int = 100):
+        self.trace_sample_rate = trace_sample_rate
+        self.stage_seconds = Histogram("chatmate_stage_seconds", "Time spent per request stage", ("stage",))
+        self.request_seconds = Histogram(
+            "chatmate_request_seconds", "HTTP request latency until the response starts", ("method", "route", "status")
+        )
+        self.traces = deque(maxlen=trace_buffer_size)
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+    
+    def register(self, component: str, collect: Callable[[], Dict]):
+        """Expose a component's stats() dict as gauges named chatmate_<component>_<key>"""
+        self._collectors[component] = collect
+    
+    def begin_request(self) -> RequestTimings:
+        timings = RequestTimings(sampled=random.random() < self.trace_sample_rate)
+        _current.set(timings)
+        return timings
+    
+    def end_request(self, timings: RequestTimings, method: str, route: str, status: int):
+        elapsed = time.perf_counter() - timings.start
+        self.request_seconds.observe(elapsed, method, route, str(status))
+        if timings.sampled:
+            self.traces.append({
+                "method": method,
+                "route": route,
+                "status": status,
+                "total_ms": round(elapsed * 1000, 2),
+                "stages": [
+                    {"stage": name, "offset_ms": round(offset, 2), "duration_ms": round(duration, 2)}
+                    for name, offset, duration in timings.stages
+                ],
+            })
+    
+    def stage(self, name: str) -> "_Stage":
+        """Time a block as a named stage of the current request (`with stage("model"):`)"""
+        return _Stage(self, name)
+    
+    def render(self) -> str:
+        lines = self.stage_seconds.render() + self.request_seconds.render()
+        for component, collect in self._collectors.items():
+            try:
+                lines += _gauges(f"chatmate_{component}", collect())
+            except Exception as e:
+                logger.error("Error collecting %s metrics: %s", component, e, extra=log_fields(e))
+        return "\n".join(lines) + "\n"
+
+
+class _Stage:
+    # A plain class rather than @contextmanager: roughly half the per-block cost
+    __slots__ = ("metrics", "name", "start")
+    
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+    
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        duration = end - self.start
+        self.metrics.stage_seconds.observe(duration, self.name)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages.append((self.name, (self.start - timings.start) * 1000, duration * 1000))
+
+
+def _series(name: str, labels: tuple, value) -> str:
+    if not labels:
+        return f"{name} {value}"
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" + f" {value}"
+
+
+def _gauges(prefix: str, stats: Dict, labels: tuple = ()) -> List[str]:
+    if stats and all(isinstance(v, dict) for v in stats.values()):
+        # Per-name stats (e.g. per route): the outer key becomes a label
+        return [line for name, inner in stats.items() for line in _gauges(prefix, inner, labels + (("name", name),))]
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines += [_series(name, labels + (("key", k),), v) for k, v in value.items() if isinstance(v, (int, float))]
+        elif isinstance(value, str):
+            lines.append(_series(name, labels + (("value", value),), 1))
+        elif isinstance(value, (int, float)):
+            lines.append(_series(name, labels, int(value) if isinstance(value, bool) else value))
+    return lines
+
+
+metrics = Metrics(
+    trace_sample_rate=settings.trace_sample_rate,
+    trace_buffer_size=settings.trace_buffer_size,
+)
+stage = metrics.stage
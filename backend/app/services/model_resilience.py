@@ -0,0 +1,230 @@
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+import asyncio
+import random
+import sys
+import time
+from app.config import settings
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream that is currently failing"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient upstream failures: throttling, 5xx, timeouts, dropped connections"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # httpx is loaded with the Gemini client; until then no error can come from it
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive upstream failures.
+    While open, calls fail immediately with CircuitOpen. After
+    `reset_timeout` seconds a single probe call is let through (half-open);
+    its outcome closes the circuit again or re-opens it.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.short_circuited = 0
+    
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+    
+    def before_call(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.short_circuited += 1
+                raise CircuitOpen("Gemini circuit open")
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                self.short_circuited += 1
+                raise CircuitOpen("Gemini circuit half-open, probe in flight")
+            self._probing = True
+    
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+    
+    def abandon(self):
+        """A call ended without an outcome (cancelled); let another probe through"""
+        self._probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opens += 1
+            self._probing = False
+
+
+class ResilientCaller:
+    """
+    Retry, deadline, hedging and circuit breaking around one upstream call.
+    Retryable failures are retried with full-jitter exponential backoff as
+    long as attempts and the overall `deadline` allow. With hedging on, a
+    second identical request is started once the first has been running
+    longer than the recent p95 latency of the same kind of call (operation
+    and model), and whichever finishes first wins.
+    """
+    
+    HEDGE_MIN_SAMPLES = 20
+    
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        deadline: float = 30.0,
+        hedge: bool = False,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        # Recent successful call latencies (seconds) per (operation, model)
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+    
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+    
+    def hedge_delay(self, key: Tuple[str, str] = ("call", "")) -> Optional[float]:
+        """Recent p95 latency of calls under `key`, once there are enough samples to trust it"""
+        latencies = self._latencies.get(key, ())
+        if len(latencies) < self.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+    
+    async def _hedged(self, fn: Callable[[], Awaitable[T]], delay: float) -> T:
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                # Slower than p95: race a second request against the first
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(fn()))
+            error = None
+            while done or pending:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        hedge: Optional[bool] = None,
+        key: Tuple[str, str] = ("call", ""),
+    ) -> T:
+        """
+        Call `fn` (a fresh request each time it is invoked) with retries.
+        `key` is (operation, model): latencies are tracked, and hedges timed,
+        separately for each.
+        """
+        self.breaker.before_call()
+        self.calls += 1
+        hedge = self.hedge if hedge is None else hedge
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        
+        while True:
+            attempt += 1
+            start = time.monotonic()
+            try:
+                delay = self.hedge_delay(key) if hedge else None
+                call = self._hedged(fn, delay) if delay is not None else fn()
+                result = await asyncio.wait_for(call, max(0.0, deadline - start))
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Upstream answered; the request itself was rejected
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                backoff = self._backoff(attempt)
+                if time.monotonic() + backoff >= deadline:
+                    self.deadline_exceeded += 1
+                    raise
+                if attempt >= self.max_attempts or self.breaker.is_open:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(backoff)
+                continue
+            
+            self.breaker.record_success()
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=200)
+            latencies.append(time.monotonic() - start)
+            return result
+    
+    def stats(self) -> Dict:
+        delays = {key: self.hedge_delay(key) for key in self._latencies}
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": {
+                ":".join(part for part in key if part): round(delay * 1000, 1)
+                for key, delay in delays.items() if delay is not None
+            },
+            "deadline_exceeded": self.deadline_exceeded,
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "short_circuited": self.breaker.short_circuited,
+        }
+
+
+model_resilience = ResilientCaller(
+    max_attempts=settings.gemini_retry_attempts,
+    base_delay=settings.gemini_retry_base_delay,
+    deadline=settings.gemini_deadline,
+    hedge=settings.gemini_hedge_enabled,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.gemini_breaker_threshold,
+        reset_timeout=settings.gemini_breaker_reset,
+    ),
+)
@@ -0,0 +1,208 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import json
+from app.config import settings
+from app.services.logger import get_logger, log_fields
+
+logger = get_logger("model_router")
+
+
+# First matching rule wins; the last rule should match everything
+DEFAULT_ROUTES = [
+    {
+        "name": "small-talk",
+        "max_message_chars": 80,
+        "max_history": 2,
+        "model": "gemini-2.0-flash-lite",
+        "max_output_tokens": 300,
+    },
+    {
+        "name": "premium-tutor",
+        "premium": True,
+        "tones": ["tutor"],
+        "model": "gemini-2.0-flash",
+        "max_output_tokens": 1500,
+        "fallback_model": "gemini-2.0-flash-lite",
+    },
+    {
+        "name": "premium",
+        "premium": True,
+        "model": "gemini-2.0-flash",
+        "max_output_tokens": 1000,
+        "fallback_model": "gemini-2.0-flash-lite",
+    },
+    {
+        "name": "default",
+        "model": "gemini-2.0-flash",
+        "max_output_tokens": 500,
+        "fallback_model": "gemini-2.0-flash-lite",
+    },
+]
+
+
+@dataclass
+class Route:
+    """One row of the routing table: match conditions and the model to use"""
+    name: str
+    model: str
+    max_output_tokens: int
+    fallback_model: Optional[str] = None
+    tones: Optional[List[str]] = None
+    premium: Optional[bool] = None
+    min_message_chars: int = 0
+    max_message_chars: Optional[int] = None
+    min_history: int = 0
+    max_history: Optional[int] = None
+    
+    def matches(self, tone: str, message_chars: int, history_size: int, is_premium: bool) -> bool:
+        return (
+            (self.tones is None or tone in self.tones)
+            and (self.premium is None or self.premium == is_premium)
+            and message_chars >= self.min_message_chars
+            and (self.max_message_chars is None or message_chars <= self.max_message_chars)
+            and history_size >= self.min_history
+            and (self.max_history is None or history_size <= self.max_history)
+        )
+
+
+@dataclass
+class RouteStats:
+    requests: int = 0
+    fallbacks: int = 0
+    errors: int = 0
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    models: Dict[str, int] = field(default_factory=dict)
+
+
+class ModelRouter:
+    """
+    Picks the model and output budget for each request from a rules table.
+    Rules match on tone, message length, history size and tier. Per-route
+    latency and token totals are kept so the table can be tuned against
+    real traffic.
+    """
+    
+    def __init__(self, routes: List[Dict] = None):
+        self.routes = [Route(**rule) for rule in (routes or DEFAULT_ROUTES)]
+        self._stats: Dict[str, RouteStats] = {route.name: RouteStats() for route in self.routes}
+    
+    def route(
+        self,
+        tone: str,
+        user_message: str,
+        conversation_history: List[Dict] = None,
+        is_premium: bool = False,
+    ) -> Route:
+        history_size = len(conversation_history or [])
+        for route in self.routes:
+            if route.matches(tone, len(user_message), history_size, is_premium):
+                return route
+        return self.routes[-1]
+    
+    def record(
+        self,
+        route: Route,
+        model: str,
+        latency_ms: float,
+        input_tokens: int,
+        output_tokens: int,
+        error: bool = False,
+    ):
+        stats = self._stats[route.name]
+        stats.requests += 1
+        stats.fallbacks += model != route.model
+        stats.errors += error
+        stats.latency_ms_total += latency_ms
+        stats.latency_ms_max = max(stats.latency_ms_max, latency_ms)
+        stats.input_tokens += input_tokens
+        stats.output_tokens += output_tokens
+        stats.models[model] = stats.models.get(model, 0) + 1
+    
+    def stats(self) -> Dict:
+        report = {}
+        for name, stats in self._stats.items():
+            requests = stats.requests or 1
+            report[name] = {
+                "requests": stats.requests,
+                "fallbacks": stats.fallbacks,
+                "errors": stats.errors,
+                "avg_latency_ms": round(stats.latency_ms_total / requests, 1),
+                "max_latency_ms": round(stats.latency_ms_max, 1),
+                "avg_input_tokens": round(stats.input_tokens / requests, 1),
+                "avg_output_tokens": round(stats.output_tokens / requests, 1),
+                "models": dict(stats.models),
+            }
+        return report
+
+
+# Route field -> JSON types it accepts
+_FIELD_TYPES = {
+    "name": (str,),
+    "model": (str,),
+    "max_output_tokens": (int,),
+    "fallback_model": (str, type(None)),
+    "tones": (list, type(None)),
+    "premium": (bool, type(None)),
+    "min_message_chars": (int,),
+    "max_message_chars": (int, type(None)),
+    "min_history": (int,),
+    "max_history": (int, type(None)),
+}
+_REQUIRED_FIELDS = ("name", "model", "max_output_tokens")
+
+
+def _rule_errors(rule) -> List[str]:
+    """What is wrong with one routing rule (empty if it can be made into a Route)"""
+    if not isinstance(rule, dict):
+        return ["not an object"]
+    errors = [f"missing {key}" for key in _REQUIRED_FIELDS if key not in rule]
+    for key, value in rule.items():
+        types = _FIELD_TYPES.get(key)
+        if types is None:
+            errors.append(f"unknown field {key}")
+        elif not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            errors.append(f"{key} must be {' or '.join('null' if t is type(None) else t.__name__ for t in types)}")
+        elif key == "tones" and value is not None and not all(isinstance(tone, str) for tone in value):
+            errors.append("tones must be a list of strings")
+    return errors
+
+
+def load_routes(path: str) -> Optional[List[Dict]]:
+    """
+    Routing rules from a JSON file (a list of Route fields), or None for the
+    defaults. A file that cannot be read, or has any invalid rule, is logged
+    and ignored as a whole rather than stopping the app from starting.
+    """
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            routes = json.load(f)
+    except Exception as e:
+        logger.error("Error loading model routes from %s: %s", path, e, extra=log_fields(e))
+        return None
+    
+    if not isinstance(routes, list) or not routes:
+        logger.error("Model routes in %s must be a non-empty list; using the defaults", path)
+        return None
+    valid = True
+    names = set()
+    for index, rule in enumerate(routes):
+        errors = _rule_errors(rule)
+        if not errors and rule["name"] in names:
+            errors.append(f"duplicate name {rule['name']}")
+        if errors:
+            valid = False
+            logger.error("Invalid model route #%d in %s: %s", index, path, "; ".join(errors))
+        else:
+            names.add(rule["name"])
+    if not valid:
+        logger.error("Ignoring %s because of invalid routes; using the defaults", path)
+        return None
+    return routes
+
+
+model_router = ModelRouter(load_routes(settings.gemini_routes_file))
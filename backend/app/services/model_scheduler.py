@@ -0,0 +1,135 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from app.config import settings
+from app.services.metrics import stage
+
+# Lower runs first
+PRIORITY_PREMIUM = 0
+PRIORITY_FREE = 1
+PRIORITY_BACKGROUND = 2
+
+
+class ModelOverloaded(Exception):
+    """Raised when a model call is shed: queue full or queue deadline passed"""
+    
+    def __init__(self, retry_after: int, reason: str = "queue full"):
+        super().__init__(f"Model capacity exceeded ({reason})")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class ModelScheduler:
+    """
+    Admission control for outbound Gemini calls.
+    At most `max_concurrency` calls run at once; the rest wait in a priority
+    queue (premium before free before background work such as summaries).
+    A request that cannot get a slot within `queue_timeout`, or that arrives
+    when `max_queue` requests are already waiting, is rejected with
+    ModelOverloaded instead of piling onto an upstream that is already
+    rate limiting us.
+    """
+    
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 200, queue_timeout: float = 15.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: list = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits = deque(maxlen=1024)  # recent queue waits (seconds)
+        self._avg_hold = 1.0  # EWMA of slot hold time (seconds), for Retry-After
+        self.max_wait = 0.0
+    
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+    
+    def retry_after(self) -> int:
+        """Seconds until a queued request would likely get a slot"""
+        return max(1, math.ceil((self.depth + 1) / self.max_concurrency * self._avg_hold))
+    
+    def admit(self):
+        """Shed load up front (e.g. before a streaming response starts)"""
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise ModelOverloaded(self.retry_after())
+    
+    async def acquire(self, priority: int = PRIORITY_FREE, timeout: Optional[float] = None):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self._record_wait(0.0)
+            return
+        
+        self.admit()
+        loop = asyncio.get_running_loop()
+        entry = [priority, next(self._seq), loop.create_future()]
+        heapq.heappush(self._waiters, entry)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(entry[2], timeout if timeout is not None else self.queue_timeout)
+        except BaseException as e:
+            if entry[2].done() and not entry[2].cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise ModelOverloaded(self.retry_after(), "queue timeout") from None
+            raise
+        self._record_wait(time.monotonic() - start)
+    
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # Hand the slot straight to the next waiter
+                return
+        self.active -= 1
+    
+    def _record_wait(self, seconds: float):
+        self.admitted += 1
+        self._waits.append(seconds)
+        self.max_wait = max(self.max_wait, seconds)
+    
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_FREE, timeout: Optional[float] = None):
+        """Hold one of the concurrent model-call slots for the duration of the block"""
+        with stage("model_queue"):
+            await self.acquire(priority, timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - start)
+            self._release()
+    
+    def stats(self) -> Dict:
+        waits = sorted(self._waits)
+        return {
+            "active": self.active,
+            "depth": self.depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+            "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+            "wait_ms_max": round(self.max_wait * 1000, 2),
+        }
+
+
+model_scheduler = ModelScheduler(
+    max_concurrency=settings.gemini_max_concurrency,
+    max_queue=settings.gemini_queue_size,
+    queue_timeout=settings.gemini_queue_timeout,
+)
@@ -1,14 +1,159 @@
-from google import genai
-from google.genai import types
-from typing import List, Dict, Literal
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Literal
+import asyncio
+import time
 from app.config import settings
-from app.services.prompt_manager import prompt_manager
+from app.services.prompt_builder import BuiltPrompt, prompt_builder
+from app.services.prompt_manager import estimate_tokens
+from app.services.metrics import stage
+from app.services.logger import get_logger, log_fields
+from app.services.prompt_cache import PromptCache, is_cache_miss
+from app.services.model_scheduler import (
+    ModelScheduler,
+    PRIORITY_BACKGROUND,
+    PRIORITY_FREE,
+    PRIORITY_PREMIUM,
+    model_scheduler,
+)
+from app.services.model_resilience import CircuitOpen, ResilientCaller, is_retryable, model_resilience
+from app.services.model_router import ModelRouter, Route, model_router
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+
+logger = get_logger("gemini")
+
+
+FALLBACK_EMPTY = "I couldn't generate a response. Please try again."
+FALLBACK_ERROR = "I'm having trouble connecting right now. Please try again in a moment."
+FALLBACK_RESPONSES = (FALLBACK_EMPTY, FALLBACK_ERROR)
+
+
+class StreamInterrupted(Exception):
+    """Raised by stream_response when the model fails after part of the reply was sent"""
 
 
 class GeminiService:
-    def __init__(self):
-        self.client = genai.Client(api_key=settings.gemini_api_key)
+    def __init__(
+        self,
+        scheduler: ModelScheduler = None,
+        resilience: ResilientCaller = None,
+        router: ModelRouter = None,
+    ):
+        self._client = None
         self.model_id = "gemini-2.0-flash"
+        self.scheduler = scheduler or model_scheduler
+        self.resilience = resilience or model_resilience
+        self.router = router or model_router
+        # Configs per (tone, output budget), built once with the tone's system instruction
+        self._configs: Dict[tuple, "types.GenerateContentConfig"] = {}
+        # Optional: reference each tone's system instruction from a context cache
+        self.prompt_cache = PromptCache(
+            lambda: self.client,
+            [m for route in self.router.routes for m in (route.model, route.fallback_model) if m],
+            ttl=settings.prompt_cache_ttl,
+            refresh_margin=settings.prompt_cache_refresh_margin,
+        ) if settings.prompt_cache_enabled else None
+    
+    @property
+    def client(self):
+        """google.genai client, created on first use: importing the SDK takes about a second"""
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=settings.gemini_api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    async def warm_up(self):
+        """Import the SDK and build every route's configs (blocking, so in a thread), then connect"""
+        await asyncio.to_thread(self._build_configs)
+        try:
+            # Metadata call: opens the client's connection pool without spending tokens
+            await self.client.aio.models.get(model=self.model_id)
+        except Exception as e:
+            logger.warning("Gemini connection warm-up failed: %s", e, extra=log_fields(e, stage="warmup"))
+    
+    def _build_configs(self):
+        for route in self.router.routes:
+            for tone in prompt_builder.templates:
+                self._generation_config(tone, route.max_output_tokens)
+        return self.client
+    
+    def _build_prompt(
+        self,
+        user_message: str,
+        tone: Literal["friendly", "professional", "tutor"],
+        conversation_history: List[Dict] = None,
+        summary: str = "",
+        is_premium: bool = False,
+    ) -> BuiltPrompt:
+        """Build the request contents (summary, budgeted history, user message)"""
+        return prompt_builder.build(user_message, tone, conversation_history, summary, is_premium)
+    
+    def _generation_config(self, tone: str, max_output_tokens: int) -> "types.GenerateContentConfig":
+        template = prompt_builder.template(tone)
+        key = (template.system_instruction, max_output_tokens)
+        config = self._configs.get(key)
+        if config is None:
+            from google.genai import types
+            config = self._configs[key] = types.GenerateContentConfig(
+                system_instruction=template.system_instruction,
+                max_output_tokens=max_output_tokens,
+                temperature=0.7,
+            )
+        return config
+    
+    async def _call(self, method, prompt: BuiltPrompt, tone: str, model: str, max_output_tokens: int):
+        """Call a generate method, using the tone's cached system instruction when available"""
+        config = self._generation_config(tone, max_output_tokens)
+        cache_name = self.prompt_cache.name(model, tone) if self.prompt_cache else None
+        if not cache_name:
+            return await method(model=model, contents=prompt.contents, config=config)
+        
+        try:
+            return await method(
+                model=model,
+                contents=prompt.contents,
+                config=config.model_copy(update={"system_instruction": None, "cached_content": cache_name}),
+            )
+        except Exception as e:
+            if not is_cache_miss(e):
+                raise
+            # Cache expired or was deleted; send the prompt inline until it is re-registered
+            self.prompt_cache.invalidate(model, tone, cache_name)
+            return await method(model=model, contents=prompt.contents, config=config)
+    
+    async def _routed_call(
+        self,
+        operation: str,
+        method,
+        prompt: BuiltPrompt,
+        tone: str,
+        route: Route,
+        hedge: bool = None,
+    ):
+        """Call the route's model; use its lighter fallback model while the primary is overloaded"""
+        try:
+            return route.model, await self.resilience.call(
+                lambda: self._call(method, prompt, tone, route.model, route.max_output_tokens),
+                hedge=hedge,
+                key=(operation, route.model),
+            )
+        except Exception as e:
+            if not route.fallback_model or not (isinstance(e, CircuitOpen) or is_retryable(e)):
+                raise
+            logger.warning(
+                "Gemini %s unavailable (%s); falling back to %s", route.model, e, route.fallback_model,
+                extra=log_fields(e, stage="model", route=route.name),
+            )
+            response = await asyncio.wait_for(
+                self._call(method, prompt, tone, route.fallback_model, route.max_output_tokens),
+                self.resilience.deadline,
+            )
+            return route.fallback_model, response
     
     async def generate_response(
         self,
@@ -16,45 +161,90 @@ class GeminiService:
         tone: Literal["friendly", "professional", "tutor"],
         conversation_history: List[Dict] = None,
         is_premium: bool = False,
+        summary: str = "",
     ) -> str:
-        """Generate AI response using Google Gemini"""
-        
-        # Get system prompt for the tone
-        system_prompt = prompt_manager.get_system_prompt(tone)
-        
-        # Build conversation context
-        context_parts = [system_prompt + "\n\n"]
+        """Generate AI response using Google Gemini (raises ModelOverloaded when shed)"""
         
-        # Add conversation history
-        if conversation_history:
-            for msg in conversation_history[-6:]:  # Last 6 messages
-                role = "User" if msg.get("sender") == "user" else "Assistant"
-                context_parts.append(f"{role}: {msg.get('content', '')}\n")
+        prompt = self._build_prompt(user_message, tone, conversation_history, summary, is_premium)
+        route = self.router.route(tone, user_message, conversation_history, is_premium)
         
-        # Add current user message
-        context_parts.append(f"User: {user_message}\n\nAssistant:")
+        async with self.scheduler.slot(PRIORITY_PREMIUM if is_premium else PRIORITY_FREE):
+            start = time.perf_counter()
+            model = route.model
+            try:
+                with stage("model"):
+                    model, response = await self._routed_call(
+                        "generate", self.client.aio.models.generate_content, prompt, tone, route
+                    )
+                text = response.text or FALLBACK_EMPTY
+                self.router.record(route, model, (time.perf_counter() - start) * 1000, prompt.input_tokens, estimate_tokens(text))
+                return text
+                
+            except Exception as e:
+                latency_ms = (time.perf_counter() - start) * 1000
+                self.router.record(route, model, latency_ms, prompt.input_tokens, 0, error=True)
+                logger.error(
+                    "Gemini API error: %s", e,
+                    extra=log_fields(e, stage="model", latency_ms=latency_ms, route=route.name, model=model),
+                )
+                return FALLBACK_ERROR
+    
+    async def stream_response(
+        self,
+        user_message: str,
+        tone: Literal["friendly", "professional", "tutor"],
+        conversation_history: List[Dict] = None,
+        is_premium: bool = False,
+        summary: str = "",
+    ) -> AsyncIterator[str]:
+        """
+        Stream AI response text chunks as Gemini produces them. A failure
+        before the first chunk yields the fallback text; a failure after it
+        raises StreamInterrupted.
+        """
         
-        full_prompt = "".join(context_parts)
+        prompt = self._build_prompt(user_message, tone, conversation_history, summary, is_premium)
+        route = self.router.route(tone, user_message, conversation_history, is_premium)
+        produced = False
+        output_tokens = 0
+        model = route.model
+        start = time.perf_counter()
         
         try:
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=full_prompt,
-                config=types.GenerateContentConfig(
-                    max_output_tokens=1000 if is_premium else 500,
-                    temperature=0.7,
-                )
-            )
-            
-            return response.text or "I couldn't generate a response. Please try again."
+            # Response headers are already sent; a queue timeout ends in the fallback text
+            async with self.scheduler.slot(PRIORITY_PREMIUM if is_premium else PRIORITY_FREE):
+                # Only opening the stream is retried; tokens already sent cannot be taken back
+                with stage("model"):
+                    model, stream = await self._routed_call(
+                        "stream", self.client.aio.models.generate_content_stream, prompt, tone, route, hedge=False
+                    )
+                async for chunk in stream:
+                    if chunk.text:
+                        produced = True
+                        output_tokens += estimate_tokens(chunk.text)
+                        yield chunk.text
             
         except Exception as e:
-            print(f"Gemini API error: {e}")
-            return "I'm having trouble connecting right now. Please try again in a moment."
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.router.record(route, model, latency_ms, prompt.input_tokens, output_tokens, error=True)
+            logger.error(
+                "Gemini streaming error: %s", e,
+                extra=log_fields(e, stage="model", latency_ms=latency_ms, route=route.name, model=model),
+            )
+            if produced:
+                # The tokens sent so far are not a complete reply
+                raise StreamInterrupted(str(e)) from e
+            yield FALLBACK_ERROR
+            return
+        
+        self.router.record(route, model, (time.perf_counter() - start) * 1000, prompt.input_tokens, output_tokens)
+        if not produced:
+            yield FALLBACK_EMPTY
     
     async def summarize_conversation(
         self,
         messages: List[Dict],
+        previous_summary: str = "",
     ) -> str:
         """Summarize a conversation to reduce token usage"""
         
@@ -63,20 +253,26 @@ class GeminiService:
             for m in messages
         ])
         
+        if previous_summary:
+            # Fold the new turns into the existing running summary
+            conversation_text = f"Summary so far: {previous_summary}\n\n{conversation_text}"
+        
+        from google.genai import types
         try:
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=f"Summarize this conversation concisely, capturing key points and context:\n\n{conversation_text}",
-                config=types.GenerateContentConfig(
-                    max_output_tokens=200,
-                    temperature=0.5,
-                )
-            )
+            async with self.scheduler.slot(PRIORITY_BACKGROUND):
+                response = await self.resilience.call(lambda: self.client.aio.models.generate_content(
+                    model=self.model_id,
+                    contents=f"Summarize this conversation concisely, capturing key points and context:\n\n{conversation_text}",
+                    config=types.GenerateContentConfig(
+                        max_output_tokens=200,
+                        temperature=0.5,
+                    )
+                ), hedge=False, key=("summarize", self.model_id))
             
             return response.text or ""
             
         except Exception as e:
-            print(f"Summarization error: {e}")
+            logger.error("Summarization error: %s", e, extra=log_fields(e, stage="summary"))
             return ""
 
 
@@ -0,0 +1,69 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import base64
+import json
+from app.services.response_cache import fingerprint
+
+# API field name -> Firestore field name, per listing
+CHAT_FIELDS = {
+    "chat_id": None,  # the document ID, always returned
+    "user_id": "userId",
+    "title": "title",
+    "created_at": "createdAt",
+    "updated_at": "updatedAt",
+}
+MESSAGE_FIELDS = {
+    "message_id": None,
+    "chat_id": "chatId",
+    "sender": "sender",
+    "content": "content",
+    "timestamp": "timestamp",
+}
+
+
+def encode_cursor(timestamp: datetime, doc_id: str) -> str:
+    """Opaque cursor for the row a page ended on (its sort timestamp and document ID)"""
+    raw = json.dumps([timestamp.isoformat(), doc_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, doc_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), str(doc_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def projection(fields: Optional[str], allowed: Dict[str, Optional[str]], sort_field: str) -> Optional[List[str]]:
+    """
+    Firestore field paths to select for a comma-separated `fields` parameter,
+    or None for whole documents. The sort field is always read so the page
+    can produce a cursor. Raises ValueError on unknown names.
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    paths = {allowed[name] for name in names if allowed[name]}
+    paths.add(sort_field)
+    return sorted(paths)
+
+
+def page_etag(*parts) -> str:
+    """Strong ETag for a page from its identifying parts (IDs and version timestamps)"""
+    return f'"{fingerprint(*parts)[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check; weak comparison as RFC 9110 requires for GET"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags: Iterable[str] = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
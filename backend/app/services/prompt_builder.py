@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from typing import Dict, List, Literal
+from app.config import settings
+from app.services.prompt_manager import prompt_manager, estimate_tokens
+
+
+@dataclass
+class ToneTemplate:
+    """A tone's system instruction, precomputed once"""
+    system_instruction: str
+    system_tokens: int
+
+
+@dataclass
+class BuiltPrompt:
+    """Prompt for one request, ready for generate_content"""
+    system_instruction: str
+    contents: str
+    input_tokens: int
+    history_used: int
+
+
+class PromptBuilder:
+    """
+    Assembles prompts under a per-tier input-token budget.
+    Each tone's system prompt and its token estimate are computed once at
+    startup and sent through `system_instruction`. History is added
+    newest-first until the budget left after the system prompt, summary and
+    current message runs out, so a few long messages cannot blow up request
+    size.
+    """
+    
+    def __init__(self, free_budget: int = 2000, premium_budget: int = 4000):
+        self.budgets = {False: free_budget, True: premium_budget}
+        self.templates: Dict[str, ToneTemplate] = {}
+        for tone in prompt_manager.get_available_tones():
+            system_prompt = prompt_manager.get_system_prompt(tone)
+            self.templates[tone] = ToneTemplate(system_prompt, estimate_tokens(system_prompt))
+        self.requests = 0
+        self.input_tokens_total = 0
+        self.last_input_tokens = 0
+    
+    def template(self, tone: str) -> ToneTemplate:
+        return self.templates.get(tone, self.templates["friendly"])
+    
+    def build(
+        self,
+        user_message: str,
+        tone: Literal["friendly", "professional", "tutor"],
+        conversation_history: List[Dict] = None,
+        summary: str = "",
+        is_premium: bool = False,
+    ) -> BuiltPrompt:
+        """Build the prompt for one request within the tier's token budget"""
+        template = self.template(tone)
+        
+        head = f"Summary of the earlier conversation: {summary}\n\n" if summary else ""
+        tail = f"User: {user_message}\n\nAssistant:"
+        used = template.system_tokens + estimate_tokens(head) + estimate_tokens(tail)
+        remaining = self.budgets[is_premium] - used
+        
+        # Fit history newest-first into what is left of the budget
+        lines = []
+        for msg in reversed(conversation_history or []):
+            role = "User" if msg.get("sender") == "user" else "Assistant"
+            line = f"{role}: {msg.get('content', '')}\n"
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            lines.append(line)
+            remaining -= cost
+            used += cost
+        lines.reverse()
+        
+        self.requests += 1
+        self.input_tokens_total += used
+        self.last_input_tokens = used
+        
+        return BuiltPrompt(
+            system_instruction=template.system_instruction,
+            contents=head + "".join(lines) + tail,
+            input_tokens=used,
+            history_used=len(lines),
+        )
+    
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "input_tokens_total": self.input_tokens_total,
+            "avg_input_tokens": round(self.input_tokens_total / self.requests, 1) if self.requests else 0.0,
+            "last_input_tokens": self.last_input_tokens,
+        }
+
+
+prompt_builder = PromptBuilder(
+    free_budget=settings.free_input_token_budget,
+    premium_budget=settings.premium_input_token_budget,
+)
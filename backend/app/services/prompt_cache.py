@@ -0,0 +1,122 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import time
+from app.services.prompt_builder import prompt_builder
+from app.services.logger import get_logger, log_fields
+
+
+logger = get_logger("prompt_cache")
+
+
+class PromptCache:
+    """
+    Gemini context caches holding each tone's system instruction.
+    Every tone's (static) system prompt is registered once per model as
+    cached content and requests reference it by name instead of re-sending it. A background
+    task extends each cache's TTL before it runs out and recreates caches
+    that have disappeared. `name()` returns None whenever no usable cache
+    exists, and callers then send the prompt inline.
+    """
+    
+    def __init__(
+        self,
+        get_client: Callable[[], object],
+        models: List[str],
+        ttl: int = 3600,
+        refresh_margin: int = 300,
+    ):
+        self.get_client = get_client
+        self.models = list(dict.fromkeys(models))
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        # (model, tone) -> (cache name, expires_at on the monotonic clock)
+        self._handles: Dict[Tuple[str, str], Tuple[str, float]] = {}  # (model, tone) -> (cache name, expiry)
+        self._lock = asyncio.Lock()
+        self.created = 0
+        self.refreshed = 0
+        self.failures = 0
+        self.fallbacks = 0
+    
+    def name(self, model: str, tone: str) -> Optional[str]:
+        """Cache name for a model and tone, or None if it is missing or expired"""
+        handle = self._handles.get((model, tone))
+        if handle is None or handle[1] - time.monotonic() <= 0:
+            self.fallbacks += 1
+            return None
+        return handle[0]
+    
+    def invalidate(self, model: str, tone: str, name: str = None):
+        """Forget a cache (e.g. the API reported it missing)"""
+        handle = self._handles.get((model, tone))
+        if handle and (name is None or handle[0] == name):
+            del self._handles[(model, tone)]
+    
+    async def _create(self, model: str, tone: str):
+        from google.genai import types
+        cached = await self.get_client().aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=prompt_builder.template(tone).system_instruction,
+                display_name=f"chatmate-{tone}",
+                ttl=f"{self.ttl}s",
+            ),
+        )
+        self._handles[(model, tone)] = (cached.name, time.monotonic() + self.ttl)
+        self.created += 1
+    
+    async def _extend(self, key: tuple, name: str):
+        from google.genai import types
+        await self.get_client().aio.caches.update(
+            name=name,
+            config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"),
+        )
+        self._handles[key] = (name, time.monotonic() + self.ttl)
+        self.refreshed += 1
+    
+    async def refresh(self):
+        """Create missing caches and extend the ones close to expiring"""
+        async with self._lock:
+            for model in self.models:
+                for tone in prompt_builder.templates:
+                    handle = self._handles.get((model, tone))
+                    if handle and handle[1] - time.monotonic() > self.refresh_margin:
+                        continue
+                    try:
+                        if handle:
+                            try:
+                                await self._extend((model, tone), handle[0])
+                                continue
+                            except Exception as e:
+                                # Expired or deleted server-side; register it again
+                                logger.warning("Error extending prompt cache for %s/%s: %s", model, tone, e, extra=log_fields(e))
+                                self.invalidate(model, tone, handle[0])
+                        await self._create(model, tone)
+                    except Exception as e:
+                        self.failures += 1
+                        logger.error("Error creating prompt cache for %s/%s: %s", model, tone, e, extra=log_fields(e))
+    
+    async def run(self, interval: float = 60):
+        """Background task: keep every tone's cache registered and fresh"""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(interval)
+    
+    def stats(self) -> Dict:
+        return {
+            "caches": len(self._handles),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "fallbacks": self.fallbacks,
+        }
+
+
+def is_cache_miss(error: Exception) -> bool:
+    """
+    Whether a generate error means the referenced cached content is gone.
+    A 403/404 counts only when it is about the cached content, so a real
+    permission or API key error is not hidden behind the inline retry.
+    """
+    code = getattr(error, "code", None)
+    text = str(error).lower()
+    return code in (400, 403, 404) and ("cachedcontent" in text or "cached content" in text)
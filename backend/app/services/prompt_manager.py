@@ -1,6 +1,11 @@
 from typing import Literal
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini models (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
 class PromptManager:
     """Manages system prompts for different AI tones"""
     
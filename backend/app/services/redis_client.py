@@ -0,0 +1,45 @@
+from typing import Dict
+from app.config import settings
+from app.services.logger import get_logger
+
+logger = get_logger("redis")
+
+_clients: Dict[str, object] = {}
+
+
+def get_redis(url: str = None):
+    """
+    Shared redis.asyncio client for `url` (default: settings.redis_url), or
+    None when no URL is configured or redis is not installed. One blocking
+    connection pool per URL and process: callers wait up to redis_timeout for
+    a free connection instead of opening more than redis_pool_size.
+    """
+    url = url if url is not None else settings.redis_url
+    if not url:
+        return None
+    if url not in _clients:
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.warning("Redis not installed, ignoring redis_url")
+            return None
+        pool = redis.BlockingConnectionPool.from_url(
+            url,
+            max_connections=settings.redis_pool_size,
+            timeout=settings.redis_timeout,
+            socket_timeout=settings.redis_timeout,
+            socket_connect_timeout=settings.redis_timeout,
+            health_check_interval=30,
+        )
+        _clients[url] = redis.Redis(connection_pool=pool)
+    return _clients[url]
+
+
+async def close_redis():
+    """Close every pooled connection (app shutdown)"""
+    while _clients:
+        _, client = _clients.popitem()
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("Error closing Redis client: %s", e)
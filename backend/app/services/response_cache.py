@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import time
+from app.config import settings
+
+
+def fingerprint(*parts) -> str:
+    """Stable hash of JSON-serializable request parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyKeyReused(Exception):
+    """The idempotency key was already used for a request with a different body"""
+
+
+class ResponseCache:
+    """
+    Short-lived results keyed by idempotency key, with single-flight dedup.
+    A request whose key already has a stored result gets that result back. A
+    request matching one still in flight (by idempotency key or by request
+    fingerprint) awaits the leader instead of generating again. Only the
+    leader runs the work, and it runs in its own task so a disconnecting
+    leader does not fail its followers. Stored results are bounded by an LRU.
+    Each key remembers the fingerprint of the request that used it, and a
+    different request under the same key raises IdempotencyKeyReused.
+    """
+    
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._results: "OrderedDict[Hashable, tuple[float, Any, Optional[str]]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Tuple[asyncio.Task, Optional[str]]] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.reused = 0
+    
+    def _entry(self, key: Hashable) -> Optional[Tuple[Any, Optional[str]]]:
+        """(value, request fingerprint) stored for `key`, if still fresh"""
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry[1], entry[2]
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entry(key)
+        return entry[0] if entry is not None else None
+    
+    def put(self, key: Hashable, value: Any, request_fingerprint: Optional[str] = None):
+        self._results[key] = (time.monotonic() + self.ttl, value, request_fingerprint)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+    
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        key: Optional[Hashable] = None,
+        flight_key: Optional[Hashable] = None,
+        cacheable: Callable[[Any], bool] = lambda result: True,
+        request_fingerprint: Optional[str] = None,
+    ) -> Tuple[Any, str]:
+        """
+        Run `factory` at most once per key.
+        Returns (result, source) where source is "hit" (stored result for
+        `key`), "coalesced" (awaited an identical in-flight request) or
+        "leader" (ran the factory). Only results for `key` are stored.
+        Raises IdempotencyKeyReused if `key` is stored or in flight for a
+        request whose fingerprint differs from `request_fingerprint`.
+        """
+        if key is not None:
+            entry = self._entry(key)
+            if entry is not None:
+                self._check_fingerprint(entry[1], request_fingerprint)
+                self.hits += 1
+                return entry[0], "hit"
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self._check_fingerprint(inflight[1], request_fingerprint)
+        
+        keys = [k for k in (key, flight_key) if k is not None]
+        for k in keys:
+            inflight = self._inflight.get(k)
+            if inflight is not None:
+                self.coalesced += 1
+                return await asyncio.shield(inflight[0]), "coalesced"
+        
+        self.misses += 1
+        task = asyncio.ensure_future(factory())
+        for k in keys:
+            self._inflight[k] = (task, request_fingerprint)
+        
+        def settle(done: asyncio.Task):
+            for k in keys:
+                if self._inflight.get(k, (None,))[0] is done:
+                    del self._inflight[k]
+            if key is None or done.cancelled() or done.exception() is not None:
+                return
+            if cacheable(done.result()):
+                self.put(key, done.result(), request_fingerprint)
+        
+        task.add_done_callback(settle)
+        return await asyncio.shield(task), "leader"
+    
+    def _check_fingerprint(self, stored: Optional[str], request_fingerprint: Optional[str]):
+        if stored != request_fingerprint:
+            self.reused += 1
+            raise IdempotencyKeyReused()
+    
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._results),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "reused": self.reused,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_size,
+    ttl=settings.response_cache_ttl,
+)
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+import hashlib
+import time
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified Firebase ID tokens.
+    Entries are keyed by a SHA-256 of the token and expire at the token's own
+    `exp` claim, so a cached token is never accepted past its lifetime.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """Return the cached user for a token, or None on miss/expiry"""
+        key = self._key(token)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: Dict, expires_at: float):
+        """Cache a verified user until the token's expiry"""
+        if expires_at <= time.time():
+            return
+
+        key = self._key(token)
+        self._entries[key] = (expires_at, user)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,136 @@
+from typing import Dict
+import asyncio
+from app.config import settings
+from app.services.firebase_service import firebase_service, usage_date
+from app.services.logger import get_logger, log_fields
+
+
+logger = get_logger("usage_buffer")
+
+
+class UsageBuffer:
+    """
+    Write-behind accumulator for daily usage increments.
+    Increments are coalesced in memory per user and flushed as batched
+    writes every few hundred ms (and on shutdown), so a hot user costs at most
+    one write per flush instead of one per message. Until a delta is durably
+    written it is reported by pending(), which the rate limiter adds to the
+    stored counter.
+    """
+    
+    def __init__(self, shards: int = 0):
+        self.shards = shards
+        self._pending: Dict[str, int] = {}
+        self._inflight: Dict[str, int] = {}
+        # Day on which we last wrote each user's counter (it is then known to be current)
+        self._stamped: Dict[str, str] = {}
+        # Running total of deltas durably written per user (see written())
+        self._written: Dict[str, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self.flushes = 0
+        self.increments = 0
+        self.writes = 0
+    
+    def add(self, user_id: str, delta: int = 1):
+        """Buffer a usage change for a user"""
+        self._pending[user_id] = self._pending.get(user_id, 0) + delta
+        self.increments += 1
+    
+    def pending(self, user_id: str) -> int:
+        """Usage not yet durably written (buffered or mid-flush)"""
+        return self._pending.get(user_id, 0) + self._inflight.get(user_id, 0)
+    
+    def written(self, user_id: str) -> int:
+        """
+        Deltas this process has durably written for a user so far. The change
+        between two calls is usage that moved from pending() into the stored
+        counter, which lets a long-lived caller keep an old user doc current.
+        """
+        return self._written.get(user_id, 0)
+    
+    def reserve(self, user_id: str, stored_usage: int, limit: int) -> tuple[bool, int]:
+        """
+        Take a slot if stored + pending usage is below `limit`.
+        No await between check and add, so this is atomic within the process.
+        Returns (is_allowed, current_count)
+        """
+        current = stored_usage + self.pending(user_id)
+        if current >= limit:
+            return False, current
+        self.add(user_id, 1)
+        return True, current + 1
+    
+    async def flush(self) -> int:
+        """Write all buffered deltas; failed users are kept for the next flush"""
+        async with self._flush_lock:
+            deltas = {u: d for u, d in self._pending.items() if d}
+            self._pending = {}
+            if not deltas:
+                return 0
+            
+            today = usage_date()
+            self._stamped = {u: day for u, day in self._stamped.items() if day == today}
+            self._written = {u: n for u, n in self._written.items() if u in self._stamped}
+            self._inflight = deltas
+            failed = set(deltas)
+            try:
+                failed = await firebase_service.write_usage_deltas(
+                    deltas, stamped=set(self._stamped), shards=self.shards
+                )
+            except Exception as e:
+                logger.error("Error flushing usage: %s", e, extra=log_fields(e, users=len(deltas)))
+            finally:
+                self._inflight = {}
+                # Also runs when the flush is cancelled: deltas not known to be written stay pending
+                for user_id, delta in deltas.items():
+                    if user_id in failed:
+                        self._pending[user_id] = self._pending.get(user_id, 0) + delta
+                    else:
+                        self._stamped[user_id] = today
+                        self._written[user_id] = self._written.get(user_id, 0) + delta
+            
+            self.flushes += 1
+            self.writes += len(deltas) - len(failed)
+            return len(deltas) - len(failed)
+    
+    async def run(self, interval: float):
+        """Background task: flush every `interval` seconds until stop()"""
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    await self.flush()
+        finally:
+            # Cleared on the way out, not on the way in: a stop() that comes
+            # before the task first runs must still end it
+            self._stopping.clear()
+    
+    def stop(self):
+        """Make run() return after the flush in progress, if any (shutdown)"""
+        self._stopping.set()
+    
+    def stats(self) -> Dict:
+        return {
+            "pending_users": len(self._pending),
+            "increments": self.increments,
+            "flushes": self.flushes,
+            "writes": self.writes,
+        }
+
+
+usage_buffer = UsageBuffer(shards=settings.usage_shards)
+
+
+def buffering_enabled() -> bool:
+    """Whether usage goes through the buffer (sharded counters always do)"""
+    return settings.usage_buffer_enabled or settings.usage_shards > 0
+
+
+async def record_usage(user_id: str):
+    """Count one message for a user, through the buffer when it is enabled"""
+    if buffering_enabled():
+        usage_buffer.add(user_id)
+    else:
+        await firebase_service.increment_usage(user_id)
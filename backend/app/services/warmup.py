@@ -0,0 +1,82 @@
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import gc
+import time
+from app.services.logger import get_logger, log_fields
+
+logger = get_logger("warmup")
+
+Step = Callable[[], Awaitable]
+
+
+class WarmUp:
+    """
+    Startup work a worker does before it reports ready: SDK initialization,
+    opening connections, prefetching certs. It runs as a background task so
+    /health answers from the start, while /ready returns 503 until every
+    required step has succeeded. Failed required steps are retried every
+    `retry_delay` seconds; optional ones are tried once and only reported
+    (the request path does the same work lazily).
+    
+    With `freeze_gc`, everything allocated up to that point (modules, SDK
+    clients) is moved out of the collector's reach once warm-up is done, so
+    full collections no longer rescan it and stall the loop.
+    """
+    
+    def __init__(self, retry_delay: float = 5.0, freeze_gc: bool = True):
+        self.retry_delay = retry_delay
+        self.freeze_gc = freeze_gc
+        self.steps: Dict[str, tuple] = {}  # name -> (step, required)
+        self.status: Dict[str, str] = {}  # name -> pending / ok / failed
+        self.started_at = time.monotonic()
+        self.ready_after: Optional[float] = None
+    
+    def add(self, name: str, step: Step, required: bool = True):
+        """Register a step: an async callable that raises (or returns False) on failure"""
+        self.steps[name] = (step, required)
+        self.status[name] = "pending"
+    
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+    
+    async def run(self):
+        pending = dict(self.steps)
+        while pending:
+            results = await asyncio.gather(*(self._attempt(name, step) for name, (step, _) in pending.items()))
+            pending = {
+                name: (step, required)
+                for (name, (step, required)), ok in zip(pending.items(), results)
+                if required and not ok
+            }
+            if pending:
+                await asyncio.sleep(self.retry_delay)
+        
+        if self.freeze_gc:
+            gc.collect()
+            gc.freeze()
+        self.ready_after = time.monotonic() - self.started_at
+        logger.info("Ready after %.2fs", self.ready_after, extra=log_fields(steps=dict(self.status)))
+    
+    async def _attempt(self, name: str, step: Step) -> bool:
+        start = time.perf_counter()
+        try:
+            ok = await step() is not False
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e, extra=log_fields(e, stage=name))
+            ok = False
+        self.status[name] = "ok" if ok else "failed"
+        logger.info("Warm-up step %s: %s", name, self.status[name],
+                    extra=log_fields(stage=name, latency_ms=(time.perf_counter() - start) * 1000))
+        return ok
+    
+    def report(self) -> Dict:
+        """Body of /ready"""
+        return {
+            "status": "ready" if self.ready else "starting",
+            "steps": dict(self.status),
+            "seconds": round(self.ready_after if self.ready else time.monotonic() - self.started_at, 3),
+        }
+    
+    def stats(self) -> Dict:
+        return {"ready": int(self.ready), "seconds": round(self.ready_after or 0.0, 3)}
@@ -0,0 +1,235 @@
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+import asyncio
+import time
+from app.config import settings
+from app.services.firebase_service import firebase_service
+from app.services.logger import get_logger, log_fields
+
+
+logger = get_logger("write_queue")
+
+
+class WriteQueueFull(Exception):
+    """Raised by enqueue() when the queue stayed at max_depth for full_timeout seconds"""
+
+
+class WriteBehindQueue:
+    """
+    Write-behind queue for Firestore document writes.
+    Callers enqueue and return immediately; a background task groups queued
+    writes into batches and commits them when `batch_size` writes are waiting
+    or every `flush_interval` seconds. Failed batches are retried a few times
+    and the queue is drained on shutdown.
+    
+    The queue never holds more than `max_depth` writes: a caller that finds
+    it full flushes batches itself and waits for room, and gets
+    WriteQueueFull if there is still none after `full_timeout` seconds
+    (Firestore is failing).
+    """
+    
+    MAX_ATTEMPTS = 5
+    
+    def __init__(
+        self,
+        batch_size: int = 400,
+        flush_interval: float = 0.5,
+        max_depth: int = 10000,
+        full_timeout: float = 5.0,
+    ):
+        self.batch_size = min(batch_size, 500)  # Firestore batch limit
+        self.flush_interval = flush_interval
+        self.max_depth = max_depth
+        self.full_timeout = full_timeout
+        self._queue: deque = deque()  # (path, data, merge, attempts)
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.batches = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+    
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+    
+    @property
+    def full(self) -> bool:
+        return self.depth >= self.max_depth
+    
+    async def enqueue(self, path: str, data: Dict, merge: bool = False):
+        """Queue a document write (`path` like "messages/{id}")"""
+        await self.enqueue_many([(path, data, merge)])
+    
+    async def enqueue_many(self, writes: List[tuple]):
+        """Queue (path, data, merge) writes together: all are accepted, or none (WriteQueueFull)"""
+        await self._wait_for_room(len(writes))
+        # No await from here on, so nothing can take the room in between
+        for path, data, merge in writes:
+            self._queue.append((path, data, merge, 0))
+        self.enqueued += len(writes)
+        if self.depth >= self.batch_size:
+            self._wakeup.set()
+    
+    async def _wait_for_room(self, count: int):
+        # Backpressure: write out batches until `count` more writes fit
+        deadline = time.monotonic() + self.full_timeout
+        while self.depth + count > self.max_depth:
+            if await self.flush_batch():
+                continue
+            if time.monotonic() >= deadline:
+                self.rejected += count
+                logger.error("Write queue full, rejecting %d writes", count, extra=log_fields(stage="persist", depth=self.depth))
+                raise WriteQueueFull(f"Write queue full ({self.depth} writes waiting)")
+            await asyncio.sleep(min(self.flush_interval, 0.1))
+    
+    async def flush_batch(self) -> int:
+        """Commit up to one batch of queued writes"""
+        async with self._flush_lock:
+            ops = []
+            while self._queue and len(ops) < self.batch_size:
+                ops.append(self._queue.popleft())
+            if not ops:
+                return 0
+            
+            start = time.perf_counter()
+            try:
+                await firebase_service.commit_writes([(p, d, m) for p, d, m, _ in ops])
+            except asyncio.CancelledError:
+                # Outcome unknown; the writes are idempotent, so put them back for the next flush
+                self._queue.extendleft(reversed(ops))
+                raise
+            except Exception as e:
+                logger.error("Error committing write batch: %s", e, extra=log_fields(e, stage="persist", writes=len(ops)))
+                self._requeue(ops)
+                return 0
+            finally:
+                self._record_latency((time.perf_counter() - start) * 1000)
+            
+            self.batches += 1
+            self.written += len(ops)
+            return len(ops)
+    
+    def _requeue(self, ops: List[tuple]):
+        # Put failed writes back at the front, in order, until they run out of attempts
+        for path, data, merge, attempts in reversed(ops):
+            if attempts + 1 >= self.MAX_ATTEMPTS:
+                self.dropped += 1
+                logger.error("Dropping write to %s after %d attempts", path, self.MAX_ATTEMPTS, extra=log_fields(stage="persist"))
+                continue
+            self._queue.appendleft((path, data, merge, attempts + 1))
+    
+    def _record_latency(self, ms: float):
+        self.flushes += 1
+        self.last_flush_ms = ms
+        self.max_flush_ms = max(self.max_flush_ms, ms)
+        self._total_flush_ms += ms
+    
+    async def run(self):
+        """Background task: flush on size or every flush_interval seconds until stop()"""
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                while self._queue and not self._stopping.is_set():
+                    if not await self.flush_batch():
+                        break  # Failing; back off until the next interval
+        finally:
+            # Cleared on the way out, so a stop() before the task first runs still ends it
+            self._stopping.clear()
+    
+    def stop(self):
+        """Make run() return after the batch in progress, if any; drain() writes the rest"""
+        self._stopping.set()
+        self._wakeup.set()
+    
+    async def drain(self):
+        """Flush everything still queued (called on shutdown)"""
+        while self._queue:
+            if not await self.flush_batch() and self._queue:
+                await asyncio.sleep(0.1)
+    
+    def stats(self) -> Dict:
+        flushes = self.flushes or 1
+        return {
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / flushes, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+write_queue = WriteBehindQueue(
+    batch_size=settings.write_batch_size,
+    flush_interval=settings.write_flush_interval,
+    max_depth=settings.write_queue_max_depth,
+    full_timeout=settings.write_queue_full_timeout,
+)
+
+
+def new_chat_fields(user_id: str, first_message: str, created_at: datetime) -> Dict:
+    """Fields a chat document is created with"""
+    return {
+        "userId": user_id,
+        "title": first_message[:50] + ("..." if len(first_message) > 50 else ""),
+        "createdAt": created_at,
+        "updatedAt": created_at,
+    }
+
+
+async def persist_exchange(
+    user_id: str,
+    chat_id: str,
+    new_chat: bool,
+    user_message_id: str,
+    user_content: str,
+    user_timestamp: datetime,
+    ai_message_id: str,
+    ai_content: str,
+    ai_timestamp: datetime,
+    is_voice: bool = False,
+    queue: Optional[WriteBehindQueue] = None,
+):
+    """
+    Queue the user message, the AI reply and the chat's updatedAt (raises
+    WriteQueueFull if the queue has no room for them). Owner, title and
+    createdAt are only written for a `new_chat` (an ID this server just
+    generated); an existing chat's owner is never touched.
+    """
+    queue = queue or write_queue
+    
+    chat = new_chat_fields(user_id, user_content, user_timestamp) if new_chat else {}
+    chat["updatedAt"] = ai_timestamp
+    
+    # Queued together so a full queue cannot keep one message and drop the other
+    await queue.enqueue_many([
+        (f"messages/{user_message_id}", {
+            "chatId": chat_id,
+            "sender": "user",
+            "content": user_content,
+            "timestamp": user_timestamp,
+            "isVoice": is_voice,
+        }, False),
+        (f"messages/{ai_message_id}", {
+            "chatId": chat_id,
+            "sender": "ai",
+            "content": ai_content,
+            "timestamp": ai_timestamp,
+        }, False),
+        (f"chats/{chat_id}", chat, True),
+    ])
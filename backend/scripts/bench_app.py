@@ -0,0 +1,278 @@
+"""
+End-to-end benchmark of the FastAPI app with local Firestore/Gemini stand-ins.
+
+Drives the real `app` (middleware, routers, services) in-process through
+httpx's ASGI transport, with FakeFirestore under FirebaseService and
+FakeGenaiClient under GeminiService, each with configurable latency, jitter
+and error rate. Every endpoint is run in turn at a fixed concurrency
+(closed loop: each worker sends its next request when the previous one
+returns), and reported with:
+
+    rps        completed requests per second
+    p50..p99   request latency (successful requests), ms
+    errors     responses >= 400 and transport exceptions
+    lag        event-loop lag while the endpoint ran (p99 / max), ms: how late
+               a 10ms timer fires. Client and app share the loop, as they
+               would not in production, so read it relative to a baseline.
+
+FakeFirestore evaluates queries by scanning the collection in Python, so the
+read endpoints' CPU cost (and loop lag) grows with --users and --messages;
+keep both fixed when comparing runs.
+
+Results can be saved as a baseline and later runs compared against it; the
+run exits non-zero if any endpoint regressed past --tolerance.
+
+Usage (from backend/):
+    python scripts/bench_app.py --save bench-baseline.json
+    python scripts/bench_app.py --baseline bench-baseline.json
+    python scripts/bench_app.py --endpoints message,stream --concurrency 100 \\
+        --gemini-latency 0.3 --gemini-error-rate 0.02 --firestore-latency 0.02
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")  # injected faults would flood stdout
+
+import httpx  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.firebase_service import firebase_service, usage_date  # noqa: E402
+from app.services.openai_service import openai_service  # noqa: E402
+from fakes import FakeFirestore, FakeGenaiClient  # noqa: E402
+
+PROMPT = "Tell me something nice about today."
+
+
+def endpoints(user_id: str):
+    """name -> (method, path, JSON body) for one request by `user_id`"""
+    chat_id = f"{user_id}-chat"
+    message = {"content": PROMPT, "chat_id": chat_id, "persist": True}
+    return {
+        "message": ("POST", "/chat/message", message),
+        "stream": ("POST", "/chat/message/stream", message),
+        "history": ("GET", "/chat/history?limit=20", None),
+        "messages": ("GET", f"/chat/{chat_id}/messages?limit=50", None),
+        "usage": ("GET", "/usage/status", None),
+        "health": ("GET", "/health", None),
+    }
+
+
+async def seed(db: FakeFirestore, users: int, messages: int):
+    now = datetime.utcnow()
+    for i in range(users):
+        user_id = f"bench-{i}"
+        await db.collection("users").document(user_id).set(
+            {"uid": user_id, "isPremium": False, "dailyUsage": 0, "usageDate": usage_date()}
+        )
+        await db.collection("chats").document(f"{user_id}-chat").set({
+            "userId": user_id,
+            "title": "Benchmark chat",
+            "createdAt": now,
+            "updatedAt": now,
+            "summary": "",
+        })
+        for j in range(messages):
+            await db.collection("messages").document(f"{user_id}-msg-{j}").set({
+                "chatId": f"{user_id}-chat",
+                "sender": "user" if j % 2 == 0 else "ai",
+                "content": PROMPT,
+                "timestamp": now - timedelta(seconds=messages - j),
+            })
+
+
+def install_fakes(args) -> FakeFirestore:
+    db = FakeFirestore(latency=args.firestore_latency, jitter=args.firestore_jitter, error_rate=args.firestore_error_rate)
+    firebase_service._db = db
+    firebase_service._initialized = True
+
+    async def verify_token(token: str):
+        return {"uid": token, "email": None, "exp": time.time() + 3600}
+
+    async def prefetch_signing_certs():
+        return True
+
+    firebase_service.verify_token = verify_token
+    firebase_service.prefetch_signing_certs = prefetch_signing_certs
+
+    openai_service.client = FakeGenaiClient(
+        reply="That sounds like a lovely question. Here is something nice about today.",
+        latency=args.gemini_latency,
+        jitter=args.gemini_jitter,
+        error_rate=args.gemini_error_rate,
+    )
+
+    # Measure the request path, not the quotas
+    settings.free_daily_limit = 10 ** 9
+    settings.free_burst_limit = 0
+    return db
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def monitor_lag(samples: list, interval: float = 0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_endpoint(client: httpx.AsyncClient, name: str, args) -> dict:
+    latencies, errors = [], 0
+    remaining = args.requests
+
+    async def worker(n: int):
+        nonlocal remaining, errors
+        user_id = f"bench-{n % args.users}"
+        method, path, body = endpoints(user_id)[name]
+        headers = {"Authorization": f"Bearer {user_id}"}
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    # Warm-up: first-request costs (imports, caches) stay out of the numbers
+    warmup, remaining = remaining, min(args.concurrency, args.requests)
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    latencies.clear()
+    errors, remaining = 0, warmup
+
+    lag = []
+    monitor = asyncio.create_task(monitor_lag(lag))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "rps": round(args.requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "lag_p99_ms": round(percentile(lag, 99) * 1000, 2),
+        "lag_max_ms": round(max(lag, default=0) * 1000, 2),
+    }
+
+
+def print_results(results: dict):
+    print(f"{'endpoint':<10} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7} {'lag p99':>8} {'lag max':>8}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['errors']:>7} {r['lag_p99_ms']:>8.2f} {r['lag_max_ms']:>8.2f}")
+
+
+def compare(results: dict, baseline: dict, config: dict, tolerance: float) -> list:
+    """Print the change against `baseline` per endpoint; returns the regressions found"""
+    if baseline.get("config") != config:
+        print("\nwarning: baseline was recorded with different settings")
+    regressions = []
+    print(f"\n{'vs baseline':<10} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"{name:<10} {'(not in baseline)':>20}")
+            continue
+        changes = {key: (r[key] - base[key]) / base[key] if base[key] else 0.0 for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+        print(f"{name:<10} " + " ".join(f"{changes[key]:>+8.1%}" for key in ("rps", "p50_ms", "p95_ms", "p99_ms")))
+        # Latency under 1ms is mostly noise; judge it in absolute terms
+        if changes["rps"] < -tolerance:
+            regressions.append(f"{name}: rps {base['rps']} -> {r['rps']}")
+        for key in ("p95_ms", "p99_ms"):
+            if changes[key] > tolerance and r[key] - base[key] > 1:
+                regressions.append(f"{name}: {key} {base[key]} -> {r[key]}")
+        if r["errors"] > base["errors"] * (1 + tolerance) + 1:
+            regressions.append(f"{name}: errors {base['errors']} -> {r['errors']}")
+    return regressions
+
+
+def config_of(args) -> dict:
+    keys = (
+        "concurrency", "requests", "users", "messages",
+        "firestore_latency", "firestore_jitter", "firestore_error_rate",
+        "gemini_latency", "gemini_jitter", "gemini_error_rate",
+    )
+    return {key: getattr(args, key) for key in keys}
+
+
+async def main(args):
+    random.seed(args.seed)
+    db = install_fakes(args)
+    latency, error_rate = db.latency, db.error_rate
+    db.latency, db.error_rate = 0, 0
+    await seed(db, args.users, args.messages)
+    db.latency, db.error_rate = latency, error_rate
+    # Keep the seeded data and imported modules out of full collections, which
+    # otherwise stall the loop for ~100ms at unpredictable points in a run
+    gc.collect()
+    gc.freeze()
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.05)
+            for name in args.endpoints.split(","):
+                results[name] = await run_endpoint(client, name, args)
+
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": config_of(args), "results": results}, f, indent=2)
+        print(f"\nsaved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), config_of(args), args.tolerance)
+        if regressions:
+            sys.exit("\nregressions:\n  " + "\n  ".join(regressions))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default="message,stream,history,messages,usage,health",
+                        help=f"Comma-separated, from: {', '.join(endpoints('u'))}")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint")
+    parser.add_argument("--users", type=int, default=50, help="Distinct simulated users")
+    parser.add_argument("--messages", type=int, default=20, help="Seeded messages per user's chat")
+    parser.add_argument("--firestore-latency", type=float, default=0.01, help="Seconds per Firestore call")
+    parser.add_argument("--firestore-jitter", type=float, default=0.005)
+    parser.add_argument("--firestore-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="Seconds per Gemini call")
+    parser.add_argument("--gemini-jitter", type=float, default=0.1)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for jitter and injected faults")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before failing")
+    args = parser.parse_args()
+    unknown = set(args.endpoints.split(",")) - set(endpoints("u"))
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    asyncio.run(main(args))
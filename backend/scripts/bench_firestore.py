@@ -0,0 +1,80 @@
+"""
+Concurrency benchmark for FirebaseService.
+
+Runs ``get_user`` / ``get_messages`` from N concurrent simulated users and
+reports throughput per concurrency level. With a non-blocking data layer the
+throughput should scale roughly linearly with concurrency until the backend
+saturates.
+
+Usage (from backend/):
+    python scripts/bench_firestore.py                    # in-memory stub, 20ms latency
+    python scripts/bench_firestore.py --latency 0.05
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python scripts/bench_firestore.py --emulator
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.firebase_service import firebase_service  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+
+
+async def seed(db, users: int):
+    for i in range(users):
+        await db.collection("users").document(f"user-{i}").set(
+            {"uid": f"user-{i}", "isPremium": False, "dailyUsage": 0}
+        )
+        await db.collection("messages").document(f"msg-{i}").set(
+            {"chatId": f"chat-{i}", "sender": "user", "content": "hi", "timestamp": i}
+        )
+
+
+async def user_session(uid: int, requests: int):
+    for _ in range(requests):
+        await firebase_service.get_user(f"user-{uid}")
+        await firebase_service.get_messages(f"chat-{uid}", limit=10)
+
+
+async def run_level(concurrency: int, requests: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(user_session(i, requests) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return (concurrency * requests * 2) / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,5,10,25,50,100", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per simulated user")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub round-trip latency (seconds)")
+    parser.add_argument("--emulator", action="store_true", help="Use the Firestore emulator instead of the stub")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.levels.split(",")]
+
+    if args.emulator:
+        if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+            sys.exit("FIRESTORE_EMULATOR_HOST must be set for --emulator")
+        db = firebase_service.db
+    else:
+        db = FakeFirestore(latency=args.latency)
+        firebase_service._db = db
+        firebase_service._initialized = True
+
+    await seed(db, max(levels))
+
+    print(f"{'users':>6} {'ops/s':>10} {'scaling':>8}")
+    base = None
+    for level in levels:
+        ops = await run_level(level, args.requests)
+        base = base or ops
+        print(f"{level:>6} {ops:>10.1f} {ops / base:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
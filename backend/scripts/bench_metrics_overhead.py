@@ -0,0 +1,131 @@
+"""
+Overhead of the latency instrumentation (app/services/metrics.py and
+app/middleware/timing.py).
+
+Measures:
+    stage     cost of one `with stage(...)` block (histogram + request trace)
+    request   cost TimingMiddleware adds per request (measured around a
+              bare ASGI app), relative to a trivial FastAPI request
+    render    time to render /metrics with the timed series populated
+
+Usage (from backend/):
+    python scripts/bench_metrics_overhead.py --iterations 200000 --requests 3000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from app.middleware.timing import TimingMiddleware  # noqa: E402
+from app.services.metrics import Metrics  # noqa: E402
+
+STAGES = ("auth", "user_doc", "history", "quota", "model_queue", "model", "usage", "persist")
+
+
+def bench_stage(iterations: int) -> float:
+    registry = Metrics(trace_sample_rate=0.01)
+    registry.begin_request()
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        with registry.stage(STAGES[i % len(STAGES)]):
+            pass
+        if i % 64 == 0:
+            registry.begin_request()  # keep per-request stage lists short, as in real traffic
+    elapsed = time.perf_counter() - start
+    return (elapsed - baseline) / iterations * 1e9
+
+
+async def bench_middleware(requests: int) -> tuple:
+    """Per-request cost of a bare ASGI app, with and without TimingMiddleware around it"""
+    registry = Metrics(trace_sample_rate=0.01)
+    route = SimpleNamespace(path="/ping")
+
+    async def endpoint(scope, receive, send):
+        scope["route"] = route
+        with registry.stage("auth"):
+            pass
+        with registry.stage("model"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def run(app) -> float:
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app({"type": "http", "method": "GET", "path": "/ping", "headers": []}, receive, send)
+        return (time.perf_counter() - start) / requests * 1e6
+
+    timed_app = TimingMiddleware(endpoint, registry=registry)
+    plain, timed = [], []
+    for _ in range(5):  # alternate so machine noise hits both sides
+        plain.append(await run(endpoint))
+        timed.append(await run(timed_app))
+    return min(plain), min(timed)
+
+
+async def bench_http(requests: int) -> float:
+    """End-to-end in-process request through FastAPI with the middleware, for scale"""
+    app = FastAPI()
+    app.add_middleware(TimingMiddleware, registry=Metrics())
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(200):  # warm-up
+            await client.get("/ping")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/ping")
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+def bench_render() -> float:
+    registry = Metrics()
+    for i in range(10000):
+        registry.stage_seconds.observe(i / 10000, STAGES[i % len(STAGES)])
+        registry.request_seconds.observe(i / 1000, "POST", "/chat/message", "200")
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    return (time.perf_counter() - start) / 100 * 1e3
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    print(f"stage():  {bench_stage(args.iterations):8.0f} ns per timed block")
+
+    plain_us, timed_us = await bench_middleware(args.requests * 10)
+    http_us = await bench_http(args.requests)
+    print(f"request:  {timed_us - plain_us:8.1f} µs added by TimingMiddleware "
+          f"(bare ASGI app {plain_us:.1f} µs -> {timed_us:.1f} µs)")
+    print(f"          {(timed_us - plain_us) / http_us * 100:8.2f} % of a trivial FastAPI request ({http_us:.0f} µs)")
+    print(f"render:   {bench_render():8.2f} ms per /metrics scrape")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Prompt size vs conversation length, with and without rolling summaries.
+
+Simulates a conversation turn by turn and reports the estimated input tokens
+of the prompt sent to the model under three strategies:
+    full      every previous message sent verbatim
+    budget    newest messages that fit the free-tier token budget (PromptBuilder)
+    memory    running summary + recent tail (ConversationMemory), budgeted
+
+A stub summarizer stands in for the model, so this runs offline.
+
+Usage (from backend/):
+    python scripts/bench_prompt_size.py --turns 100 --message-chars 400
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.context_cache import ContextCache  # noqa: E402
+from app.services.conversation_memory import ConversationMemory  # noqa: E402
+from app.services.firebase_service import firebase_service  # noqa: E402
+from app.services.prompt_builder import prompt_builder  # noqa: E402
+from app.services.prompt_manager import estimate_tokens, prompt_manager  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+
+
+async def stub_summarizer(messages, previous_summary: str) -> str:
+    # Roughly what a 200-output-token summary costs, regardless of input length
+    text = previous_summary + " " + " ".join(m["content"][:40] for m in messages)
+    return text[-800:].strip()
+
+
+def full_prompt_tokens(history, message: str) -> int:
+    parts = [prompt_manager.get_system_prompt("friendly")]
+    parts += [m["content"] for m in history]
+    parts.append(message)
+    return estimate_tokens("\n".join(parts))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--message-chars", type=int, default=400)
+    parser.add_argument("--threshold", type=int, default=1500, help="Summary token threshold")
+    parser.add_argument("--keep-recent", type=int, default=4)
+    args = parser.parse_args()
+
+    firebase_service._db = FakeFirestore(latency=0)
+    firebase_service._initialized = True
+
+    cache = ContextCache(tail_size=10)
+    memory = ConversationMemory(
+        cache=cache,
+        summarizer=stub_summarizer,
+        token_threshold=args.threshold,
+        keep_recent=args.keep_recent,
+    )
+    chat_id = "bench-chat"
+    cache.put(chat_id, [])
+
+    history = []
+    report_at = {1, 5, 10, 25, 50, 100, 250, 500, args.turns}
+    print(f"{'turn':>5} {'full':>8} {'budget':>9} {'memory':>8}")
+
+    for turn in range(1, args.turns + 1):
+        message = f"turn {turn}: " + "x" * args.message_chars
+
+        budgeted = prompt_builder.build(message, "friendly", history).input_tokens
+        with_memory = prompt_builder.build(
+            message, "friendly", cache.get(chat_id), cache.get_summary(chat_id)
+        ).input_tokens
+        if turn in report_at:
+            print(f"{turn:>5} {full_prompt_tokens(history, message):>8} {budgeted:>9} {with_memory:>8}")
+
+        reply = {"sender": "ai", "content": "y" * args.message_chars}
+        history += [{"sender": "user", "content": message}, reply]
+        cache.append(chat_id, {"sender": "user", "content": message}, reply)
+        await memory.maybe_fold(chat_id, "bench-user")
+
+    print(f"\nsummary folds: {memory.folds}")
+    print(f"prompt builder: {prompt_builder.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
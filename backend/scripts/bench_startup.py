@@ -0,0 +1,72 @@
+"""
+Cold-start benchmark: how long `import app.main` takes in a fresh interpreter.
+
+Each run starts a new Python process with `-X importtime` and reads the
+cumulative import time of app.main from its report, so interpreter startup
+is not counted. Prints the median/min/max over the runs and the modules with
+the highest self time. Fails when modules that should be loaded lazily
+(the Gemini and Firebase SDKs, which the startup warm-up imports instead) are
+imported by app.main, or when the median exceeds --max-ms.
+
+Usage (from backend/):
+    python scripts/bench_startup.py --runs 5
+    python scripts/bench_startup.py --runs 10 --max-ms 1200
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+
+# Heavy SDKs the request path imports on first use (or the warm-up does)
+LAZY_MODULES = ("google.genai", "firebase_admin", "google.cloud.firestore")
+
+
+def import_report() -> list:
+    """(module, self µs, cumulative µs) for one fresh `import app.main`"""
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Modules to list by self time")
+    parser.add_argument("--max-ms", type=float, default=0, help="Fail if the median import exceeds this")
+    args = parser.parse_args()
+
+    totals, report = [], []
+    for _ in range(args.runs):
+        report = import_report()
+        totals.append(next(cumulative for name, _, cumulative in report if name == "app.main") / 1000)
+
+    median = statistics.median(totals)
+    print(f"import app.main: median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms ({args.runs} runs)")
+    print(f"\n{'self ms':>8}  module (last run)")
+    for name, self_us, _ in sorted(report, key=lambda row: -row[1])[:args.top]:
+        print(f"{self_us / 1000:>8.1f}  {name}")
+
+    problems = []
+    eager = sorted({name for name, _, _ in report for lazy in LAZY_MODULES if name == lazy or name.startswith(lazy + ".")})
+    if eager:
+        problems.append(f"imported eagerly (should load on first use): {', '.join(eager[:5])}")
+    if args.max_ms and median > args.max_ms:
+        problems.append(f"median {median:.0f} ms over the {args.max_ms:.0f} ms budget")
+    if problems:
+        sys.exit("\n" + "\n".join(problems))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Offline check of rolling conversation summaries (app/services/conversation_memory.py).
+
+Drives the real app in-process against FakeFirestore and FakeGenaiClient,
+with a summary threshold low enough that chats fold every few turns. A chat
+whose messages are not stored server-side (no `persist`, no chat document)
+must keep working after a fold, with the summary held in the context cache
+only; a stored chat gets the summary written to its document, and a cold
+read of its context leaves out the messages the summary already covers.
+Also checks that a fold racing new messages drops only what it summarized.
+
+Usage (from backend/):
+    python scripts/check_conversation_memory.py
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "check")
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+
+import httpx  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.context_cache import ContextCache, context_cache  # noqa: E402
+from app.services.conversation_memory import conversation_memory  # noqa: E402
+from app.services.firebase_service import firebase_service  # noqa: E402
+from app.services.openai_service import openai_service  # noqa: E402
+from app.services.write_queue import write_queue  # noqa: E402
+from fakes import FakeFirestore, FakeGenaiClient  # noqa: E402
+
+TURNS = 8
+
+failures = 0
+
+
+def check(label: str, ok: bool):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {label}")
+
+
+def install_fakes() -> FakeFirestore:
+    db = FakeFirestore(latency=0)
+    firebase_service._db = db
+    firebase_service._initialized = True
+
+    async def verify_token(token: str):
+        return {"uid": token, "email": None}
+
+    firebase_service.verify_token = verify_token
+    openai_service.client = FakeGenaiClient(reply="Here is a reply long enough to count for something.")
+    settings.free_daily_limit = 10 ** 6
+    settings.free_burst_limit = 0
+    # Fold as soon as more than keep_recent messages are in the tail
+    conversation_memory.token_threshold = 1
+    return db
+
+
+async def converse(client: httpx.AsyncClient, user_id: str, persist: bool) -> tuple:
+    """(chat ID the server assigned on the first turn, status of every turn)"""
+    chat_id, statuses = None, []
+    for turn in range(TURNS):
+        response = await client.post(
+            "/chat/message",
+            json={"content": f"turn {turn}", "chat_id": chat_id, "persist": persist},
+            headers={"Authorization": f"Bearer {user_id}"},
+        )
+        statuses.append(response.status_code)
+        chat_id = chat_id or response.json().get("chat_id")
+        await write_queue.drain()
+    return chat_id, statuses
+
+
+def check_fold_race():
+    # Messages appended while the summary was being written stay in the tail,
+    # even once the bounded tail has shifted
+    cache = ContextCache(tail_size=6)
+    cache.put("c", [{"sender": "user", "content": f"m{i}"} for i in range(6)])
+    older = cache.peek("c")[:-2]
+    cache.append("c", {"sender": "user", "content": "m6"}, {"sender": "ai", "content": "m7"})
+    cache.fold("c", older[-1], "summary of m0-m3")
+    tail = [m["content"] for m in cache.get("c")]
+    check(f"fold racing new messages keeps the unsummarized ones ({tail})", tail == ["m4", "m5", "m6", "m7"])
+
+
+async def main():
+    check_fold_race()
+    db = install_fakes()
+    for user_id in ("u1", "u2"):
+        await db.collection("users").document(user_id).set({"isPremium": False, "dailyUsage": 0})
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://check") as client:
+        folds = conversation_memory.folds
+        chat_id, statuses = await converse(client, "u1", persist=False)
+        check(f"chat without a document keeps working after folds ({statuses})", set(statuses) == {200})
+        check("summary kept in the context cache", conversation_memory.folds > folds and context_cache.get_summary(chat_id))
+        check("no ownerless chat document created", chat_id not in db.data.get("chats", {}))
+
+        folds = conversation_memory.folds
+        chat_id, statuses = await converse(client, "u2", persist=True)
+        chat = db.data.get("chats", {}).get(chat_id, {})
+        check(f"stored chat keeps working after folds ({statuses})", set(statuses) == {200})
+        check("summary written to the stored chat",
+              conversation_memory.folds > folds and chat.get("userId") == "u2" and chat.get("summary"))
+
+        # Another worker (cold context cache) continues the chat
+        context_cache._chats.clear()
+        response = await client.post(
+            "/chat/message",
+            json={"content": "next turn", "chat_id": chat_id, "persist": True},
+            headers={"Authorization": "Bearer u2"},
+        )
+        prompt = next(r["contents"] for r in reversed(openai_service.client.requests) if "next turn" in str(r["contents"]))
+        messages = [m for m in db.data["messages"].values() if m["chatId"] == chat_id and m["sender"] == "user"]
+        folded = [m["content"] for m in messages if m["timestamp"] <= chat["summaryThrough"]]
+        recent = [m["content"] for m in messages if m["timestamp"] > chat["summaryThrough"]]
+        check(f"cold read leaves out summarized turns ({len(folded)} folded)",
+              response.status_code == 200 and folded
+              and not any(f"{content}\n" in prompt for content in folded)
+              and all(f"{content}\n" in prompt for content in recent if content != "next turn"))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,237 @@
+"""
+Offline check of the shared document cache (app/services/doc_cache.py).
+
+Two FirebaseService instances stand in for two workers: they share a
+FakeFirestore and one cache backend, and each runs its invalidation
+listener. The check counts Firestore reads while walking through
+read-through hits, a cold-key stampede, usage and tier writes seen from the
+other worker, a load racing a write, missing documents, and degradation
+when the shared tier fails. The Redis backend (Lua merge, guarded set, pub/sub) is exercised
+against fakeredis when it is installed.
+
+Usage (from backend/):
+    python scripts/check_doc_cache.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.doc_cache import DocumentCache, LocalBackend, RedisBackend  # noqa: E402
+from app.services.firebase_service import FirebaseService, usage_date  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+
+failures = 0
+
+
+def check(label: str, ok: bool):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {label}")
+
+
+def worker(db: FakeFirestore, backend) -> FirebaseService:
+    service = FirebaseService()
+    service._db = db
+    service._initialized = True
+    service.user_cache = DocumentCache("users", backend, local_ttl=30, shared_ttl=60)
+    service.chat_cache = DocumentCache("chats", backend, local_ttl=30, shared_ttl=60)
+    return service
+
+
+class BrokenBackend(LocalBackend):
+    """Shared tier that is unreachable"""
+
+    async def get(self, key):
+        raise ConnectionError("redis down")
+
+    async def generation(self, key):
+        raise ConnectionError("redis down")
+
+    async def merge(self, key, fields, increments, expect):
+        raise ConnectionError("redis down")
+
+    async def delete(self, key):
+        raise ConnectionError("redis down")
+
+
+async def settle():
+    await asyncio.sleep(0.05)  # let the listeners drain pub/sub
+
+
+async def check_workers():
+    db = FakeFirestore(latency=0.01)
+    backend = LocalBackend()
+    a, b = worker(db, backend), worker(db, backend)
+    listeners = [asyncio.create_task(w.run_cache_invalidation()) for w in (a, b)]
+    await settle()
+
+    today = usage_date()
+    await db.collection("users").document("u1").set({"isPremium": False, "dailyUsage": 3, "usageDate": today})
+    await db.collection("chats").document("c1").set({"userId": "u1", "summary": "earlier"})
+
+    # Read-through: one Firestore read serves both workers
+    db.calls = 0
+    for _ in range(50):
+        await a.get_user("u1")
+    user = await b.get_user("u1")
+    check("one Firestore read for 51 gets across workers", db.calls == 1 and user["dailyUsage"] == 3)
+    check("second worker served from the shared tier", b.user_cache.shared_hits == 1 and b.user_cache.loads == 0)
+
+    # Stampede on a cold key: one load in total
+    await db.collection("users").document("u2").set({"isPremium": False, "dailyUsage": 0, "usageDate": today})
+    db.calls = 0
+    results = await asyncio.gather(*(w.get_user("u2") for w in (a, b) for _ in range(50)))
+    check("100 concurrent cold gets -> 1 Firestore read", db.calls == 1 and all(results))
+
+    # Usage reserved on one worker is visible on the other without a read
+    allowed, current = await a.reserve_usage("u1", limit=20)
+    await settle()
+    db.calls = 0
+    user = await b.get_user("u1")
+    check("reservation mirrored to other worker", allowed and user["dailyUsage"] == current == 4 and db.calls == 0)
+
+    # Batched increments (usage buffer) are mirrored too
+    failed = await a.write_usage_deltas({"u1": 3}, stamped={"u1"})
+    await settle()
+    db.calls = 0
+    user = await b.get_user("u1")
+    check("batched increment mirrored", not failed and user["dailyUsage"] == 7 and db.calls == 0)
+
+    # A cached doc from an earlier day is dropped rather than patched
+    await a.user_cache.merge("u2", fields={"usageDate": "2000-01-01"})
+    await a.write_usage_deltas({"u2": 1}, stamped={"u2"})
+    await settle()
+    user = await b.get_user("u2")
+    check("stale-day copy reloaded from Firestore", user["dailyUsage"] == 1 and user["usageDate"] == today)
+
+    # Premium upgrade reaches the other worker
+    await a.update_user("u1", {"isPremium": True})
+    await settle()
+    user = await b.get_user("u1")
+    check("tier change invalidated everywhere", user["isPremium"] is True)
+    check("invalidations delivered", b.user_cache.invalidations >= 3)
+
+    # Chat metadata: owner and summary share one cached read
+    db.calls = 0
+    owner = await b.get_chat_owner("c1")
+    summary = await b.get_chat_summary("c1")
+    check("chat owner and summary from one read", owner == "u1" and summary == "earlier" and db.calls == 1)
+    await a.update_chat("c1", {"summary": "later"})
+    await settle()
+    check("summary update mirrored", await b.get_chat_summary("c1") == "later")
+
+    for task in listeners:
+        task.cancel()
+    print(f"\nusers: {a.user_cache.stats()} / {b.user_cache.stats()}")
+
+
+async def check_race(backend):
+    # A load that read before a write must not cache what it read
+    cache = DocumentCache("race", backend)
+    release = asyncio.Event()
+    reads = []
+
+    async def slow_loader():
+        reads.append(1)
+        await release.wait()
+        return {"dailyUsage": 1}
+
+    load = asyncio.create_task(cache.get("u", slow_loader))
+    await asyncio.sleep(0.01)
+    await cache.merge("u", fields={"dailyUsage": 2})
+    release.set()
+    await load
+
+    async def loader():
+        reads.append(1)
+        return {"dailyUsage": 2}
+
+    doc = await cache.get("u", loader)
+    return len(reads) == 2 and doc["dailyUsage"] == 2
+
+
+async def check_missing(backend) -> bool:
+    # A missing document is read once and shared; a waiter does not sit out
+    # the lock timeout when the loader stored nothing
+    first = DocumentCache("missing", backend, negative_ttl=5)
+    second = DocumentCache("missing", backend, negative_ttl=5)
+    reads = []
+
+    async def loader():
+        reads.append(1)
+        await asyncio.sleep(0.1)
+        return None
+
+    docs = await asyncio.gather(first.get("gone", loader), second.get("gone", loader), first.get("gone", loader))
+    negative = docs == [None, None, None] and len(reads) == 1
+    await first.merge("gone", fields={"dailyUsage": 1})
+    dropped = await first.get("gone", loader) is None and len(reads) == 2
+
+    uncached = [DocumentCache("uncached", backend, negative_ttl=0) for _ in range(2)]
+    start = time.monotonic()
+    await asyncio.gather(*(cache.get("gone", loader) for cache in uncached))
+    prompt = time.monotonic() - start < uncached[0].lock_timeout / 2
+    return negative and dropped and prompt
+
+
+async def check_degraded():
+    db = FakeFirestore(latency=0)
+    service = worker(db, BrokenBackend())
+    await db.collection("users").document("u1").set({"dailyUsage": 1})
+    user = await service.get_user("u1")
+    ok = await service.update_user("u1", {"isPremium": True})
+    user_after = await service.get_user("u1")
+    check("shared tier down: reads and writes still work",
+          user["dailyUsage"] == 1 and ok and user_after["isPremium"] is True)
+    check("shared tier errors counted", service.user_cache.errors >= 2)
+
+
+async def check_redis():
+    try:
+        import fakeredis
+    except ImportError:
+        print("SKIP redis backend (fakeredis not installed)")
+        return
+
+    client = fakeredis.FakeAsyncRedis()
+    backend = RedisBackend(client)
+    first = DocumentCache("users", backend)
+    second = DocumentCache("users", RedisBackend(client))
+    listener = asyncio.create_task(second.run())
+    await asyncio.sleep(0.05)
+
+    async def loader():
+        return {"dailyUsage": 2, "usageDate": "2024-05-01", "isPremium": False}
+
+    await first.get("u1", loader)
+    await second.get("u1", loader)
+    check("redis: second instance hits the shared tier", second.shared_hits == 1 and second.loads == 0)
+
+    await first.merge("u1", increments={"dailyUsage": 3}, expect={"usageDate": "2024-05-01"})
+    await asyncio.sleep(0.05)
+    doc = await second.get("u1", loader)
+    check("redis: Lua merge applied and announced", doc["dailyUsage"] == 5 and second.invalidations == 1)
+
+    await first.merge("u1", increments={"dailyUsage": 1}, expect={"usageDate": "2024-05-02"})
+    check("redis: expect mismatch drops the key", await client.get("cache:users:u1") is None)
+
+    check("redis: load racing a write is not cached", await check_race(backend))
+    check("redis: missing documents cached briefly, waiters not stalled", await check_missing(backend))
+    listener.cancel()
+
+
+async def main():
+    await check_workers()
+    check("local: load racing a write is not cached", await check_race(LocalBackend()))
+    check("local: missing documents cached briefly, waiters not stalled", await check_missing(LocalBackend()))
+    await check_degraded()
+    await check_redis()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+"""
+Offline check of the Gemini resilience layer (app/services/model_resilience.py).
+
+Drives GeminiService against a fault-injecting FakeGenaiClient: transient
+429/503s are retried, client errors are not, the overall deadline caps slow
+calls, hedged requests win over stragglers, and the circuit breaker opens,
+fails fast and recovers after its reset timeout.
+
+Usage (from backend/):
+    python scripts/check_model_resilience.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.model_resilience import CircuitBreaker, ResilientCaller  # noqa: E402
+from app.services.model_scheduler import ModelScheduler  # noqa: E402
+from app.services.openai_service import FALLBACK_ERROR, GeminiService  # noqa: E402
+from fakes import FakeGenaiClient  # noqa: E402
+
+failures = 0
+
+
+def check(label: str, ok: bool):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {label}")
+
+
+def service(client: FakeGenaiClient, **caller_options) -> GeminiService:
+    options = {"base_delay": 0.01, "deadline": 2.0}
+    options.update(caller_options)
+    gemini = GeminiService(scheduler=ModelScheduler(), resilience=ResilientCaller(**options))
+    gemini.client = client
+    return gemini
+
+
+async def main():
+    # Transient errors are retried
+    client = FakeGenaiClient()
+    client.fail_next = [503, 429]
+    gemini = service(client)
+    reply = await gemini.generate_response("hi", "friendly")
+    check("retries 503/429 then succeeds", reply == client.reply and len(client.requests) == 3)
+
+    # Client errors are not
+    client = FakeGenaiClient()
+    client.fail_next = [400]
+    gemini = service(client)
+    reply = await gemini.generate_response("hi", "friendly")
+    check("400 not retried", reply == FALLBACK_ERROR and len(client.requests) == 1)
+
+    # Attempts are capped
+    client = FakeGenaiClient(error_rate=1.0)
+    gemini = service(client, max_attempts=3)
+    reply = await gemini.generate_response("hi", "friendly")
+    check("gives up after max attempts", reply == FALLBACK_ERROR and len(client.requests) == 3)
+
+    # Overall deadline bounds a hung upstream
+    client = FakeGenaiClient(slow_rate=1.0, slow_latency=5.0)
+    gemini = service(client, deadline=0.3)
+    start = time.perf_counter()
+    reply = await gemini.generate_response("hi", "friendly")
+    elapsed = time.perf_counter() - start
+    check(f"deadline caps latency ({elapsed:.2f}s)", reply == FALLBACK_ERROR and elapsed < 0.5)
+
+    # Hedging: after warm-up, a straggler is raced by a second request
+    client = FakeGenaiClient(latency=0.02)
+    gemini = service(client, hedge=True)
+    for _ in range(ResilientCaller.HEDGE_MIN_SAMPLES):
+        await gemini.generate_response("warm up", "friendly")
+    # The next request stalls; the hedge sent after ~p95 answers first
+    fast_delay = client.delay
+
+    async def stall_once():
+        client.delay = fast_delay
+        await asyncio.sleep(1.0)
+    client.delay = stall_once
+    start = time.perf_counter()
+    reply = await gemini.generate_response("hi", "friendly")
+    elapsed = time.perf_counter() - start
+    stats = gemini.resilience.stats()
+    check(f"hedge wins over straggler ({elapsed:.2f}s)", reply == client.reply and stats["hedge_wins"] == 1 and elapsed < 0.5)
+
+    # Latency windows are kept per (operation, model): slow summaries do not
+    # push out the hedge delay of chat replies
+    caller = ResilientCaller(hedge=True)
+
+    async def reply_call():
+        await asyncio.sleep(0.001)
+
+    async def summary_call():
+        await asyncio.sleep(0.05)
+    for _ in range(ResilientCaller.HEDGE_MIN_SAMPLES):
+        await caller.call(reply_call, key=("generate", "fast"))
+        await caller.call(summary_call, hedge=False, key=("summarize", "fast"))
+    delays = caller.stats()["hedge_delay_ms"]
+    check(f"hedge delay tracked per operation and model ({delays})",
+          delays["generate:fast"] < 25 < delays["summarize:fast"])
+
+    # Circuit breaker: opens after consecutive failures, fails fast, recovers
+    client = FakeGenaiClient(error_rate=1.0)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+    gemini = service(client, max_attempts=1, breaker=breaker)
+    for _ in range(3):
+        await gemini.generate_response("hi", "friendly")
+    check("breaker opens", breaker.state == "open")
+    sent = len(client.requests)
+    reply = await gemini.generate_response("hi", "friendly")
+    check("open breaker fails fast", reply == FALLBACK_ERROR and len(client.requests) == sent)
+    await asyncio.sleep(0.25)
+    client.error_rate = 0.0
+    reply = await gemini.generate_response("hi", "friendly")
+    check("half-open probe closes breaker", reply == client.reply and breaker.state == "closed")
+
+    # Streams: opening the stream is retried
+    client = FakeGenaiClient()
+    client.fail_next = [503]
+    gemini = service(client)
+    chunks = [c async for c in gemini.stream_response("hi", "friendly")]
+    check("stream open retried", "".join(chunks).strip() == client.reply)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
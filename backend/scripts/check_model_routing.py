@@ -0,0 +1,99 @@
+"""
+Offline check of model routing (app/services/model_router.py).
+
+Checks that an invalid rules file is rejected, shows which route the rules
+table picks for typical requests, then runs GeminiService against
+FakeGenaiClient with the primary model overloaded to confirm requests fall
+back to the route's lighter model. Prints the
+per-route latency and token stats collected along the way.
+
+Usage (from backend/):
+    python scripts/check_model_routing.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.model_resilience import ResilientCaller  # noqa: E402
+from app.services.model_router import ModelRouter, load_routes  # noqa: E402
+from app.services.model_scheduler import ModelScheduler  # noqa: E402
+from app.services.openai_service import FALLBACK_RESPONSES, GeminiService  # noqa: E402
+from fakes import FakeGenaiClient  # noqa: E402
+
+failures = 0
+
+HISTORY = [{"sender": "user", "content": "x" * 200}, {"sender": "ai", "content": "y" * 400}] * 3
+CASES = [
+    # (tone, message, history, is_premium, expected route)
+    ("friendly", "hey!", [], False, "small-talk"),
+    ("friendly", "hey!", [], True, "small-talk"),
+    ("friendly", "hey!", HISTORY, False, "default"),
+    ("tutor", "Explain how photosynthesis works in detail, step by step please.", HISTORY, True, "premium-tutor"),
+    ("professional", "Draft a short email declining a meeting politely, please." * 2, [], True, "premium"),
+    ("tutor", "Explain how photosynthesis works in detail, step by step please." * 2, [], False, "default"),
+]
+
+
+def check(label: str, ok: bool):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {label}")
+
+
+def check_routes_file():
+    # A bad rules file is rejected as a whole instead of failing the import
+    good = [{"name": "all", "model": "gemini-2.0-flash", "max_output_tokens": 200, "tones": ["tutor"]}]
+    bad = good + [
+        {"name": "typo", "model": "gemini-2.0-flash", "max_output_tokens": 200, "max_mesage_chars": 80},
+        {"name": "wrong-type", "model": "gemini-2.0-flash", "max_output_tokens": "200"},
+        {"name": "all", "model": "gemini-2.0-flash-lite", "max_output_tokens": 100},
+        {"model": "gemini-2.0-flash", "max_output_tokens": 100},
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        results = []
+        for rules in (good, bad, {"name": "not-a-list"}):
+            path = os.path.join(directory, "routes.json")
+            with open(path, "w") as f:
+                json.dump(rules, f)
+            results.append(load_routes(path))
+    check("valid routes file loaded", results[0] == good)
+    check("routes file with an invalid rule ignored", results[1] is None and results[2] is None)
+
+
+async def main():
+    check_routes_file()
+    router = ModelRouter()
+    for tone, message, history, is_premium, expected in CASES:
+        route = router.route(tone, message, history, is_premium)
+        check(f"{tone:<12} {len(message):>4} chars, {len(history)} msgs, premium={is_premium!s:<5} -> {route.name} ({route.model})", route.name == expected)
+
+    client = FakeGenaiClient(latency=0.01)
+    gemini = GeminiService(
+        scheduler=ModelScheduler(),
+        resilience=ResilientCaller(max_attempts=2, base_delay=0.01, deadline=2.0),
+        router=router,
+    )
+    gemini.client = client
+
+    reply = await gemini.generate_response("How do I write a cover letter for a design job?", "professional", HISTORY)
+    check("primary model serves normally", reply not in FALLBACK_RESPONSES and client.requests[-1]["model"] == "gemini-2.0-flash")
+
+    client.unavailable_models.add("gemini-2.0-flash")
+    reply = await gemini.generate_response("How do I write a cover letter for a design job?", "professional", HISTORY)
+    check("overloaded primary falls back to lighter model", reply not in FALLBACK_RESPONSES and client.requests[-1]["model"] == "gemini-2.0-flash-lite")
+
+    chunks = [c async for c in gemini.stream_response("And a resignation letter, while we're at it?", "professional", HISTORY)]
+    check("streams fall back too", "".join(chunks).strip() == client.reply)
+
+    print("\nroute stats:")
+    print(json.dumps(router.stats(), indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
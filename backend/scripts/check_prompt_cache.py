@@ -0,0 +1,104 @@
+"""
+Offline check of the tone prompt cache (app/services/prompt_cache.py).
+
+Runs GeminiService against FakeGenaiClient and walks through the cache
+lifecycle: registration, requests by cache name, TTL extension near expiry,
+recreation after the cache disappears server-side, and the inline fallback
+when a cache is missing or cannot be created. Errors that are not about the
+cached content (e.g. a bad API key) are not mistaken for a missing cache.
+
+Usage (from backend/):
+    python scripts/check_prompt_cache.py
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.model_router import ModelRouter  # noqa: E402
+from app.services.openai_service import FALLBACK_RESPONSES, GeminiService  # noqa: E402
+from app.services.prompt_cache import PromptCache, is_cache_miss  # noqa: E402
+from fakes import FakeGenaiClient, api_error  # noqa: E402
+
+MODEL = "gemini-2.0-flash"
+failures = 0
+
+
+def check(label: str, ok: bool):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {label}")
+
+
+async def generate(service: GeminiService, tone: str = "friendly") -> str:
+    return await service.generate_response("hi", tone, [])
+
+
+async def main():
+    client = FakeGenaiClient()
+    service = GeminiService(router=ModelRouter([{"name": "default", "model": MODEL, "max_output_tokens": 500}]))
+    service.client = client
+    cache = PromptCache(lambda: service.client, [MODEL], ttl=60, refresh_margin=10)
+    service.prompt_cache = cache
+
+    # No cache registered yet: prompt goes inline
+    reply = await generate(service)
+    check("inline before registration", reply not in FALLBACK_RESPONSES and client.requests[-1]["cached_content"] is None)
+
+    await cache.refresh()
+    check("one cache per tone", cache.stats()["caches"] == 3 and len(client.aio.caches.store) == 3)
+
+    reply = await generate(service, "tutor")
+    name = client.requests[-1]["cached_content"]
+    check("request references cache", reply not in FALLBACK_RESPONSES and name == cache.name(MODEL, "tutor"))
+
+    # Fresh caches are left alone; ones inside the refresh margin are extended
+    await cache.refresh()
+    check("fresh caches not refreshed", cache.refreshed == 0)
+    key = (MODEL, "friendly")
+    old_name, expires_at = cache._handles[key]
+    cache._handles[key] = (old_name, expires_at - 55)
+    await cache.refresh()
+    check("cache near expiry extended", cache.refreshed == 1 and cache.name(*key) == old_name)
+
+    # Cache deleted server-side: the request falls back inline and the handle is dropped
+    await client.aio.caches.delete(old_name)
+    reply = await generate(service, "friendly")
+    check("fallback after cache loss", reply not in FALLBACK_RESPONSES and client.requests[-1]["cached_content"] is None)
+    check("lost cache invalidated", cache.name(*key) is None)
+
+    await cache.refresh()
+    check("lost cache recreated", cache.name(*key) not in (None, old_name))
+
+    # Extension fails because the cache expired server-side: recreated instead
+    key = (MODEL, "professional")
+    name, expires_at = cache._handles[key]
+    client.aio.caches.store[name]["expires_at"] = 0
+    cache._handles[key] = (name, expires_at - 55)
+    await cache.refresh()
+    check("expired cache recreated on refresh", cache.name(*key) not in (None, name))
+
+    # Creation rejected (e.g. prompt below the API's minimum cache size): stays inline
+    client = FakeGenaiClient()
+    client.aio.caches.fail_create = True
+    service.client = client
+    cache._handles.clear()
+    await cache.refresh()
+    reply = await generate(service)
+    check("inline when creation fails", reply not in FALLBACK_RESPONSES and client.requests[-1]["cached_content"] is None)
+
+    check("missing cached content is a cache miss",
+          is_cache_miss(api_error(404, "NOT_FOUND", "cachedContents/abc not found"))
+          and is_cache_miss(api_error(403, "PERMISSION_DENIED", "CachedContent not found (or permission denied)")))
+    check("permission and API key errors are not cache misses",
+          not is_cache_miss(api_error(403, "PERMISSION_DENIED", "Permission denied on resource project"))
+          and not is_cache_miss(api_error(400, "INVALID_ARGUMENT", "API key not valid. Please pass a valid API key.")))
+
+    print(f"\nstats: {cache.stats()}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
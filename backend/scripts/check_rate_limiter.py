@@ -0,0 +1,161 @@
+"""
+Offline check of the burst limits in app/middleware/rate_limiter.py.
+
+Runs both burst algorithms against the in-memory backend and the Redis
+backend (fakeredis), with a controllable clock: slots within the limit are
+admitted, the next one is refused with a Retry-After that matches when a slot
+frees up, daily-limit rejections do not use up burst slots, concurrent
+requests cannot overshoot, and a Redis outage fails open. Also checks that
+reserve_quota turns a burst rejection, and a Firestore counter too contended
+to update, into a 429 with Retry-After.
+
+Usage (from backend/):
+    python scripts/check_rate_limiter.py
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from fastapi import HTTPException  # noqa: E402
+from app.middleware import rate_limiter as module  # noqa: E402
+from app.middleware.rate_limiter import BurstLimitExceeded, RateLimitMiddleware, reserve_quota  # noqa: E402
+from app.middleware.user_context import UserContext  # noqa: E402
+from app.services.firebase_service import UsageContention, firebase_service  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+
+failures = 0
+
+
+def check(label: str, ok: bool):
+    global failures
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {label}")
+
+
+class Clock:
+    """Stands in for the time module inside rate_limiter"""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+async def attempt(limiter: RateLimitMiddleware, user_id: str, limit: int = 1000, burst: int = 5):
+    """(allowed, retry_after) for one reservation"""
+    try:
+        allowed, _ = await limiter.reserve(user_id, limit, stored_usage=0, burst_limit=burst)
+        return allowed, 0
+    except BurstLimitExceeded as e:
+        return False, e.retry_after
+
+
+async def check_backend(name: str, make_limiter, clock: Clock):
+    for algorithm in ("sliding_window", "token_bucket"):
+        label = f"{name}/{algorithm}"
+        limiter = make_limiter(algorithm)
+        clock.now = 1_200_000.0  # start of a 60s window
+
+        results = [await attempt(limiter, "u1") for _ in range(6)]
+        check(f"{label}: 5 admitted, 6th refused", [r[0] for r in results] == [True] * 5 + [False])
+        retry_after = results[-1][1]
+        # A token comes back after 1/5 of the window; the sliding window waits for the next one
+        expected = 12 if algorithm == "token_bucket" else 60
+        check(f"{label}: retry after {expected}s", abs(retry_after - expected) < 0.01)
+
+        clock.now += 60 if algorithm == "sliding_window" else 0
+        if algorithm == "sliding_window":
+            # New window, but the previous one still counts in full
+            allowed, retry_after = await attempt(limiter, "u1")
+            check(f"{label}: previous window still weighted", not allowed and abs(retry_after - 12) < 0.01)
+        clock.now += 12
+        allowed, _ = await attempt(limiter, "u1")
+        check(f"{label}: slot freed after Retry-After", allowed)
+
+        # Daily limit reached: refused as a daily rejection, burst slots untouched
+        clock.now += 3600
+        results = [await attempt(limiter, "u2", limit=3) for _ in range(8)]
+        check(f"{label}: daily rejection is not a burst rejection", [r[0] for r in results] == [True] * 3 + [False] * 5 and results[-1][1] == 0)
+        results = [(await attempt(limiter, "u2"))[0] for _ in range(3)]
+        check(f"{label}: daily rejections leave burst slots", results == [True, True, False])
+
+        # Concurrent requests cannot overshoot the burst limit
+        results = await asyncio.gather(*(attempt(limiter, "u3", burst=10) for _ in range(100)))
+        check(f"{label}: 100 concurrent -> 10 admitted", sum(r[0] for r in results) == 10)
+
+
+async def check_fail_open():
+    limiter = RateLimitMiddleware(redis_url="redis://127.0.0.1:1/0")
+    allowed, current = await limiter.reserve("u1", 20, burst_limit=5)
+    await limiter.release("u1")
+    check("redis down: reservation fails open without a slot", allowed and current is None and limiter.redis_errors == 2)
+
+
+async def check_http_error(clock: Clock):
+    firebase_service._db = FakeFirestore(latency=0)
+    firebase_service._initialized = True
+    limiter = RateLimitMiddleware(in_memory=True)
+    clock.now = 1_200_000.0
+    ctx = UserContext({"uid": "u4"})
+    for _ in range(module.settings.free_burst_limit):
+        await reserve_quota(ctx, limiter)
+    try:
+        await reserve_quota(ctx, limiter)
+        check("reserve_quota: 429 with Retry-After", False)
+    except HTTPException as e:
+        check("reserve_quota: 429 with Retry-After",
+              e.status_code == 429 and e.detail["error"] == "burst_limit_exceeded" and int(e.headers["Retry-After"]) > 0)
+
+
+async def check_contention():
+    # Without a burst limit, contention must not look like a burst limit of 0
+    async def contended(user_id: str, limit: int):
+        raise UsageContention("Transaction contention")
+
+    reserve_usage = firebase_service.reserve_usage
+    firebase_service.reserve_usage = contended
+    burst_limit = module.settings.free_burst_limit
+    module.settings.free_burst_limit = 0
+    limiter = RateLimitMiddleware()
+    try:
+        await reserve_quota(UserContext({"uid": "u5"}), limiter)
+        check("contention: 429 usage_contended with Retry-After", False)
+    except HTTPException as e:
+        check("contention: 429 usage_contended with Retry-After",
+              e.status_code == 429 and e.detail["error"] == "usage_contended"
+              and int(e.headers["Retry-After"]) > 0 and limiter.contended == 1)
+    finally:
+        firebase_service.reserve_usage = reserve_usage
+        module.settings.free_burst_limit = burst_limit
+
+
+async def main():
+    clock = Clock(0)
+    module.time = clock
+
+    await check_backend(
+        "memory",
+        lambda algorithm: RateLimitMiddleware(in_memory=True, burst_algorithm=algorithm),
+        clock,
+    )
+    try:
+        import fakeredis
+        await check_backend(
+            "redis",
+            lambda algorithm: RateLimitMiddleware(redis_client=fakeredis.FakeAsyncRedis(), burst_algorithm=algorithm),
+            clock,
+        )
+    except ImportError:
+        print("SKIP redis backend (fakeredis not installed)")
+    await check_fail_open()
+    await check_http_error(clock)
+    await check_contention()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
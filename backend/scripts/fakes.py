@@ -0,0 +1,382 @@
+"""
+In-memory stand-ins for the Firestore async client used by the benchmark
+scripts. They mimic just enough of ``google.cloud.firestore_v1`` (documents,
+simple queries, batches, transactions, ``Increment``) to drive ``FirebaseService`` without a
+network, with a configurable per-call latency and error rate.
+
+``FakeGenaiClient`` does the same for the ``google.genai`` client's
+``aio.models`` and ``aio.caches`` surfaces used by ``GeminiService``.
+"""
+import asyncio
+import itertools
+import random
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from firebase_admin import firestore_async
+from google.api_core.exceptions import Aborted, AlreadyExists, NotFound, ServiceUnavailable
+from google.genai import errors
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict], reference=None):
+        self.id = doc_id
+        self._data = data
+        self.reference = reference
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db: "FakeFirestore", collection: str, doc_id: str):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _store(self) -> Dict[str, Dict]:
+        return self._db.data.setdefault(self._collection, {})
+
+    async def get(self, field_paths=None, transaction=None) -> FakeSnapshot:
+        await self._db.delay()
+        if transaction is not None:
+            await transaction._lock(self._key)
+            transaction._reads[self._key] = self._db.versions.get(self._key, 0)
+        return FakeSnapshot(self.id, self._store.get(self.id), self)
+
+    @property
+    def _key(self) -> tuple:
+        return (self._collection, self.id)
+
+    def collection(self, name: str) -> "FakeQuery":
+        return FakeQuery(self._db, f"{self._collection}/{self.id}/{name}")
+
+    async def set(self, data: Dict, merge: bool = False):
+        await self._db.delay()
+        self._apply(data, merge=merge)
+
+    async def create(self, data: Dict):
+        await self._db.delay()
+        if self.id in self._store:
+            raise AlreadyExists(f"Document already exists: {self._collection}/{self.id}")
+        self._apply(data, merge=False)
+
+    async def update(self, data: Dict):
+        await self._db.delay()
+        if self.id not in self._store:
+            raise NotFound(f"No document to update: {self._collection}/{self.id}")
+        self._apply(data, merge=True)
+
+    def _apply(self, data: Dict, merge: bool):
+        current = dict(self._store.get(self.id) or {}) if merge else {}
+        for key, value in data.items():
+            if isinstance(value, firestore_async.Increment):
+                current[key] = current.get(key, 0) + value.value
+            else:
+                current[key] = value
+        self._store[self.id] = current
+        self._db.versions[self._key] = self._db.versions.get(self._key, 0) + 1
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeFirestore", collection: str):
+        self._db = db
+        self._collection = collection
+        self._filters: List[tuple] = []
+        self._orders: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._fields: Optional[List[str]] = None
+        self._start_after: Optional[Dict] = None
+
+    def _copy(self) -> "FakeQuery":
+        q = FakeQuery(self._db, self._collection)
+        q._filters = list(self._filters)
+        q._orders = list(self._orders)
+        q._limit = self._limit
+        q._fields = self._fields
+        q._start_after = self._start_after
+        return q
+
+    def where(self, field: str, op: str, value) -> "FakeQuery":
+        q = self._copy()
+        q._filters.append((field, op, value))
+        return q
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        q = self._copy()
+        q._orders.append((field, direction))
+        return q
+
+    def limit(self, count: int) -> "FakeQuery":
+        q = self._copy()
+        q._limit = count
+        return q
+
+    def select(self, field_paths: List[str]) -> "FakeQuery":
+        q = self._copy()
+        q._fields = list(field_paths)
+        return q
+
+    def start_after(self, values: Dict) -> "FakeQuery":
+        q = self._copy()
+        q._start_after = values
+        return q
+
+    def document(self, doc_id: str) -> FakeDocument:
+        return FakeDocument(self._db, self._collection, doc_id)
+
+    async def stream(self):
+        await self._db.delay()
+        rows = list(self._db.data.get(self._collection, {}).items())
+        for field, op, value in self._filters:
+            if op != "==":
+                raise NotImplementedError(op)
+            rows = [(k, v) for k, v in rows if v.get(field) == value]
+        if self._orders:
+            # All orderings share the first one's direction, as Firestore's implicit indexes do
+            fields = [field for field, _ in self._orders]
+            descending = self._orders[0][1] == "DESCENDING"
+
+            def sort_key(kv):
+                return tuple(kv[0] if field == "__name__" else kv[1].get(field) for field in fields)
+
+            rows.sort(key=sort_key, reverse=descending)
+            if self._start_after:
+                cursor = tuple(self._start_after[field] for field in fields[: len(self._start_after)])
+                rows = [
+                    kv for kv in rows
+                    if (sort_key(kv)[: len(cursor)] < cursor if descending else sort_key(kv)[: len(cursor)] > cursor)
+                ]
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = {k: v for k, v in data.items() if k in self._fields}
+            yield FakeSnapshot(doc_id, data, self.document(doc_id))
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._ops: List[tuple] = []
+
+    def set(self, ref: FakeDocument, data: Dict, merge: bool = False):
+        self._ops.append((ref, data, merge))
+
+    def update(self, ref: FakeDocument, data: Dict):
+        self._ops.append((ref, data, True))
+
+    async def commit(self):
+        await self._db.delay()
+        for ref, data, merge in self._ops:
+            ref._apply(data, merge=merge)
+
+
+class FakeTransaction:
+    """
+    Transaction compatible with ``firestore_async.async_transactional``.
+    Like the server SDKs, reads take a per-document lock held until commit or
+    rollback; commit still aborts (and the decorator retries) if a document
+    read was changed by a non-transactional write in the meantime.
+    """
+
+    _read_only = False
+    _max_attempts = 5  # AsyncTransaction's default
+
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._id = None
+        self._reads: Dict[tuple, int] = {}
+        self._ops: List[tuple] = []
+        self._held: List[asyncio.Lock] = []
+
+    async def _lock(self, key: tuple):
+        lock = self._db.locks.setdefault(key, asyncio.Lock())
+        if lock not in self._held:
+            await lock.acquire()
+            self._held.append(lock)
+
+    def _clean_up(self):
+        self._id = None
+        self._reads = {}
+        self._ops = []
+        for lock in self._held:
+            lock.release()
+        self._held = []
+
+    async def _begin(self, retry_id=None):
+        self._id = random.getrandbits(64)
+
+    def set(self, ref: FakeDocument, data: Dict, merge: bool = False):
+        self._ops.append((ref, data, merge))
+
+    def update(self, ref: FakeDocument, data: Dict):
+        self._ops.append((ref, data, True))
+
+    async def _commit(self):
+        await self._db.delay()
+        # Check and apply without awaiting so the commit is atomic
+        for key, version in self._reads.items():
+            if self._db.versions.get(key, 0) != version:
+                self._clean_up()
+                raise Aborted("Transaction contention")
+        for ref, data, merge in self._ops:
+            ref._apply(data, merge=merge)
+        self._clean_up()
+
+    async def _rollback(self):
+        self._clean_up()
+
+
+class FakeFirestore:
+    """
+    Async Firestore client stand-in with simulated round-trip latency.
+    ``error_rate`` of calls fail with ServiceUnavailable after their latency.
+    """
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.data: Dict[str, Dict[str, Dict]] = {}
+        self.versions: Dict[tuple, int] = {}
+        self.locks: Dict[tuple, asyncio.Lock] = {}
+        self.calls = 0
+
+    async def delay(self):
+        self.calls += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and random.random() < self.error_rate:
+            raise ServiceUnavailable("injected fault")
+
+    def collection(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def document(self, path: str) -> FakeDocument:
+        collection, doc_id = path.rsplit("/", 1)
+        return FakeDocument(self, collection, doc_id)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+
+def api_error(code: int, status: str, message: str = "") -> errors.APIError:
+    """A google.genai API error as the real client would raise it."""
+    body = SimpleNamespace(body_segments=[{"error": {"code": code, "status": status, "message": message}}])
+    return (errors.ClientError if code < 500 else errors.ServerError)(code, body)
+
+
+class FakeModels:
+    def __init__(self, client: "FakeGenaiClient"):
+        self._client = client
+
+    async def generate_content(self, model: str, contents, config=None):
+        await self._client.request(model, contents, config)
+        return SimpleNamespace(text=self._client.reply)
+
+    async def get(self, model: str, config=None):
+        await self._client.delay()
+        return SimpleNamespace(name=f"models/{model}")
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        await self._client.request(model, contents, config)
+
+        async def chunks():
+            for word in self._client.reply.split(" "):
+                yield SimpleNamespace(text=word + " ")
+        return chunks()
+
+
+class FakeCaches:
+    def __init__(self, client: "FakeGenaiClient"):
+        self._client = client
+        self._ids = itertools.count(1)
+        self.store: Dict[str, Dict] = {}  # name -> {"expires_at", "model", "config"}
+        self.fail_create = False
+
+    def _ttl(self, config) -> float:
+        return float(str(config.ttl).rstrip("s"))
+
+    def valid(self, name: str) -> bool:
+        entry = self.store.get(name)
+        return entry is not None and entry["expires_at"] > time.monotonic()
+
+    async def create(self, model: str, config=None):
+        await self._client.delay()
+        if self.fail_create:
+            raise api_error(400, "INVALID_ARGUMENT", "Cached content is too small")
+        name = f"cachedContents/fake-{next(self._ids)}"
+        self.store[name] = {"expires_at": time.monotonic() + self._ttl(config), "model": model, "config": config}
+        return SimpleNamespace(name=name, model=model)
+
+    async def update(self, name: str, config=None):
+        await self._client.delay()
+        if not self.valid(name):
+            raise api_error(404, "NOT_FOUND", f"{name} not found")
+        self.store[name]["expires_at"] = time.monotonic() + self._ttl(config)
+        return SimpleNamespace(name=name)
+
+    async def delete(self, name: str, config=None):
+        self.store.pop(name, None)
+
+
+class FakeGenaiClient:
+    """
+    google.genai.Client stand-in: canned replies, simulated latency, context
+    caches and fault injection. ``error_rate`` of requests fail with
+    ``error_code``, ``slow_rate`` of them take ``slow_latency`` seconds, and
+    ``fail_next`` lists status codes for the next requests to fail with, in order.
+    Requests to a model in ``unavailable_models`` always fail with a 503.
+    """
+
+    def __init__(
+        self,
+        reply: str = "Hello from the fake model.",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_code: int = 503,
+        slow_rate: float = 0.0,
+        slow_latency: float = 5.0,
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.fail_next: List[int] = []
+        self.unavailable_models = set()
+        self.requests: List[Dict] = []
+        self.aio = SimpleNamespace(models=FakeModels(self), caches=FakeCaches(self))
+
+    async def delay(self):
+        if self.slow_rate and random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_latency)
+        elif self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def request(self, model: str, contents, config):
+        cached = getattr(config, "cached_content", None)
+        self.requests.append({"model": model, "contents": contents, "cached_content": cached})
+        await self.delay()
+        if model in self.unavailable_models:
+            raise api_error(503, "UNAVAILABLE", f"{model} is overloaded")
+        if self.fail_next:
+            code = self.fail_next.pop(0)
+            raise api_error(code, "UNAVAILABLE" if code >= 500 else "RESOURCE_EXHAUSTED", "injected fault")
+        if self.error_rate and random.random() < self.error_rate:
+            raise api_error(self.error_code, "UNAVAILABLE", "injected fault")
+        if cached and not self.aio.caches.valid(cached):
+            raise api_error(404, "NOT_FOUND", f"{cached} not found")
@@ -0,0 +1,118 @@
+"""
+Quota load test: fires N concurrent /chat/message-style requests for a single
+user and checks that the reservation engine never lets usage overshoot the
+daily limit, including when some generations fail and refund their slot.
+
+Backends exercised:
+    legacy    read-then-increment (the old check_rate_limit flow), for contrast
+    memory    RateLimitMiddleware(in_memory=True)
+    redis     RateLimitMiddleware over fakeredis (or REDIS_URL if set)
+    firestore Firestore transaction (emulator if FIRESTORE_EMULATOR_HOST is set,
+              otherwise the in-memory fake)
+
+Usage (from backend/):
+    python scripts/load_test_quota.py --concurrency 100 --limit 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.middleware.rate_limiter import RateLimitMiddleware, QuotaReservation  # noqa: E402
+from app.services.firebase_service import UsageContention, firebase_service  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+
+USER_ID = "load-test-user"
+
+
+async def fake_generation(latency: float, failure_rate: float) -> bool:
+    await asyncio.sleep(random.uniform(0, latency))
+    return random.random() >= failure_rate
+
+
+async def legacy_request(limit: int, latency: float, failure_rate: float) -> bool:
+    user = await firebase_service.get_user(USER_ID)
+    if (user or {}).get("dailyUsage", 0) >= limit:
+        return False
+    if await fake_generation(latency, failure_rate):
+        await firebase_service.increment_usage(USER_ID)
+    return True
+
+
+async def reserved_request(limiter: RateLimitMiddleware, limit: int, latency: float, failure_rate: float) -> bool:
+    try:
+        allowed, current = await limiter.reserve(USER_ID, limit)
+    except UsageContention:
+        return False  # Refused for contention on the user's counter
+    if not allowed:
+        return False
+    reservation = QuotaReservation(limiter, USER_ID, taken=current is not None)
+    if await fake_generation(latency, failure_rate):
+        await reservation.commit()
+    else:
+        await reservation.release()
+    return True
+
+
+async def run(name: str, make_request, concurrency: int, limit: int) -> bool:
+    await firebase_service.db.collection("users").document(USER_ID).set({"dailyUsage": 0})
+
+    results = await asyncio.gather(*(make_request() for _ in range(concurrency)))
+    user = await firebase_service.get_user(USER_ID)
+    recorded = (user or {}).get("dailyUsage", 0)
+
+    ok = recorded <= limit
+    print(f"{name:<10} admitted={sum(results):>4} rejected={results.count(False):>4} "
+          f"recorded={recorded:>4} limit={limit:>4}  {'OK' if ok else 'OVERSHOOT'}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Max simulated generation time (seconds)")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="Fraction of generations that fail")
+    args = parser.parse_args()
+
+    emulator = bool(os.getenv("FIRESTORE_EMULATOR_HOST"))
+    if not emulator:
+        firebase_service._db = FakeFirestore(latency=0.005, jitter=0.004)
+        firebase_service._initialized = True
+
+    def request_with(limiter):
+        return lambda: reserved_request(limiter, args.limit, args.latency, args.failure_rate)
+
+    scenarios = [
+        ("legacy", lambda: legacy_request(args.limit, args.latency, args.failure_rate)),
+        ("memory", request_with(RateLimitMiddleware(in_memory=True))),
+    ]
+
+    redis_url = os.getenv("REDIS_URL")
+    try:
+        if redis_url:
+            scenarios.append(("redis", request_with(RateLimitMiddleware(redis_url=redis_url))))
+        else:
+            import fakeredis
+            scenarios.append(("redis", request_with(RateLimitMiddleware(redis_client=fakeredis.FakeAsyncRedis()))))
+    except ImportError:
+        print("fakeredis not installed and REDIS_URL not set; skipping redis")
+
+    scenarios.append(("firestore", request_with(RateLimitMiddleware())))
+
+    failures = []
+    for name, make_request in scenarios:
+        ok = await run(name, make_request, args.concurrency, args.limit)
+        if not ok and name != "legacy":
+            failures.append(name)
+
+    if failures:
+        sys.exit(f"Quota overshoot with: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+"""
+Daily usage reset for user documents still on the legacy schema.
+
+Users whose counters carry a usageDate reset lazily and are skipped; each run
+stamps the documents it resets, so the job becomes a no-op once the whole
+collection is migrated. Safe to re-run: an interrupted run resumes from its
+checkpoint in maintenance/usageReset.
+
+Usage (from backend/, e.g. from cron at 00:00 UTC):
+    python scripts/reset_daily_usage.py
+    python scripts/reset_daily_usage.py --chunk-size 400 --concurrency 8 --no-resume
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
+sys.path.insert(0, ROOT)
+
+from app.services.firebase_service import firebase_service  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=400, help="Writes per batch (max 500)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches committed in parallel")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore today's checkpoint and start over")
+    args = parser.parse_args()
+
+    count = await firebase_service.reset_daily_usage(
+        chunk_size=min(args.chunk_size, 500),
+        concurrency=args.concurrency,
+        resume=not args.no_resume,
+    )
+    print(f"Reset {count} legacy user documents")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())